@@ -1,236 +1,958 @@
+import hashlib
 import math
+import os
 import numpy as np
 import pandas as pd
 
-
-def generateData(path, probability={'all': [0.25, 0.5, 0.25]}, bandwidths_tv=[-2, 0, 1],
-                 bandwidths_prices=[0.8, 1, 1.2], bandwidths_substrate_prices=[0.9, 1, 1.1],
-                 bandwidths_investment=[0.9, 1, 1.1], bandwidths_yield=[-0.15, 0, 0.02],
-                 bandwidths_rd=[0.04, 0.05, 0.11], bandwidths_sga=[0.03, 0.04, 0.05],
-                 bandwidths_tax=[0.20, 0.25, 0.30], bandwidths_dpo=[35, 45, 55],
-                 bandwidths_dso=[35, 45, 55], bandwidths_dio=[20, 30, 40], max_width=1.85,
-                 max_height=1.55):
+# Version of the layout of the base data cache. Increase this whenever the fields stored by
+# `loadBaseData` change, so that stale cache files are parsed again.
+BASE_DATA_CACHE_VERSION = 1
+
+# Sheets of the workbook that are read by loadBaseData
+SHEETS = ['ProductSize', 'ProductFormat', 'Price', 'CostSubstrate', 'CostInvestment', 'Yield',
+          'CostParameters']
+
+# Base data that has already been loaded in this process, keyed by (path, mtime, size)
+_BASE_DATA = {}
+
+# Fields of the stacked scenario arrays that have the scenario as the first axis
+SCENARIO_FIELDS = ['Scenario', 'tv_selection', 'prices_selection', 'substrate_prices_selection',
+                   'investment_selection', 'yield_selection', 'R&D', 'SG&A', 'TaxRate', 'DPO',
+                   'DSO', 'DIO', 'New Diagonal (inches)', 'Height (m)', 'Width (m)',
+                   'ProductPrice', 'SubstrateCost', 'InvestmentCost', 'Yield', 'Depreciation']
+
+# Derived scenario fields with the fields of the base data and the scenario fields they depend on,
+# in the order in which they are computed by _deriveScenarios
+DERIVED_FIELDS = {
+    'New Diagonal (inches)': (['Size (inches)', 'Market'], ['tv_selection']),
+    'Height (m)': (['Angle', 'Border_H (in mm)', 'Exclusion (in mm)'], ['New Diagonal (inches)']),
+    'Width (m)': (['Angle', 'Border_V (in mm)', 'Exclusion (in mm)'], ['New Diagonal (inches)']),
+    'ProductPrice': (['Price', 'Size (inches)', 'Angle', 'Border_H (in mm)', 'Border_V (in mm)',
+                      'Exclusion (in mm)'], ['prices_selection', 'Height (m)', 'Width (m)']),
+    'SubstrateCost': (['CostSubstrate'], ['substrate_prices_selection']),
+    'InvestmentCost': (['CostInvestment'], ['investment_selection']),
+    'Yield': (['Yield', 'YieldMarkets', 'Market'], ['yield_selection']),
+    'Depreciation': (['DepreciationYears'], ['InvestmentCost']),
+}
+
+# Random selections with the field of the base data whose shape they have
+SELECTION_BASE_FIELDS = {'tv_selection': 'Size (inches)', 'prices_selection': 'Price',
+                         'substrate_prices_selection': 'CostSubstrate',
+                         'investment_selection': 'CostInvestment', 'yield_selection': 'Yield'}
+
+# Sampling designs of generateScenarios
+SAMPLING_DESIGNS = ['random', 'stratified', 'lhs', 'rqmc']
+
+
+def _fileHash(path):
+    """Computes the SHA-256 hash of the file at `path`."""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def _parseWorkbook(path):
     """
-    Imports the data and constructs a random instance
+    Parses the sheets of the workbook at `path` that are needed by `generateData` into arrays
 
     Parameters
     ----------
     path : str
         Path to the data
-    probability : dict
-        Dictionary of probabilities for each of the bandwidths. If not specified for all bandwidths,
-        this should include a key called 'all' that will be used for all bandwidths that are not
-        assigned a custom probability.
-    bandwidths_tv : list
-        List of bandwidths for the television diagonal size. Length must match that of `probability`
-    bandwidths_prices : list
-        List of bandwidths for the selling prices. Length must match that of `probability`
-    bandwidths_substrate_prices : list
-        List of bandwidths for the substrate purchase costs. Length must match that of `probability`
-    bandwidths_investment : list
-        List of bandwidths for the investment costs. Length must match that of `probability`
-    bandwidths_yield : list
-        List of bandwidths for the yields. Note, these are in percentage points added/subtracted
-        rather than multiplicative factors. Length must match that of `probability`
-    bandwidths_rd : list
-        List of bandwidths for the R&D costs. Length must match that of `probability`
-    bandwidths_sga : list
-        List of bandwidths for the SG&A costs. Length must match that of `probability`
-    bandwidths_tax : list
-        List of bandwidths for the tax rate. Length must match that of `probability`
-    bandwidths_dpo : list
-        List of bandwidths for the DPO. Length must match that of `probability`
-    bandwidths_dso : list
-        List of bandwidths for the DSO. Length must match that of `probability`
-    bandwidths_dio : list
-        List of bandwidths for the DIO. Length must match that of `probability`
-    max_width : float
-        Maximum width of the substrate
-    max_height: float
-        Maximum height of the substrate
 
     Returns
     -------
     dict
-        Dictionary of all needed values and randomized data
+        Dictionary of NumPy arrays, see `loadBaseData`
+    """
 
-    Yields
+    Data = pd.ExcelFile(path)
+    return _baseData({sheet: pd.read_excel(Data, sheet) for sheet in SHEETS})
+
+
+def _baseData(sheets):
+    """
+    Converts the sheets of a workbook into the base data
+
+    Parameters
+    ----------
+    sheets : dict
+        DataFrame per sheet in `SHEETS`, as read by `pd.read_excel`
+
+    Returns
     -------
-    KeyError
-        When the year for depreciation is not yet initialized, create it
+    dict
+        Dictionary of NumPy arrays, see `loadBaseData`
     """
 
-    results = {}
+    ProductSize = sheets["ProductSize"]
+    ProductFormat = sheets["ProductFormat"]
+
+    CostSubstrate = sheets["CostSubstrate"]
+    CostInvestment = sheets["CostInvestment"]
+    Yield = sheets["Yield"].drop(columns=["Blaco", "Blanco"])
+    Parameters = sheets["CostParameters"].set_index('Cost Type')
+
+    ProductMeta = ProductSize[['Size (inches)', 'Format', 'Market']]
+    Price = pd.merge(ProductMeta, sheets["Price"].drop(columns='Unit'),
+                     on=['Size (inches)', 'Format', 'Market'])
+    assert len(Price) == len(ProductMeta), "Every product should have exactly one row in Price"
+
+    base = {
+        'Size (inches)': ProductSize['Size (inches)'].to_numpy(dtype=float),
+        'Format': ProductSize['Format'].to_numpy(dtype=str),
+        'Market': ProductSize['Market'].to_numpy(dtype=str),
+        'Border_H (in mm)': ProductSize['Border_H (in mm)'].to_numpy(dtype=float),
+        'Border_V (in mm)': ProductSize['Border_V (in mm)'].to_numpy(dtype=float),
+        'Exclusion (in mm)': ProductSize['Exclusion (in mm)'].to_numpy(dtype=float),
+        'Angle': np.array([math.atan(ProductFormat.loc[0, formt] / ProductFormat.loc[1, formt])
+                           for formt in ProductSize['Format']]),
+        'Price': Price.iloc[:, 3:].to_numpy(dtype=float),
+        'Years': np.array(Price.columns[3:], dtype=int),
+        'CostSubstrate': CostSubstrate.iloc[0, 3:].to_numpy(dtype=float),
+        'SubstrateYears': np.array(CostSubstrate.columns[3:], dtype=int),
+        'CostInvestment': CostInvestment.iloc[0, 3:].to_numpy(dtype=float),
+        'InvestmentYears': np.array(CostInvestment.columns[3:], dtype=int),
+        'Yield': Yield.iloc[:, 1:].to_numpy(dtype=float),
+        'YieldMarkets': Yield['Yieldpermarket'].to_numpy(dtype=str),
+        'YieldYears': np.array(Yield.columns[1:], dtype=int),
+        'MaxCapacity': np.float64(Parameters.loc['Max capacity', 'Cost']),
+        'WACC': np.float64(Parameters.loc['WACC', 'Cost']),
+        'DepreciationYears': np.int64(Parameters.loc['Depreciation years', 'Cost']),
+    }
+
+    return base
+
+
+def loadBaseData(path, use_cache=True):
+    """
+    Loads the deterministic base data of the workbook at `path` as typed in-memory arrays
 
-    Data = pd.ExcelFile(path)
-    ProductSize = pd.read_excel(Data, "ProductSize")
-    ProductFormat = pd.read_excel(Data, "ProductFormat")
+    The workbook is only parsed once. The parsed arrays are kept in memory for the rest of the
+    process and are persisted next to the workbook (`<path>.cache.npz`) together with the SHA-256
+    hash and modification time of the workbook, so that later runs can skip parsing as long as the
+    workbook does not change.
 
-    CostSubstrate = pd.read_excel(Data, "CostSubstrate")
-    CostInvestment = pd.read_excel(Data, "CostInvestment")
-    Yield = pd.read_excel(Data, "Yield")
-    Parameters = pd.read_excel(Data, "CostParameters").set_index('Cost Type')
+    Parameters
+    ----------
+    path : str or dict
+        Path to the data. Base data that is already in memory, e.g. from
+        `SyntheticData.syntheticBaseData`, is returned as it is, so every function that takes the
+        path to the data also takes base data.
+    use_cache : bool
+        Whether to read and write the cache file next to the workbook. If False, the workbook is
+        always parsed (the in-memory cache is still used).
 
-    num_products = len(ProductSize)
-    ProductMeta = ProductSize[['Size (inches)', 'Format', 'Market']].copy()
+    Returns
+    -------
+    dict
+        Dictionary of read-only NumPy arrays. Per product: 'Size (inches)', 'Format', 'Market',
+        'Border_H (in mm)', 'Border_V (in mm)', 'Exclusion (in mm)' and 'Angle' (of the diagonal
+        with the height, in radians). Per product per year: 'Price'. Per year: 'CostSubstrate' and
+        'CostInvestment' (in million USD). Per market per year: 'Yield' with the markets in
+        'YieldMarkets'. The years of the columns are in 'Years', 'SubstrateYears',
+        'InvestmentYears' and 'YieldYears'. Finally, the scalars 'MaxCapacity', 'WACC' and
+        'DepreciationYears'.
+    """
 
-    # ProductInches including the uncertainty for TV screen size
-    ProductInches = ProductMeta.copy()
+    if isinstance(path, dict):
+        return path
+
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if key in _BASE_DATA:
+        return _BASE_DATA[key]
+
+    cache_path = f"{path}.cache.npz"
+    base = None
+    sha256 = _fileHash(path)
+
+    if use_cache and os.path.isfile(cache_path):
+        try:
+            with np.load(cache_path, allow_pickle=False) as cached:
+                if (int(cached['_version']) == BASE_DATA_CACHE_VERSION and
+                        str(cached['_sha256']) == sha256):
+                    base = {field: cached[field] for field in cached.files
+                            if not field.startswith('_')}
+                    base = {field: value[()] if value.ndim == 0 else value
+                            for field, value in base.items()}
+        except (OSError, KeyError, ValueError):
+            # Unreadable or incomplete cache file, it is rewritten below
+            base = None
+
+    if base is None:
+        base = _parseWorkbook(path)
+
+        if use_cache:
+            try:
+                # Write to a temporary file first such that concurrent runs never read a partially
+                # written cache
+                temporary_path = f"{cache_path}.{os.getpid()}.tmp.npz"
+                np.savez(temporary_path, _version=BASE_DATA_CACHE_VERSION, _sha256=sha256,
+                         _mtime=stat.st_mtime_ns, **base)
+                os.replace(temporary_path, cache_path)
+            except OSError:
+                pass  # The cache is an optimisation only, e.g. the data folder is read-only
+
+    for value in base.values():
+        if isinstance(value, np.ndarray):
+            value.setflags(write=False)
+
+    _BASE_DATA[key] = base
+    return base
 
+
+def _selectionProbability(probability, key):
+    """Returns the probabilities of the bandwidths of `key`, falling back on those of 'all'."""
     try:
-        tv_selection = np.random.choice(bandwidths_tv, num_products, p=probability['tv'])
+        return probability[key]
     except KeyError:
-        tv_selection = np.random.choice(bandwidths_tv, num_products, p=probability['all'])
-
-    # (ProductInches['Market'] == 'Television') is a boolean indicator for whether the product
-    # is a television. If multiplied, True is treated as 1 and False is treated as 0. As such,
-    # we only add the outcomes of the random selection to the televisions
-    ProductInches['New Diagonal (inches)'] = ProductInches['Size (inches)'] + \
-        tv_selection * (ProductInches['Market'] == 'Television')
-
-    ProductInches['Angle'] = [math.atan(ProductFormat.loc[0, formt] / ProductFormat.loc[1, formt])
-                              for formt in ProductInches['Format']]
-    ProductInches['Height (m)'] = np.cos(ProductInches['Angle']) * \
-        ProductInches['New Diagonal (inches)'] * 0.0254 + 2*ProductSize['Border_H (in mm)']/1000 + \
-        2*ProductSize['Exclusion (in mm)']/1000
-    ProductInches['Width (m)'] = np.sin(ProductInches['Angle']) * \
-        ProductInches['New Diagonal (inches)'] * 0.0254 + 2*ProductSize['Border_V (in mm)']/1000 + \
-        2*ProductSize['Exclusion (in mm)']/1000
-
-    results["tv_selection"] = tv_selection
-    results["ProductSize"] = ProductInches
+        return probability['all']
 
-    # Compute area change to update prices
-    original_height = np.cos(ProductInches['Angle']) * \
-        ProductInches['Size (inches)'] * 0.0254 + 2*ProductSize['Border_H (in mm)']/1000 + \
-        2*ProductSize['Exclusion (in mm)']/1000
-    original_width = np.sin(ProductInches['Angle']) * \
-        ProductInches['Size (inches)'] * 0.0254 + 2*ProductSize['Border_V (in mm)']/1000 + \
-        2*ProductSize['Exclusion (in mm)']/1000
 
-    original_area = original_height * original_width
-    new_area = ProductInches['Height (m)'] * ProductInches['Width (m)']
-    area_change = new_area/original_area
+def _deriveScenarios(base, scenarios, fields=DERIVED_FIELDS):
+    """
+    Computes the randomized data of a set of scenarios from the random selections
 
-    # Prices per product over time including the uncertainty
-    Price = pd.merge(ProductMeta.copy(), pd.read_excel(Data, "Price").drop(
-        columns='Unit'), on=['Size (inches)', 'Format', 'Market'])
+    Parameters
+    ----------
+    base : dict
+        Base data as returned by `loadBaseData`
+    scenarios : dict
+        Dictionary of stacked scenario arrays containing at least the selections 'tv_selection',
+        'prices_selection', 'substrate_prices_selection', 'investment_selection' and
+        'yield_selection'. The derived arrays are added to this dictionary in place.
+    fields : collection
+        Derived fields to compute, see `DERIVED_FIELDS`. The derived fields they depend on but that
+        are not computed should already be in `scenarios`.
+    """
 
-    try:
-        prices_selection = np.random.choice(bandwidths_prices, Price.iloc[:, 3:].shape,
-                                            p=probability['prices'])
-    except KeyError:
-        prices_selection = np.random.choice(bandwidths_prices, Price.iloc[:, 3:].shape,
-                                            p=probability['all'])
+    if 'New Diagonal (inches)' in fields:
+        # is_television is a boolean indicator for whether the product is a television. If
+        # multiplied, True is treated as 1 and False is treated as 0. As such, we only add the
+        # outcomes of the random selection to the televisions
+        is_television = base['Market'] == 'Television'
+        scenarios['New Diagonal (inches)'] = \
+            base['Size (inches)'] + scenarios['tv_selection'] * is_television
+
+    if 'Height (m)' in fields:
+        scenarios['Height (m)'] = \
+            np.cos(base['Angle']) * scenarios['New Diagonal (inches)'] * 0.0254 + \
+            2*base['Border_H (in mm)']/1000 + 2*base['Exclusion (in mm)']/1000
+    if 'Width (m)' in fields:
+        scenarios['Width (m)'] = \
+            np.sin(base['Angle']) * scenarios['New Diagonal (inches)'] * 0.0254 + \
+            2*base['Border_V (in mm)']/1000 + 2*base['Exclusion (in mm)']/1000
+
+    if 'ProductPrice' in fields:
+        # Compute area change to update prices
+        original_height = np.cos(base['Angle']) * base['Size (inches)'] * 0.0254 + \
+            2*base['Border_H (in mm)']/1000 + 2*base['Exclusion (in mm)']/1000
+        original_width = np.sin(base['Angle']) * base['Size (inches)'] * 0.0254 + \
+            2*base['Border_V (in mm)']/1000 + 2*base['Exclusion (in mm)']/1000
+
+        original_area = original_height * original_width
+        new_area = scenarios['Height (m)'] * scenarios['Width (m)']
+        area_change = new_area/original_area
+
+        # Prices per product over time including the uncertainty
+        scenarios['ProductPrice'] = (base['Price'] * scenarios['prices_selection']) * \
+            area_change[..., np.newaxis]
+
+    # Cost substrate per m^2 and investment costs over time including the uncertainty
+    if 'SubstrateCost' in fields:
+        scenarios['SubstrateCost'] = np.nan_to_num(
+            base['CostSubstrate'] * scenarios['substrate_prices_selection'], nan=0)
+    if 'InvestmentCost' in fields:
+        scenarios['InvestmentCost'] = np.nan_to_num(
+            1e6 * base['CostInvestment'] * scenarios['investment_selection'], nan=0)
+
+    if 'Yield' in fields:
+        # Yield per market over time including the uncertainty, mapped to the products. Products
+        # of a market without yields get a yield of zero.
+        market_yield = np.nan_to_num(base['Yield'] + scenarios['yield_selection'], nan=0)
+        market_yield = np.concatenate([market_yield, np.zeros_like(market_yield[..., :1, :])],
+                                      axis=-2)
+        markets = list(base['YieldMarkets'])
+        market_index = [markets.index(market) if market in markets else len(markets)
+                        for market in base['Market']]
+        scenarios['Yield'] = market_yield[..., market_index, :]
+
+    if 'Depreciation' in fields:
+        # Depreciation over time, the investment of each year is depreciated linearly over the
+        # depreciation period starting in that same year
+        InvestmentCost = scenarios['InvestmentCost']
+        depreciation_period = int(base['DepreciationYears'])
+        Depreciation = np.zeros(InvestmentCost.shape[:-1] +
+                                (InvestmentCost.shape[-1] + depreciation_period - 1,))
+
+        for i in range(InvestmentCost.shape[-1]):
+            Depreciation[..., i:i+depreciation_period] += \
+                InvestmentCost[..., i, np.newaxis] / depreciation_period
+
+        scenarios['Depreciation'] = Depreciation
+
+
+def changedBaseFields(previous, base):
+    """
+    Returns the fields of the base data that differ between two versions of the workbook
 
-    Price = pd.concat([Price.iloc[:, :2],
-                       (Price.iloc[:, 3:] * prices_selection).multiply(area_change, axis="index")],
-                      axis=1)
+    Parameters
+    ----------
+    previous : dict
+        Base data of the previous version of the workbook, see `loadBaseData`
+    base : dict
+        Base data of the current version of the workbook
 
-    results["prices_selection"] = prices_selection
-    results["ProductPrice"] = Price
+    Returns
+    -------
+    list
+        Fields of the base data that were added, removed or changed
+    """
 
-    # Cost substrate per m^2 over time including the uncertainty
-    try:
-        substrate_prices_selection = np.random.choice(bandwidths_substrate_prices,
-                                                      len(CostSubstrate.columns[3:]),
-                                                      p=probability['substrate_prices'])
-    except KeyError:
-        substrate_prices_selection = np.random.choice(bandwidths_substrate_prices,
-                                                      len(CostSubstrate.columns[3:]),
-                                                      p=probability['all'])
+    changed = []
+    for field in set(previous) | set(base):
+        if field not in previous or field not in base:
+            changed.append(field)
+            continue
 
-    CostSubstrate = CostSubstrate.iloc[:, 3:] * substrate_prices_selection
-    CostSubstrate = CostSubstrate.fillna(0)
+        old, new = np.asarray(previous[field]), np.asarray(base[field])
+        if old.shape != new.shape or old.dtype.kind != new.dtype.kind:
+            changed.append(field)
+        elif not np.array_equal(old, new, equal_nan=old.dtype.kind == 'f'):
+            changed.append(field)
 
-    results["substrate_prices_selection"] = substrate_prices_selection
-    results["SubstrateCost"] = CostSubstrate
+    return sorted(changed)
 
-    # Investment costs over time including the uncertainty
-    try:
-        investment_selection = np.random.choice(bandwidths_investment,
-                                                len(CostInvestment.columns[3:]),
-                                                p=probability['investment'])
-    except KeyError:
-        investment_selection = np.random.choice(bandwidths_investment,
-                                                len(CostInvestment.columns[3:]),
-                                                p=probability['all'])
 
-    CostInvestment = 1e6 * CostInvestment.iloc[:, 3:] * investment_selection
-    CostInvestment = CostInvestment.fillna(0)
+def dependentFields(base_fields):
+    """
+    Returns the derived scenario fields that depend on the given fields of the base data
 
-    results["investment_selection"] = investment_selection
-    results["InvestmentCost"] = CostInvestment
+    Parameters
+    ----------
+    base_fields : collection
+        Fields of the base data, e.g. as returned by `changedBaseFields`
 
-    # Yield per market over time including the uncertainty
-    Yield = Yield.drop(columns=["Blaco", "Blanco"]).copy()
+    Returns
+    -------
+    list
+        Derived fields that have to be recomputed, in the order of `DERIVED_FIELDS`
+    """
 
-    try:
-        yield_selection = np.random.choice(bandwidths_yield, (Yield.shape[0], Yield.shape[1]-1),
-                                           p=probability['yield'])
-    except KeyError:
-        yield_selection = np.random.choice(bandwidths_yield, (Yield.shape[0], Yield.shape[1]-1),
-                                           p=probability['all'])
+    fields = []
+    for field, (base_dependencies, scenario_dependencies) in DERIVED_FIELDS.items():
+        if (set(base_dependencies) & set(base_fields) or
+                set(scenario_dependencies) & set(fields)):
+            fields.append(field)
 
-    Yield = pd.concat([Yield['Yieldpermarket'], Yield.iloc[:, 1:] + yield_selection], axis=1)
-    Yield = pd.merge(ProductMeta, Yield, left_on='Market', right_on='Yieldpermarket', how='left')
-    Yield = Yield.fillna(0)
+    return fields
 
-    results["yield_selection"] = yield_selection
-    results["Yield"] = Yield
 
-    # Depreciation over time
-    Depreciation = {}
-    depreciation_period = int(Parameters.loc['Depreciation years', 'Cost'])
+def updateScenarios(scenarios, base, previous=None):
+    """
+    Recomputes the derived fields of stacked scenario arrays for new base data
 
-    for i in range(CostInvestment.shape[1]):
-        investment = CostInvestment.iloc[:, i] / depreciation_period
-        for j in range(depreciation_period):
-            year = investment.name + j
-            try:
-                Depreciation[year] = Depreciation[year] + investment[0]
-            except KeyError:
-                Depreciation[year] = investment[0]
+    The random selections are kept, so every scenario has the same draws before and after the
+    update. Only the derived fields that depend on the changed parts of the base data are
+    recomputed; e.g. new prices only recompute 'ProductPrice', and new investment costs only
+    'InvestmentCost' and 'Depreciation'.
 
-    Depreciation = pd.DataFrame(Depreciation, index=[0])
+    Parameters
+    ----------
+    scenarios : dict or Mapping
+        Stacked scenario arrays, see `generateScenarios`
+    base : dict
+        Base data of the current version of the workbook, see `loadBaseData`
+    previous : dict
+        Base data from which `scenarios` were derived. If None, all derived fields are recomputed.
 
-    results["Depreciation"] = Depreciation
+    Returns
+    -------
+    tuple
+        The updated stacked scenario arrays (a new dictionary, `scenarios` is not modified) and the
+        list of derived fields that were recomputed
+    """
 
-    # Create final random choices
-    try:
-        results["R&D"] = np.random.choice(bandwidths_rd, 1, p=probability['R&D']).item()
-    except KeyError:
-        results["R&D"] = np.random.choice(bandwidths_rd, 1, p=probability['all']).item()
+    fields = list(DERIVED_FIELDS) if previous is None else \
+        dependentFields(changedBaseFields(previous, base))
 
-    try:
-        results["SG&A"] = np.random.choice(bandwidths_sga, 1, p=probability['SG&A']).item()
-    except KeyError:
-        results["SG&A"] = np.random.choice(bandwidths_sga, 1, p=probability['all']).item()
+    for selection, field in SELECTION_BASE_FIELDS.items():
+        if np.shape(scenarios[selection])[1:] != np.shape(base[field]):
+            raise ValueError(f"The shape of '{field}' in the data changed, so the drawn "
+                             f"'{selection}' no longer apply; regenerate the scenarios instead")
 
-    try:
-        results["TaxRate"] = np.random.choice(bandwidths_tax, 1, p=probability['TaxRate']).item()
-    except KeyError:
-        results["TaxRate"] = np.random.choice(bandwidths_tax, 1, p=probability['all']).item()
+    updated = {field: value for field, value in scenarios.items() if field in SCENARIO_FIELDS}
+    _deriveScenarios(base, updated, fields)
+    updated.update(_baseConstants(base))
+    for field in ['Max_width', 'Max_height']:
+        updated[field] = scenarios[field]
 
-    try:
-        results["DPO"] = np.random.choice(bandwidths_dpo, 1, p=probability['DPO']).item()
-    except KeyError:
-        results["DPO"] = np.random.choice(bandwidths_dpo, 1, p=probability['all']).item()
+    return updated, fields
 
-    try:
-        results["DSO"] = np.random.choice(bandwidths_dso, 1, p=probability['DSO']).item()
-    except KeyError:
-        results["DSO"] = np.random.choice(bandwidths_dso, 1, p=probability['all']).item()
 
-    try:
-        results["DIO"] = np.random.choice(bandwidths_dio, 1, p=probability['DIO']).item()
-    except KeyError:
-        results["DIO"] = np.random.choice(bandwidths_dio, 1, p=probability['all']).item()
+def _baseConstants(base):
+    """Returns the fields of the base data that the stacked scenario arrays contain as they are."""
+    return {field: base[field] for field in
+            ['Size (inches)', 'Format', 'Market', 'Angle', 'Years', 'SubstrateYears',
+             'InvestmentYears', 'YieldYears', 'YieldMarkets', 'MaxCapacity', 'WACC']}
+
+
+def _selectBandwidths(bandwidths, p, uniforms):
+    """
+    Maps uniform draws on [0, 1) to bandwidths with probabilities `p`
+
+    This is the inverse transform used by `np.random.choice`, such that the same uniforms give the
+    same selections.
+    """
+
+    bandwidths = np.asarray(bandwidths)
+    p = np.asarray(p, dtype=float)
+
+    if p.shape != bandwidths.shape:
+        raise ValueError("The bandwidths and their probabilities must have the same length")
+    if np.any(p < 0) or not np.isclose(p.sum(), 1):
+        raise ValueError("The probabilities of the bandwidths must be non-negative and sum to 1")
+
+    cdf = p.cumsum()
+    cdf /= cdf[-1]
+    return bandwidths[cdf.searchsorted(uniforms, side='right')]
+
+
+def scenarioSeedSequence(seed, k):
+    """
+    Returns the seed sequence of the random stream of scenario `k`
+
+    This is the `k`-th child of `seed`, i.e. it equals `np.random.SeedSequence(seed).spawn(k+1)[k]`,
+    but it can be constructed for any `k` without spawning the preceding children.
+
+    Parameters
+    ----------
+    seed : int or np.random.SeedSequence
+        Root seed of the scenario set
+    k : int
+        Index of the scenario
+
+    Returns
+    -------
+    np.random.SeedSequence
+    """
+
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+
+    return np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (int(k),),
+                                  pool_size=seed.pool_size)
+
+
+def _designUniforms(n, dimensions, sampling, seed):
+    """
+    Draws a sampling design of `n` points on the unit hypercube of `dimensions` dimensions
+
+    Parameters
+    ----------
+    n : int
+        Number of points, i.e. scenarios
+    dimensions : int
+        Number of dimensions, i.e. uniforms per scenario
+    sampling : str
+        'stratified' for a Latin hypercube with the points in the middle of the strata, 'lhs' for
+        a Latin hypercube with the points uniformly distributed within the strata and 'rqmc' for a
+        scrambled Sobol' sequence
+    seed : None, int, np.random.SeedSequence or np.random.Generator
+        Seed of the randomization of the design. If None, it is drawn from the global NumPy random
+        state.
+
+    Returns
+    -------
+    np.ndarray
+        Array of shape (n, dimensions)
+    """
+
+    if seed is None:
+        seed = np.random.randint(0, 2**32, size=4, dtype=np.uint64)
+    rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+
+    if sampling == 'rqmc':
+        import warnings
+        from scipy.stats import qmc
+
+        with warnings.catch_warnings():
+            # The balance properties of Sobol' points are best if n is a power of 2, but any n is
+            # valid
+            warnings.simplefilter('ignore', UserWarning)
+            return qmc.Sobol(dimensions, scramble=True, seed=rng).random(n)
+
+    # Every dimension is split into n strata of equal probability, and every stratum is used by
+    # exactly one scenario
+    strata = rng.permuted(np.repeat(np.arange(n)[:, np.newaxis], dimensions, axis=1), axis=0)
+    offset = 0.5 if sampling == 'stratified' else rng.random((n, dimensions))
+
+    return (strata + offset)/n
+
+
+def _drawUniforms(sizes, indices, seed, sampling='random'):
+    """
+    Draws the uniforms underlying the random selections of the scenarios `indices`
+
+    Parameters
+    ----------
+    sizes : list
+        List of (name, shape) with the shape of the draws of a single scenario per uncertain input
+    indices : np.ndarray
+        Indices of the scenarios
+    seed : None, int, np.random.SeedSequence or np.random.Generator
+        If None, the global NumPy random state is used and if a Generator, that generator is used.
+        In both cases the draws are made per uncertain input for all scenarios at once. Otherwise,
+        every scenario draws from its own child stream of `seed`, see `scenarioSeedSequence`.
+    sampling : str
+        Sampling design, see `generateScenarios`. For any design other than 'random', the uniforms
+        of all scenarios are drawn jointly from `seed`.
+
+    Returns
+    -------
+    dict
+        Dictionary of uniforms of shape (len(indices),) + shape per uncertain input
+    """
+
+    n = len(indices)
+    counts = [int(np.prod(shape)) for _, shape in sizes]
+
+    if sampling != 'random':
+        block = _designUniforms(n, sum(counts), sampling, seed)
+    elif seed is None or isinstance(seed, np.random.Generator):
+        random = np.random.random_sample if seed is None else seed.random
+        return {name: random((n,) + shape) for name, shape in sizes}
+    else:
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+
+        # Every scenario draws all of its uniforms in one block from its own stream
+        block = np.empty((n, sum(counts)))
+
+        for i, k in enumerate(indices):
+            block[i] = np.random.default_rng(scenarioSeedSequence(seed, k)).random(block.shape[1])
+
+    uniforms = {}
+    offsets = np.cumsum([0] + counts)
+    for (name, shape), start, stop in zip(sizes, offsets[:-1], offsets[1:]):
+        uniforms[name] = block[:, start:stop].reshape((n,) + shape)
+
+    return uniforms
+
+
+def concatenateScenarios(parts):
+    """
+    Concatenates stacked scenario arrays along the scenario axis
+
+    Parameters
+    ----------
+    parts : list
+        List of dictionaries of stacked scenario arrays from the same workbook, e.g. as returned
+        by `generateScenarios`
+
+    Returns
+    -------
+    dict
+        Dictionary of stacked scenario arrays with the scenarios of all parts, in order
+    """
+
+    scenarios = dict(parts[0])
+
+    for field in SCENARIO_FIELDS:
+        if field in scenarios:
+            scenarios[field] = np.concatenate([part[field] for part in parts])
+
+    return scenarios
+
+
+def generateScenarios(path, n, probability={'all': [0.25, 0.5, 0.25]}, bandwidths_tv=[-2, 0, 1],
+                      bandwidths_prices=[0.8, 1, 1.2], bandwidths_substrate_prices=[0.9, 1, 1.1],
+                      bandwidths_investment=[0.9, 1, 1.1], bandwidths_yield=[-0.15, 0, 0.02],
+                      bandwidths_rd=[0.04, 0.05, 0.11], bandwidths_sga=[0.03, 0.04, 0.05],
+                      bandwidths_tax=[0.20, 0.25, 0.30], bandwidths_dpo=[35, 45, 55],
+                      bandwidths_dso=[35, 45, 55], bandwidths_dio=[20, 30, 40], max_width=1.85,
+                      max_height=1.55, seed=None, workers=None, sampling='random'):
+    """
+    Constructs `n` random instances at once as stacked arrays
+
+    The bandwidths and probabilities have the same meaning as in `generateData`, and every
+    scenario follows the same distribution as a single call to `generateData`. All selections are
+    made in one vectorized step per uncertain input rather than one call per scenario.
+
+    If a `seed` is given, scenario k draws from its own independent child stream of the seed (see
+    `scenarioSeedSequence`). Scenario k is then identical whether it is generated in a set of any
+    size, alone, or in a process pool, so any subset of a scenario set can be regenerated on
+    demand by passing its indices as `n`.
+
+    Instead of drawing every scenario independently, the scenarios can be drawn jointly from a
+    sampling design with `sampling`. Every uncertain input is then split into `n` strata of equal
+    probability that are each used by one scenario, so that the bandwidths are selected in
+    (almost) exactly the proportions of their probabilities. This reduces the variance of averages
+    over the scenarios, such as the Average NPV (see `SamplingFunction.compareSampling`). The
+    scenarios of a design depend on each other, so they are only reproducible as a whole.
+
+    Parameters
+    ----------
+    path : str or dict
+        Path to the data, or base data that is already in memory (see `loadBaseData`)
+    n : int or array-like
+        Number of scenarios, in which case scenarios 0, ..., n-1 are generated, or the indices of
+        the scenarios to generate (which is only meaningful if a `seed` is given)
+    probability, bandwidths_*, max_width, max_height
+        See `generateData`
+    seed : None, int, np.random.SeedSequence or np.random.Generator
+        Root seed of the scenario set. If None (default), the global NumPy random state is used.
+        If a Generator, the draws are taken from that generator (no per-scenario streams).
+    workers : int
+        Number of processes to generate the scenarios in. Only used if a `seed` is given, as
+        otherwise the scenarios would depend on the process that generated them. By default, the
+        scenarios are generated in this process.
+    sampling : str
+        'random' (default) to draw the scenarios independently. 'stratified' for a Latin
+        hypercube design with the midpoints of the strata, 'lhs' for a Latin hypercube design with
+        random points within the strata, and 'rqmc' for a randomized quasi-Monte Carlo design (a
+        scrambled Sobol' sequence, which requires SciPy and is best with a power of 2 scenarios).
+
+    Returns
+    -------
+    dict
+        Dictionary of stacked arrays where the first axis is the scenario. Per scenario per
+        product per year: 'ProductPrice', 'Yield' and 'prices_selection'. Per scenario per year:
+        'SubstrateCost' (per m^2), 'InvestmentCost', 'substrate_prices_selection' and
+        'investment_selection'. 'Depreciation' is per scenario per year as well, but runs until the
+        last investment is depreciated. Per scenario per market per year: 'yield_selection'. Per
+        scenario per product: 'Width (m)', 'Height (m)', 'New Diagonal (inches)' and
+        'tv_selection'. Per scenario: 'R&D', 'SG&A', 'TaxRate', 'DPO', 'DSO', 'DIO' and the index
+        of the scenario 'Scenario'. The dictionary also contains the product data
+        'Size (inches)', 'Format', 'Market' and 'Angle', the years 'Years', 'SubstrateYears',
+        'InvestmentYears' and 'YieldYears', the markets 'YieldMarkets' and the scalars
+        'MaxCapacity', 'WACC', 'Max_width' and 'Max_height'.
+    """
+
+    if sampling not in SAMPLING_DESIGNS:
+        raise ValueError(f"sampling should be one of {SAMPLING_DESIGNS}")
+
+    indices = np.arange(n) if np.ndim(n) == 0 else np.asarray(n, dtype=np.int64)
+    seeded = seed is not None and not isinstance(seed, np.random.Generator)
+
+    if (seeded and sampling == 'random' and workers is not None and workers > 1 and
+            len(indices) > 1):
+        from concurrent.futures import ProcessPoolExecutor
+        from functools import partial
+
+        generate = partial(generateScenarios, path, probability=probability,
+                           bandwidths_tv=bandwidths_tv, bandwidths_prices=bandwidths_prices,
+                           bandwidths_substrate_prices=bandwidths_substrate_prices,
+                           bandwidths_investment=bandwidths_investment,
+                           bandwidths_yield=bandwidths_yield, bandwidths_rd=bandwidths_rd,
+                           bandwidths_sga=bandwidths_sga, bandwidths_tax=bandwidths_tax,
+                           bandwidths_dpo=bandwidths_dpo, bandwidths_dso=bandwidths_dso,
+                           bandwidths_dio=bandwidths_dio, max_width=max_width,
+                           max_height=max_height, seed=seed)
+
+        with ProcessPoolExecutor(workers) as executor:
+            return concatenateScenarios(list(executor.map(
+                generate, np.array_split(indices, min(workers, len(indices))))))
+
+    base = loadBaseData(path)
+    num_products = len(base['Size (inches)'])
+
+    scenarios = _baseConstants(base)
+    scenarios['Scenario'] = indices
+
+    # The draws are made in the same order as in generateData, such that a single scenario is
+    # identical to the result of generateData for the same seed
+    selections = [('tv_selection', 'tv', bandwidths_tv, (num_products,)),
+                  ('prices_selection', 'prices', bandwidths_prices, base['Price'].shape),
+                  ('substrate_prices_selection', 'substrate_prices', bandwidths_substrate_prices,
+                   base['CostSubstrate'].shape),
+                  ('investment_selection', 'investment', bandwidths_investment,
+                   base['CostInvestment'].shape),
+                  ('yield_selection', 'yield', bandwidths_yield, base['Yield'].shape),
+                  ('R&D', 'R&D', bandwidths_rd, ()),
+                  ('SG&A', 'SG&A', bandwidths_sga, ()),
+                  ('TaxRate', 'TaxRate', bandwidths_tax, ()),
+                  ('DPO', 'DPO', bandwidths_dpo, ()),
+                  ('DSO', 'DSO', bandwidths_dso, ()),
+                  ('DIO', 'DIO', bandwidths_dio, ())]
+
+    uniforms = _drawUniforms([(name, shape) for name, _, _, shape in selections], indices, seed,
+                             sampling)
+
+    for name, key, bandwidths, _ in selections:
+        scenarios[name] = _selectBandwidths(bandwidths, _selectionProbability(probability, key),
+                                            uniforms[name])
+
+    _deriveScenarios(base, scenarios)
 
     # Final necessary data
-    results["MaxCapacity"] = Parameters.loc['Max capacity', 'Cost']
-    results["WACC"] = Parameters.loc['WACC', 'Cost']
-    results["Max_width"] = max_width
-    results["Max_height"] = max_height
+    scenarios["Max_width"] = max_width
+    scenarios["Max_height"] = max_height
+
+    return scenarios
+
+
+def scenarioData(scenarios, k):
+    """
+    Extracts a single scenario from stacked scenario arrays in the format of `generateData`
+
+    Parameters
+    ----------
+    scenarios : dict
+        Stacked scenario arrays as returned by `generateScenarios`
+    k : int
+        Index of the scenario
+
+    Returns
+    -------
+    dict
+        Dictionary of all needed values and randomized data, see `generateData`
+    """
+
+    results = {}
+    ProductMeta = pd.DataFrame({'Size (inches)': scenarios['Size (inches)'],
+                                'Format': scenarios['Format'], 'Market': scenarios['Market']})
+
+    ProductInches = ProductMeta.copy()
+    ProductInches['New Diagonal (inches)'] = scenarios['New Diagonal (inches)'][k]
+    ProductInches['Angle'] = scenarios['Angle']
+    ProductInches['Height (m)'] = scenarios['Height (m)'][k]
+    ProductInches['Width (m)'] = scenarios['Width (m)'][k]
+
+    results["tv_selection"] = np.array(scenarios['tv_selection'][k])
+    results["ProductSize"] = ProductInches
+
+    Price = ProductMeta[['Size (inches)', 'Format']].copy()
+    Price[list(scenarios['Years'])] = scenarios['ProductPrice'][k]
+
+    results["prices_selection"] = np.array(scenarios['prices_selection'][k])
+    results["ProductPrice"] = Price
+
+    results["substrate_prices_selection"] = np.array(scenarios['substrate_prices_selection'][k])
+    results["SubstrateCost"] = pd.DataFrame(
+        [scenarios['SubstrateCost'][k]], columns=pd.Index(scenarios['SubstrateYears'],
+                                                          dtype=object))
+
+    results["investment_selection"] = np.array(scenarios['investment_selection'][k])
+    results["InvestmentCost"] = pd.DataFrame(
+        [scenarios['InvestmentCost'][k]], columns=pd.Index(scenarios['InvestmentYears'],
+                                                           dtype=object))
+
+    markets = list(scenarios['YieldMarkets'])
+    Yield = ProductMeta.copy()
+    Yield['Yieldpermarket'] = [market if market in markets else 0
+                               for market in scenarios['Market']]
+    Yield[list(scenarios['YieldYears'])] = scenarios['Yield'][k]
+
+    results["yield_selection"] = np.array(scenarios['yield_selection'][k])
+    results["Yield"] = Yield
+
+    first_year = scenarios['InvestmentYears'][0]
+    results["Depreciation"] = pd.DataFrame(
+        [scenarios['Depreciation'][k]],
+        columns=pd.RangeIndex(first_year, first_year + scenarios['Depreciation'].shape[-1]))
+
+    for key in ['R&D', 'SG&A', 'TaxRate', 'DPO', 'DSO', 'DIO']:
+        results[key] = scenarios[key][k].item()
+
+    for key in ['MaxCapacity', 'WACC', 'Max_width', 'Max_height']:
+        results[key] = scenarios[key]
 
     return results
+
+
+def stackScenarioData(Data):
+    """
+    Stacks scenarios in the format of `generateData` into stacked scenario arrays
+
+    This is the inverse of `scenarioData`.
+
+    Parameters
+    ----------
+    Data : dict
+        Dictionary of scenarios as returned by `generateData`, keyed by the scenario index
+
+    Returns
+    -------
+    dict
+        Dictionary of stacked scenario arrays, see `generateScenarios`. The markets of the yields
+        'YieldMarkets' are not part of the scenarios and are therefore missing.
+    """
+
+    scenarios = [Data[s] for s in Data]
+    first = scenarios[0]
+    ProductSize = first['ProductSize']
+
+    stacked = {
+        'Size (inches)': ProductSize['Size (inches)'].to_numpy(),
+        'Format': ProductSize['Format'].to_numpy(dtype=str),
+        'Market': ProductSize['Market'].to_numpy(dtype=str),
+        'Angle': ProductSize['Angle'].to_numpy(),
+        'Years': np.array(first['ProductPrice'].columns[2:], dtype=int),
+        'SubstrateYears': np.array(first['SubstrateCost'].columns, dtype=int),
+        'InvestmentYears': np.array(first['InvestmentCost'].columns, dtype=int),
+        'YieldYears': np.array(first['Yield'].columns[4:], dtype=int),
+        'Scenario': np.arange(len(scenarios)),
+    }
+
+    for key in ['tv_selection', 'prices_selection', 'substrate_prices_selection',
+                'investment_selection', 'yield_selection', 'R&D', 'SG&A', 'TaxRate', 'DPO', 'DSO',
+                'DIO']:
+        stacked[key] = np.array([scenario[key] for scenario in scenarios])
+
+    for key in ['New Diagonal (inches)', 'Height (m)', 'Width (m)']:
+        stacked[key] = np.array([scenario['ProductSize'][key].to_numpy()
+                                 for scenario in scenarios])
+
+    stacked['ProductPrice'] = np.array([scenario['ProductPrice'].iloc[:, 2:].to_numpy(dtype=float)
+                                        for scenario in scenarios])
+    stacked['Yield'] = np.array([scenario['Yield'].iloc[:, 4:].to_numpy(dtype=float)
+                                 for scenario in scenarios])
+
+    for key in ['SubstrateCost', 'InvestmentCost', 'Depreciation']:
+        stacked[key] = np.array([scenario[key].iloc[0].to_numpy(dtype=float)
+                                 for scenario in scenarios])
+
+    for key in ['MaxCapacity', 'WACC', 'Max_width', 'Max_height']:
+        stacked[key] = first[key]
+
+    return stacked
+
+
+def isScenarioArrays(Data):
+    """Checks whether `Data` holds stacked scenario arrays rather than a dict of scenarios."""
+    return 'ProductPrice' in Data and np.ndim(Data['ProductPrice']) == 3
+
+
+def asScenarioArrays(Data):
+    """
+    Returns the scenarios in `Data` as stacked scenario arrays
+
+    Parameters
+    ----------
+    Data : dict or Mapping
+        Either a dictionary of scenarios as returned by `generateData` (keyed by the scenario
+        index), or stacked scenario arrays, e.g. as returned by `generateScenarios` or a
+        `ScenarioStore.ScenarioStore`. Stacked scenario arrays are returned as they are.
+
+    Returns
+    -------
+    dict or Mapping
+        Stacked scenario arrays, see `generateScenarios`
+    """
+
+    if isScenarioArrays(Data):
+        return Data
+
+    return stackScenarioData(Data)
+
+
+def numScenarios(Data):
+    """Returns the number of scenarios in `Data`, in any of the formats of `asScenarioArrays`."""
+    if isScenarioArrays(Data):
+        return len(Data['R&D'])
+
+    return len(Data)
+
+
+def subsetScenarios(Data, indices):
+    """
+    Returns a subset of the scenarios in stacked scenario arrays
+
+    Parameters
+    ----------
+    Data : dict or Mapping
+        Stacked scenario arrays, e.g. as returned by `generateScenarios` or a
+        `ScenarioStore.ScenarioStore`, of which a subset is a view on the same store
+    indices : array-like
+        Positions of the scenarios in `Data`
+
+    Returns
+    -------
+    dict or Mapping
+        Stacked scenario arrays of the scenarios at `indices`, in that order
+    """
+
+    if hasattr(Data, 'subset'):
+        return Data.subset(indices)
+
+    indices = np.asarray(indices, dtype=np.int64)
+    return {field: np.asarray(value)[indices] if field in SCENARIO_FIELDS else value
+            for field, value in Data.items()}
+
+
+def generateData(path, probability={'all': [0.25, 0.5, 0.25]}, bandwidths_tv=[-2, 0, 1],
+                 bandwidths_prices=[0.8, 1, 1.2], bandwidths_substrate_prices=[0.9, 1, 1.1],
+                 bandwidths_investment=[0.9, 1, 1.1], bandwidths_yield=[-0.15, 0, 0.02],
+                 bandwidths_rd=[0.04, 0.05, 0.11], bandwidths_sga=[0.03, 0.04, 0.05],
+                 bandwidths_tax=[0.20, 0.25, 0.30], bandwidths_dpo=[35, 45, 55],
+                 bandwidths_dso=[35, 45, 55], bandwidths_dio=[20, 30, 40], max_width=1.85,
+                 max_height=1.55, seed=None, scenario=0):
+    """
+    Imports the data and constructs a random instance
+
+    The workbook is parsed only once per process (and per change of the workbook), see
+    `loadBaseData`. All random draws are made on the in-memory base data. To construct many
+    instances, `generateScenarios` is considerably faster.
+
+    Parameters
+    ----------
+    path : str or dict
+        Path to the data, or base data that is already in memory (see `loadBaseData`)
+    probability : dict
+        Dictionary of probabilities for each of the bandwidths. If not specified for all bandwidths,
+        this should include a key called 'all' that will be used for all bandwidths that are not
+        assigned a custom probability.
+    bandwidths_tv : list
+        List of bandwidths for the television diagonal size. Length must match that of `probability`
+    bandwidths_prices : list
+        List of bandwidths for the selling prices. Length must match that of `probability`
+    bandwidths_substrate_prices : list
+        List of bandwidths for the substrate purchase costs. Length must match that of `probability`
+    bandwidths_investment : list
+        List of bandwidths for the investment costs. Length must match that of `probability`
+    bandwidths_yield : list
+        List of bandwidths for the yields. Note, these are in percentage points added/subtracted
+        rather than multiplicative factors. Length must match that of `probability`
+    bandwidths_rd : list
+        List of bandwidths for the R&D costs. Length must match that of `probability`
+    bandwidths_sga : list
+        List of bandwidths for the SG&A costs. Length must match that of `probability`
+    bandwidths_tax : list
+        List of bandwidths for the tax rate. Length must match that of `probability`
+    bandwidths_dpo : list
+        List of bandwidths for the DPO. Length must match that of `probability`
+    bandwidths_dso : list
+        List of bandwidths for the DSO. Length must match that of `probability`
+    bandwidths_dio : list
+        List of bandwidths for the DIO. Length must match that of `probability`
+    max_width : float
+        Maximum width of the substrate
+    max_height: float
+        Maximum height of the substrate
+    seed : None, int, np.random.SeedSequence or np.random.Generator
+        Root seed of the scenario set, see `generateScenarios`. If None (default), the global NumPy
+        random state is used.
+    scenario : int
+        Index of the scenario in the scenario set of `seed`. The instance is identical to scenario
+        `scenario` of `generateScenarios` with the same seed. Ignored if `seed` is None.
+
+    Returns
+    -------
+    dict
+        Dictionary of all needed values and randomized data
+    """
+
+    scenarios = generateScenarios(
+        path, [scenario], probability=probability, bandwidths_tv=bandwidths_tv,
+        bandwidths_prices=bandwidths_prices,
+        bandwidths_substrate_prices=bandwidths_substrate_prices,
+        bandwidths_investment=bandwidths_investment, bandwidths_yield=bandwidths_yield,
+        bandwidths_rd=bandwidths_rd, bandwidths_sga=bandwidths_sga, bandwidths_tax=bandwidths_tax,
+        bandwidths_dpo=bandwidths_dpo, bandwidths_dso=bandwidths_dso,
+        bandwidths_dio=bandwidths_dio, max_width=max_width, max_height=max_height, seed=seed)
+
+    return scenarioData(scenarios, 0)
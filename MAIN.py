@@ -1,45 +1,88 @@
-import random
-import pickle
+import argparse
 import os
+import time
+from multiprocessing import Process
 import numpy as np
 import pandas as pd
-from tqdm import tqdm
-from DataFunction import generateData
-from NPVFunction import NPV_SAA
+from DataFunction import generateData, asScenarioArrays, numScenarios
+from QueueFunction import SweepQueue, runWorker
+from ScenarioStore import generateScenarioStore, openScenarios, updateScenarioStore
+from SweepFunction import (adaptiveSearch, breakpointSearch, gridSweep, searchTable,
+                           surrogateSearch, thresholdSweep)
 
 
 def main(Data, output_path1=None, output_path2=None, output_path3=None, output_path4=None,
-         max_height=None, max_width=None, num_height=12, num_width=6, stepsize_width=0.05,
-         stepsize_height=0.05, option=1, product_thresholds=None, verbose=False):
+         output_path5=None, max_height=None, max_width=None, num_height=12, num_width=6,
+         stepsize_width=0.05, stepsize_height=0.05, option=1, product_thresholds=None,
+         probabilities=None, formulation='expected', solver='gurobi', workers=None, threads=None,
+         queue=None, verbose=False):
+
+    # Convert the scenarios once rather than for every cell of the grid
+    Data = asScenarioArrays(Data)
 
     if max_width is None:
-        max_width = Data[0]['Max_width']
+        max_width = Data['Max_width']
     widths = [max_width-stepsize_width*i for i in range(num_width)]
 
     if max_height is None:
-        max_height = Data[0]['Max_height']
+        max_height = Data['Max_height']
     heights = [max_height-stepsize_height*i for i in range(num_height)]
 
     NPV = pd.DataFrame(np.zeros((num_height, num_width)), index=heights, columns=widths)
 
+    # Only the statistics of the NPVs are kept, so no P&L or production tables are needed
+    if output_path2 is None and output_path3 is None and output_path4 is None:
+        report = 'none'
+    else:
+        report = 'summary'
+
     if output_path2 is not None:
         NPVmax = NPV.copy()
     if output_path3 is not None:
         NPVmin = NPV.copy()
     if output_path4 is not None:
         NPVpos = NPV.copy()
-
-    for h in tqdm(range(num_height)):
-        for w in tqdm(range(num_width)):
-            NPV_ = NPV_SAA(Data, h=heights[h], w=widths[w], option=option,
-                           product_thresholds=product_thresholds, verbose=verbose)
-            NPV.values[h, w] = NPV_['Average NPV']
-            if output_path2 is not None:
-                NPVmax.values[h, w] = NPV_['NPVmax']
-            if output_path3 is not None:
-                NPVmin.values[h, w] = NPV_['NPVmin']
-            if output_path4 is not None:
-                NPVpos.values[h, w] = 1-(NPV_['#NegativeScenarios']/len(Data))
+    if output_path5 is not None:
+        assert option == 4, "The CVaR (output_path5) is only computed in option 4"
+        CVaR = NPV.copy()
+
+    if queue is None:
+        # The model is built once per block of cells, and every cell starts from the production
+        # plan of the previous cell. With workers, the blocks are solved in parallel.
+        results = gridSweep(Data, heights, widths, option=option,
+                            product_thresholds=product_thresholds, probabilities=probabilities,
+                            formulation=formulation, solver=solver, report=report,
+                            workers=workers, threads=threads, verbose=verbose)
+    else:
+        # The cells are tasks in the queue, which are solved by the workers on any node. The job
+        # is named after its first output, so it is only submitted once and a coordinator that is
+        # restarted picks up the results that are already done. A job of that name with other
+        # arguments raises an error rather than returning its results.
+        assert output_path1 is not None, "output_path1 is the name of the job in the queue"
+        queue = SweepQueue(queue)
+        if not queue.submit(output_path1, Data, heights, widths, report=report, option=option,
+                            product_thresholds=product_thresholds, probabilities=probabilities,
+                            formulation=formulation, solver=solver, threads=threads,
+                            verbose=verbose):
+            print(f"Resuming job {output_path1}: {queue.progress(output_path1)}")
+        while not queue.done(output_path1):
+            time.sleep(1)
+        results = queue.results(output_path1)
+        queue.close()
+
+    for (h, w), NPV_ in results.items():
+        NPV.iat[h, w] = NPV_['Average NPV']
+        if output_path2 is not None:
+            NPVmax.iat[h, w] = NPV_['NPVmax']
+        if output_path3 is not None:
+            NPVmin.iat[h, w] = NPV_['NPVmin']
+        if output_path4 is not None:
+            if probabilities is None:
+                NPVpos.iat[h, w] = 1-(NPV_['#NegativeScenarios']/numScenarios(Data))
+            else:
+                NPVpos.iat[h, w] = 1-np.dot(probabilities, np.array(NPV_['NPVs']) < 0)
+        if output_path5 is not None:
+            CVaR.iat[h, w] = NPV_['CVaR']
 
     if output_path1 is not None:
         NPV.to_csv(output_path1)
@@ -49,50 +92,53 @@ def main(Data, output_path1=None, output_path2=None, output_path3=None, output_p
         NPVmin.to_csv(output_path3)
     if output_path4 is not None:
         NPVpos.to_csv(output_path4)
+    if output_path5 is not None:
+        CVaR.to_csv(output_path5)
 
 
 if __name__ == "__main__":  # This means that running this script will run the code below
 
+    # By default, all grids are solved in this process. With --queue, the cells are solved by
+    # workers that take them from a queue in a SQLite file, which are started on any node with
+    # --worker (and on this node with --workers).
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--queue', help="SQLite file of the queue to submit the grids to")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="Number of workers to start on this node for the queue")
+    parser.add_argument('--worker', metavar='QUEUE',
+                        help="Only run a worker for the queue in this SQLite file")
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        runWorker(args.worker, stop_when_empty=False)
+        raise SystemExit
+
+    queue = args.queue
+    local_workers = [Process(target=runWorker, args=(queue,), kwargs={'stop_when_empty': False},
+                             daemon=True) for _ in range(args.workers if queue else 0)]
+    for worker in local_workers:
+        worker.start()
+
     # Run baseline case
     Data_baseline = {0: generateData("data/DataPBAS.xlsx", probability={'all': [0, 1, 0]})}
 
-    # Create data
+    # Create data. The scenarios are stored in a memory-mapped scenario store, which is generated
+    # with a fixed seed such that it can always be regenerated exactly.
     seed = 42
-    data1000_path = "data/data1000.pkl"
-    data500_path = f"data/data500_seed{seed}.pkl"
-    if os.path.isfile(data1000_path):
-        # Then this file already exists and can be imported
-        with open(data1000_path, "rb") as data:
-            Data1000 = pickle.load(data)
-
-        if os.path.isfile(data500_path):
-            # Then this file already exists and can be imported - we assume they are concurrent
-            with open(data500_path, "rb") as data:
-                Data500 = pickle.load(data)
-        else:
-            # This file needs to be created
-            random.seed(seed)
-            keys = random.sample(list(Data1000.keys()), 500)
-            Data500 = {i: Data1000[keys[i]] for i in range(len(keys))}
-
-            with open(data500_path, "wb") as data:
-                pickle.dump(Data500, data)
-
+    data_path = "data/DataPBAS.xlsx"
+    data1000_path = "data/scenarios1000"
+    if os.path.isdir(data1000_path):
+        # Then this store already exists. If the data changed, only the values that depend on the
+        # changed sheets are recomputed, with the same random draws.
+        updateScenarioStore(data1000_path, data_path)
+        Data1000 = openScenarios(data1000_path)
     else:
-        num_scenarios = 1000
-        data_path = "data/DataPBAS.xlsx"
-        Data1000 = {i: generateData(data_path) for i in tqdm(range(num_scenarios))}
+        Data1000 = generateScenarioStore(data1000_path, data_path, 1000, seed=seed)
 
-        with open(data1000_path, "wb") as data:
-            pickle.dump(Data1000, data)
-
-        # Then also the subsample needs to be recreated
-        random.seed(seed)
-        keys = random.sample(list(Data1000.keys()), num_scenarios//2)
-        Data500 = {i: Data1000[keys[i]] for i in range(len(keys))}
-
-        with open(data500_path, "wb") as data:
-            pickle.dump(Data500, data)
+    # The subsample of 500 scenarios is a view on the same store rather than a separate copy. The
+    # scenarios are drawn independently, so the first 500 are a random sample, and a range of
+    # scenarios is a memory-mapped slice of the store rather than a copy on every access.
+    Data500 = Data1000.subset(range(500))
 
     #### Run the models ####
     # For option 1 and 3, we only run the full grid on the baseline case and on a dataset comprising
@@ -103,15 +149,17 @@ if __name__ == "__main__":  # This means that running this script will run the c
     print('RUN OPTION 1')
 
     # Run full grid (1.60-1.85 (0.05) x 1.00-1.55 (0.05))
-    main(Data_baseline, option=1, output_path1="output/NPV_baseline_option1_fullgrid.csv")
-    main(Data500, option=1,
+    main(Data_baseline, queue=queue, option=1,
+         output_path1="output/NPV_baseline_option1_fullgrid.csv")
+    main(Data500, queue=queue, option=1,
           output_path1="output/NPV_option1_fullgrid.csv",
           output_path2="output/NPVmax_option1_fullgrid.csv",
           output_path3="output/NPVmin_option1_fullgrid.csv",
           output_path4="output/NPVpos_option1_fullgrid.csv")
 
     # Run baseline case (zoomed in)
-    main(Data_baseline, option=1, output_path1=f"output/NPV_baseline_option1_zoomedin.csv",
+    main(Data_baseline, queue=queue, option=1,
+         output_path1=f"output/NPV_baseline_option1_zoomedin.csv",
          max_height=1.15, max_width=1.85, num_height=11, num_width=6, stepsize_height=0.01,
          stepsize_width=0.01)
 
@@ -128,14 +176,14 @@ if __name__ == "__main__":  # This means that running this script will run the c
     means_scaled = means/(min(means)/min_percentage)
 
     # Run full grid (1.60-1.85 (0.05) x 1.00-1.55 (0.05))
-    main(Data_baseline, option=2,
+    main(Data_baseline, queue=queue, option=2,
           output_path1="output/NPV_baseline_option2_{min_percentage}_fullgrid.csv",
           product_thresholds={'notebooks': means_scaled['Notebook'],
                               'monitors': means_scaled['Monitor'],
                               'televisions': means_scaled['Television']})
 
     # Run baseline case (zoomed in)
-    main(Data_baseline, option=2,
+    main(Data_baseline, queue=queue, option=2,
          output_path1=f"output/NPV_baseline_option2_{min_percentage}_zoomedin.csv",
          product_thresholds={'notebooks': means_scaled['Notebook'],
                              'monitors': means_scaled['Monitor'],
@@ -144,7 +192,7 @@ if __name__ == "__main__":  # This means that running this script will run the c
          stepsize_width=0.01)
 
     # Run full grid (1.60-1.85 (0.05) x 1.00-1.55 (0.05))
-    main(Data500, option=2,
+    main(Data500, queue=queue, option=2,
           output_path1=f"output/NPV_option2_{min_percentage}_fullgrid.csv",
           output_path2=f"output/NPVmax_option2_{min_percentage}_fullgrid.csv",
           output_path3=f"output/NPVmin_option2_{min_percentage}_fullgrid.csv",
@@ -155,7 +203,7 @@ if __name__ == "__main__":  # This means that running this script will run the c
 
     # Run zoomed-in on most profitable case (highest maximum NPV) for more scenarios. Do note that
     # the decision to zoom in on this area is effectively made on only one scenario.
-    main(Data1000, option=2,
+    main(Data1000, queue=queue, option=2,
           output_path1=f"output/NPV_option2_{min_percentage}_mostprofit.csv",
           output_path2=f"output/NPVmax_option2_{min_percentage}_mostprofit.csv",
           output_path3=f"output/NPVmin_option2_{min_percentage}_mostprofit.csv",
@@ -167,7 +215,7 @@ if __name__ == "__main__":  # This means that running this script will run the c
 
     # Run zoomed-in on highest average NPV for more scenarios. Note that this also had the highest
     # probability of a positive NPV.
-    main(Data1000, option=2,
+    main(Data1000, queue=queue, option=2,
           output_path1=f"output/NPV_option2_{min_percentage}_2ndmostprofit.csv",
           output_path2=f"output/NPVmax_option2_{min_percentage}_2ndmostprofit.csv",
           output_path3=f"output/NPVmin_option2_{min_percentage}_2ndmostprofit.csv",
@@ -179,7 +227,7 @@ if __name__ == "__main__":  # This means that running this script will run the c
 
     # Run zoomed-in on the least costly case (highest minimum NPV) for more scenarios. Do note that
     # the decision to zoom in on this area is effectively made on only one scenario.
-    main(Data1000, option=2,
+    main(Data1000, queue=queue, option=2,
           output_path1=f"output/NPV_option2_{min_percentage}_leastcost.csv",
           output_path2=f"output/NPVmax_option2_{min_percentage}_leastcost.csv",
           output_path3=f"output/NPVmin_option2_{min_percentage}_leastcost.csv",
@@ -189,25 +237,78 @@ if __name__ == "__main__":  # This means that running this script will run the c
                                           'monitors': means_scaled['Monitor'],
                                           'televisions': means_scaled['Television']})
 
+    # Refine the full grid down to steps of 0.01 around the cells with the highest average NPV for
+    # more scenarios, rather than choosing the zoomed-in grids above by hand
+    search = adaptiveSearch(Data1000, option=2, keep=2,
+                            product_thresholds={'notebooks': means_scaled['Notebook'],
+                                                'monitors': means_scaled['Monitor'],
+                                                'televisions': means_scaled['Television']})
+    search['Tree'].to_csv(f"output/Search_option2_{min_percentage}_adaptive.csv", index=False)
+    searchTable(search['Tree']).to_csv(f"output/NPV_option2_{min_percentage}_adaptive.csv")
+
+    # Search the cell with the highest average NPV on the grid with steps of 0.01 with a budget of
+    # 15 solves, guided by a surrogate of the average NPV of the cells solved so far
+    search = surrogateSearch(Data1000, option=2, budget=15, seed=seed,
+                             product_thresholds={'notebooks': means_scaled['Notebook'],
+                                                 'monitors': means_scaled['Monitor'],
+                                                 'televisions': means_scaled['Television']})
+    for name, criterion in [('NPV', 'Average NPV'), ('NPVmax', 'NPVmax'), ('NPVmin', 'NPVmin'),
+                            ('NPVpos', 'NPVpos')]:
+        searchTable(search['Evaluated'], criterion).to_csv(
+            f"output/{name}_option2_{min_percentage}_surrogate.csv")
+
     # Option 3: Each product should constitute at least a certain amount of the production
     print('RUN OPTION 3')
     threshold = 0.005
 
     # Run baseline case
-    main(Data_baseline, option=3,
+    main(Data_baseline, queue=queue, option=3,
           output_path1=f"output/NPV_baseline_option3_{threshold}_fullgrid.csv",
           product_thresholds=threshold)
 
     # Run baseline case (zoomed in)
-    main(Data_baseline, option=3,
+    main(Data_baseline, queue=queue, option=3,
          output_path1=f"output/NPV_baseline_option3_{threshold}_zoomedin.csv",
          product_thresholds=threshold, max_height=1.15, max_width=1.85, num_height=11, num_width=6,
          stepsize_height=0.01, stepsize_width=0.01)
 
     # Run full grid (1.60-1.85 (0.05) x 1.00-1.55 (0.05))
-    main(Data500, option=3,
+    main(Data500, queue=queue, option=3,
           output_path1=f"output/NPV_option3_{threshold}_fullgrid.csv",
           output_path2=f"output/NPVmax_option3_{threshold}_fullgrid.csv",
           output_path3=f"output/NPVmin_option3_{threshold}_fullgrid.csv",
           output_path4=f"output/NPVpos_option3_{threshold}_fullgrid.csv",
           product_thresholds=threshold)
+
+    # Best substrate sizes in the range of the full grid at continuous resolution, rather than on
+    # the grid of 0.05 or 0.01
+    for option, thresholds in [(1, None), (3, threshold)]:
+        search = breakpointSearch(Data500, option=option, product_thresholds=thresholds)
+        search['Evaluated'].to_csv(f"output/Breakpoints_option{option}.csv", index=False)
+
+    # Frontier of the average NPV against the diversification of the production, at the substrate
+    # size that was found to be optimal. The thresholds are swept in one model per option.
+    height, width = 1.08, 1.84
+    thresholdSweep(Data500, height, width, option=2,
+                   thresholds=[0, 0.0025, 0.005, 0.01, 0.02, 0.03, 0.05]
+                   ).to_csv("output/Frontier_option2.csv", index=False)
+    thresholdSweep(Data500, height, width, option=3,
+                   thresholds=[0.0, 0.0025, 0.005, 0.01, 0.02, 0.04, 0.06, 0.08]
+                   ).to_csv("output/Frontier_option3.csv", index=False)
+
+    # Option 4: Maximise a combination of the average NPV and the CVaR, the average NPV of the 10%
+    # worst scenarios, rather than zooming in on the least costly case afterwards
+    print('RUN OPTION 4')
+    risk_parameters = {'alpha': 0.1, 'weight': 0.5}
+
+    # Run full grid (1.60-1.85 (0.05) x 1.00-1.55 (0.05))
+    main(Data500, queue=queue, option=4,
+          output_path1="output/NPV_option4_cvar_fullgrid.csv",
+          output_path2="output/NPVmax_option4_cvar_fullgrid.csv",
+          output_path3="output/NPVmin_option4_cvar_fullgrid.csv",
+          output_path4="output/NPVpos_option4_cvar_fullgrid.csv",
+          output_path5="output/CVaR_option4_cvar_fullgrid.csv",
+          product_thresholds=risk_parameters)
+
+    for worker in local_workers:
+        worker.terminate()
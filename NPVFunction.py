@@ -1,19 +1,58 @@
 import collections
+import time
 import numpy as np
 import pandas as pd
-import gurobipy as gb
-from gurobipy import quicksum
+import scipy.sparse as sp
+from scipy.optimize import Bounds, LinearConstraint, milp
+try:
+    import gurobipy as gb
+except ImportError:
+    # Then only the open-source solver HiGHS is available
+    gb = None
+from DataFunction import asScenarioArrays, numScenarios
+from PoSFunction import productGeometries, scenarioPoS
 
 
-def NPV_SAA(Data, h, w, option=1, product_thresholds=None, verbose=True):
+# Formulations of NPV_SAA. 'scenarios' models the P&L of every scenario, 'expected' only the
+# expected NPV as a function of the production plan.
+FORMULATIONS = ['scenarios', 'expected']
 
-    assert option in {1, 2, 3}, "Option should be 1, 2, or 3"
+# Levels of the results that NPV_SAA reports, see its documentation
+REPORTS = ['none', 'summary', 'full']
+
+# Line items of the P&L and cash flow statement, in the order of the 'PL' of NPV_SAA. 'RD', 'SG&A'
+# and 'TAX' are rates of the sales and operating margin, 'CCC' is the cash conversion cycle in
+# years and 'SubstrateCost' the cost per substrate.
+PL_ITEMS = ['PercentageGlassLoss', 'SubstrateCost', 'SALES', 'COS', 'CostofSales', 'GM', 'RD',
+            'SG&A', 'OM', 'TAX', 'NI', 'WC', 'Depreciation', 'CAPEX', 'CCC', 'NPV', 'NCF', 'DWC']
+
+# Weights of the revenue in the sums that the P&L is computed from (see `plWeights`). 'Sales' is
+# the revenue itself, 'OM' and 'NI' its share in the operating margin and net income, 'WC' its
+# share in the working capital and 'NPV' its net present value including the working capital.
+REVENUE_WEIGHTS = ['Sales', 'OM', 'NI', 'WC', 'NPV']
+
+# Weights of the substrate cost in the sums that the P&L is computed from, similarly
+SUBSTRATE_WEIGHTS = ['COS', 'NI', 'NPV']
+
+# Keys of the product thresholds of option 2 and the markets they apply to
+MARKET_THRESHOLDS = {'notebooks': 'Notebook', 'monitors': 'Monitor', 'televisions': 'Television'}
+
+# Keys of the risk parameters of option 4. 'alpha' is the probability of the worst scenarios that
+# the CVaR averages over and 'weight' the weight of the CVaR in the objective, the expected NPV
+# having weight 1 - 'weight'. The optional key 'floor' is a lower bound on the CVaR.
+RISK_PARAMETERS = ['alpha', 'weight']
+
+
+def checkOption(option, product_thresholds):
+    """Checks that the product thresholds are valid for the option."""
+
+    assert option in {1, 2, 3, 4}, "Option should be 1, 2, 3 or 4"
 
     if option == 2:
         assert isinstance(product_thresholds, dict), \
             "product_thresholds should be a dict when option is 2"
 
-        product_thresholds_keys = {'notebooks', 'monitors', 'televisions'}
+        product_thresholds_keys = set(MARKET_THRESHOLDS)
         assert product_thresholds_keys <= product_thresholds.keys(), \
             f"product_thresholds should have keys {product_thresholds_keys}"
         assert all(0 <= product_thresholds[key] <= 1 for key in product_thresholds_keys), \
@@ -26,265 +65,1054 @@ def NPV_SAA(Data, h, w, option=1, product_thresholds=None, verbose=True):
         assert 0 <= product_thresholds <= 1, \
             "product_thresholds should be a number between 0 and 1 when option is 3"
 
-    Scenarios = len(Data)
-    Products = len(Data[0]['ProductSize'])
-    Time = len(Data[0]['ProductPrice'].columns) - 2
+    if option == 4:
+        assert isinstance(product_thresholds, dict), \
+            "product_thresholds should be a dict of risk parameters when option is 4"
+        assert set(RISK_PARAMETERS) <= product_thresholds.keys(), \
+            f"product_thresholds should have keys {RISK_PARAMETERS} when option is 4"
+        assert 0 < product_thresholds['alpha'] <= 1, \
+            "alpha in product_thresholds should be a number in (0, 1] when option is 4"
+        assert 0 <= product_thresholds['weight'] <= 1, \
+            "weight in product_thresholds should be a number between 0 and 1 when option is 4"
 
-    if option == 2:
-        Notebook = Data[0]['ProductSize'].loc[
-            Data[0]['ProductSize']['Market'] == 'Notebook'].index.values
-        Monitor = Data[0]['ProductSize'].loc[
-            Data[0]['ProductSize']['Market'] == 'Monitor'].index.values
-        Television = Data[0]['ProductSize'].loc[
-            Data[0]['ProductSize']['Market'] == 'Television'].index.values
-
-    # Products Per Substrate
-    PoS = {}
-    for s in range(Scenarios):
-        PoS[s] = {}
-
-        for p in range(Products):
-            # Note: In our data Height<Width for all products, i.e. all products are oriented to be
-            # horizontal.
-
-            # Compute how many products fit if the screen is placed horizontally
-            num_width_hor = np.floor(w/Data[s]['ProductSize'].loc[p, 'Width (m)'])
-            num_height_hor = np.floor(h/Data[s]['ProductSize'].loc[p, 'Height (m)'])
-            num_products_hor = num_width_hor*num_height_hor
-
-            # Compute how many products fit if the screen is placed vertically
-            num_width_vert = np.floor(w/Data[s]['ProductSize'].loc[p, 'Height (m)'])
-            num_height_vert = np.floor(h/Data[s]['ProductSize'].loc[p, 'Width (m)'])
-            num_products_vert = num_width_vert*num_height_vert
-
-            if num_products_hor >= num_products_vert:
-                # Products are placed horizontally
-                PoS[s][p] = {'num_width': num_width_hor,
-                             'num_height': num_height_hor,
-                             'num_products': num_products_hor,
-                             'product_orientation': 'hor'}
+
+def marketThresholds(Data, min_percentage):
+    """
+    Constructs the product thresholds of option 2 from the product sizes
+
+    Smaller products should have a lower percentage because more of these fit on a substrate, so
+    the threshold of every market is proportional to the mean size of its products, scaled such
+    that the smallest threshold is `min_percentage`.
+
+    Parameters
+    ----------
+    Data : dict or Mapping
+        Scenarios, see `NPV_SAA`
+    min_percentage : float
+        Threshold of the market with the smallest products
+
+    Returns
+    -------
+    dict
+        Product thresholds of option 2, see `MARKET_THRESHOLDS`
+    """
+
+    Data = asScenarioArrays(Data)
+    means = pd.Series(np.asarray(Data['Size (inches)'])).groupby(np.asarray(Data['Market'])).mean()
+    means = means*(min_percentage/means.min())
+
+    return {key: means[market_name] for key, market_name in MARKET_THRESHOLDS.items()}
+
+
+def checkProbabilities(probabilities, num_scenarios):
+    """Returns the probabilities of the scenarios, which are equal if `probabilities` is None."""
+
+    if probabilities is None:
+        return np.full(num_scenarios, 1/num_scenarios)
+
+    probabilities = np.asarray(probabilities, dtype=float)
+    assert probabilities.shape == (num_scenarios,), \
+        "probabilities should have one probability per scenario"
+    assert np.all(probabilities >= 0) and np.isclose(probabilities.sum(), 1), \
+        "probabilities should be nonnegative and sum to 1"
+
+    return probabilities
+
+
+def NPV_SAA(Data, h, w, option=1, product_thresholds=None, probabilities=None, PoS=None,
+            formulation='scenarios', solver='gurobi', closed_form=True, report='full',
+            verbose=True):
+    """
+    Solves the sample average approximation of the expected NPV for a substrate of size h x w
+
+    To solve for several substrate sizes, e.g. a grid, use `SAAModel`, which reuses the model.
+
+    Parameters
+    ----------
+    Data : dict or Mapping
+        Scenarios, either as a dictionary of scenarios as returned by `generateData` or as stacked
+        scenario arrays, e.g. as returned by `generateScenarios` or a memory-mapped
+        `ScenarioStore.ScenarioStore` (see `DataFunction.asScenarioArrays`)
+    h : float
+        Height of the substrate
+    w : float
+        Width of the substrate
+    option : int
+        1 to maximise profit, 2 to require a minimum share of the production per market, 3 to
+        require a minimum share of the production per product and 4 to maximise a combination of
+        the expected NPV and the CVaR of the NPV, i.e. the expected NPV of the worst scenarios
+    product_thresholds : dict or float
+        Minimum share of the production per market (keys 'notebooks', 'monitors' and
+        'televisions') if option is 2, per product if option is 3, or the risk parameters (see
+        `RISK_PARAMETERS`) if option is 4
+    probabilities : array-like
+        Probability of every scenario, e.g. the weights of a reduced scenario set (see
+        `ReductionFunction.reduceScenarioSet`). By default, all scenarios are equally likely.
+    PoS : dict
+        Products per substrate of every product in every scenario for this substrate size, e.g.
+        one cell of `PoSFunction.gridPoS` (see `PoSFunction.gridCell`). Computed if not given.
+    formulation : str
+        'scenarios' to model the P&L of every scenario, or 'expected' to first compute the expected
+        NPV per substrate of every product in every year and optimise over the production plan
+        only. Both give the same optimal expected NPV, but the model of 'expected' does not grow
+        with the number of scenarios.
+    solver : str
+        'gurobi' to solve with Gurobi, or 'highs' to solve with HiGHS through
+        `scipy.optimize.milp`, which does not need a license (see `SOLVERS`)
+    closed_form : bool
+        Whether to solve options 1 and 3 without the solver if possible, see `solveClosedForm`.
+        The solver is used if the closed-form plan cannot be proven optimal.
+    report : str
+        Which results to compute after solving: 'none' for only the 'Average NPV', 'summary' to
+        add the NPVs of the scenarios and their statistics, which takes a single evaluation of the
+        NPV of all scenarios, or 'full' to add the 'Production', 'PL' and 'POS' as well. Grid
+        sweeps that only keep the summary should not compute the full report.
+    verbose : bool
+        Whether to print the output of the solver
+
+    Returns
+    -------
+    dict
+        Dictionary of the results. All reports have the 'Average NPV', 'Width', 'Height' and
+        'ModelStatistics': the 'Method' that solved the model (the solver or 'closed form'), the
+        'Rows', 'Columns' and 'Nonzeros' of the model, its 'Build time' and 'Solve time' (seconds)
+        and the number of branch-and-bound 'Nodes'. In option 4, they also have the 'CVaR' of the
+        NPVs (see `conditionalValueAtRisk`). The 'summary' adds 'NPVs', 'NPVmax', 'NPVmin'
+        and '#NegativeScenarios', and the 'full' report adds the 'Production' plan, the expected
+        'PL' and 'POS', the products per substrate as arrays of scenarios x products (see
+        `PoSFunction.POS_FIELDS`).
+    """
+
+    return SAAModel(Data, option=option, product_thresholds=product_thresholds,
+                    probabilities=probabilities, formulation=formulation, solver=solver,
+                    closed_form=closed_form, verbose=verbose).solve(h, w, PoS=PoS, report=report)
+
+
+class SAAModel:
+    """
+    Model of `NPV_SAA` for a set of scenarios that is solved for one substrate size after another
+
+    The model is built once. For every substrate size, only what depends on it is updated: the
+    coefficients of the production plan in the sales and cost of sales (formulation 'scenarios') or
+    in the objective (formulation 'expected'), and the market constraints of option 2 if other
+    markets became profitable. Every solve is started from the production plan of the previous
+    substrate size, which is typically (nearly) optimal for a neighbouring substrate size.
+
+    In option 4, the CVaR is modelled as in Rockafellar and Uryasev (2000): the CVaR at level alpha
+    is the maximum over eta of eta - E[max(eta - NPV, 0)]/alpha, so the model gets the variable eta
+    and per scenario a shortfall variable that is at least eta minus the NPV of that scenario. The
+    NPV of a scenario is a sparse row over its sales and cost of sales in formulation 'scenarios',
+    which does not depend on the substrate size, or over the production plan in formulation
+    'expected', where it is updated with the substrate size.
+
+    Parameters
+    ----------
+    Data, option, product_thresholds, probabilities, formulation, solver, closed_form, verbose
+        See `NPV_SAA`
+    threads : int
+        Number of threads of the solver, e.g. to split the cores between parallel models. By
+        default, the solver decides. HiGHS through `scipy.optimize.milp` does not take a number of
+        threads, so it is ignored there.
+    """
+
+    def __init__(self, Data, option=1, product_thresholds=None, probabilities=None,
+                 formulation='scenarios', solver='gurobi', closed_form=True, verbose=True,
+                 threads=None):
+        checkOption(option, product_thresholds)
+        assert formulation in FORMULATIONS, f"formulation should be one of {FORMULATIONS}"
+        checkSolver(solver)
+
+        start = time.perf_counter()
+
+        self.Data = Data = asScenarioArrays(Data)
+        self.option = option
+        self.product_thresholds = product_thresholds
+        self.formulation = formulation
+        self.closed_form = closed_form
+        self.Scenarios = Scenarios = numScenarios(Data)
+        self.Probability = checkProbabilities(probabilities, Scenarios)
+
+        # Only the scenario arrays that are needed are read, which for a memory-mapped scenario
+        # store means that only these are paged in
+        self.ProductPrice = np.asarray(Data['ProductPrice'])
+        self.Products, self.Time = Products, Time = self.ProductPrice.shape[1:]
+        self.Yield = np.asarray(Data['Yield'])[:, :, :Time]
+        self.Width = np.asarray(Data['Width (m)'])
+        self.Height = np.asarray(Data['Height (m)'])
+        self.SubstrateCost = np.asarray(Data['SubstrateCost'])[:, :Time]
+        self.Capacity = Data['MaxCapacity']*12
+
+        # Sales per product per substrate, the weights of the revenue and substrate cost in the NPV
+        # (see `npvWeights`), and the geometries that determine the products per substrate
+        self.PriceYield = self.ProductPrice*self.Yield
+        self.Weights = npvWeights(Data, Time)
+        self.geometries = productGeometries(self.Width, self.Height)
+
+        # VARIABLES. The production plan is flattened product by product. In formulation
+        # 'scenarios', it is followed by the sales and the cost of sales without depreciation,
+        # flattened scenario by scenario. All other line items of the P&L are linear in these, so
+        # they are not variables of the model.
+        lb = _planBounds(Products, Time, self.Capacity, option, product_thresholds)
+        integrality = np.ones(Products*Time, dtype=bool)
+        if formulation == 'scenarios':
+            lb = np.concatenate([lb, np.zeros(2*Scenarios*Time)])
+            integrality = np.concatenate([integrality, np.zeros(2*Scenarios*Time, dtype=bool)])
+
+        # In option 4, these are followed by eta and the shortfall of every scenario
+        if option == 4:
+            lb = np.concatenate([lb, [-np.inf], np.zeros(Scenarios)])
+            integrality = np.concatenate([integrality, np.zeros(1 + Scenarios, dtype=bool)])
+
+        # INITIALIZE MODEL
+        self.model = SOLVER_MODELS[solver](lb, integrality, verbose, threads)
+        self.model.setConstraints('Yearly Substrate Capacity', _capacityMatrix(Products, Time),
+                                  '<', np.full(Time, self.Capacity))
+
+        if option == 4:
+            # The CVaR is eta minus the expected shortfall divided by alpha
+            alpha, weight = product_thresholds['alpha'], product_thresholds['weight']
+            self.cvar = np.concatenate([[1], -self.Probability/alpha])
+            if product_thresholds.get('floor') is not None:
+                self.model.setConstraints('CVaR floor', sp.hstack([
+                    sp.csr_matrix((1, len(lb) - len(self.cvar))), sp.csr_matrix(self.cvar)]),
+                    '>', np.array([product_thresholds['floor']]))
+        else:
+            weight = 0
+        self.weight = weight
+
+        if formulation == 'scenarios':
+            # OBJECTIVE: the expected NPV, see `npvWeights`, and in option 4 the CVaR
+            self.model.setObjective(np.concatenate([
+                np.zeros(Products*Time),
+                (1-weight)*(self.Probability[:, np.newaxis]*self.Weights['Revenue']).ravel(),
+                -(1-weight)*(self.Probability[:, np.newaxis]*self.Weights['Substrate']).ravel()] +
+                ([weight*self.cvar] if option == 4 else [])),
+                (1-weight)*(self.Probability @ self.Weights['Constant']))
+
+            if option == 4:
+                # Shortfall[s] - eta + NPV[s] >= 0, where NPV[s] is the NPV of scenario s in terms
+                # of its sales and cost of sales
+                columns = np.arange(Scenarios*Time)
+                rows = np.arange(0, Scenarios*Time + 1, Time)
+                self.model.setConstraints('CVaR shortfall', sp.hstack([
+                    sp.csr_matrix((Scenarios, Products*Time)),
+                    sp.csr_matrix((self.Weights['Revenue'].ravel(), columns, rows)),
+                    sp.csr_matrix((-self.Weights['Substrate'].ravel(), columns, rows)),
+                    sp.csr_matrix(-np.ones((Scenarios, 1))), sp.identity(Scenarios)],
+                    format='csr'), '>', -self.Weights['Constant'])
+
+        # Markets that are profitable in the market constraints of option 2, and the last
+        # production plan
+        self.profitable = None
+        self.production = None
+
+        self.build_time = time.perf_counter() - start
+
+    def setThresholds(self, product_thresholds):
+        """
+        Replaces the product thresholds of option 2 or 3, keeping the rest of the model
+
+        The market constraints of option 2 are rebuilt in the next solve and the minimum production
+        of option 3 is set as the lower bounds of the production plan. The next solve is started
+        from the last production plan, which is typically (nearly) optimal for a neighbouring
+        threshold.
+
+        Parameters
+        ----------
+        product_thresholds : dict or float
+            See `NPV_SAA`
+        """
+
+        assert self.option in {2, 3}, "Only the thresholds of option 2 or 3 can be replaced"
+        checkOption(self.option, product_thresholds)
+
+        self.product_thresholds = product_thresholds
+        if self.option == 2:
+            self.profitable = None
+        else:
+            self.model.setLowerBounds(_planBounds(self.Products, self.Time, self.Capacity,
+                                                  self.option, product_thresholds))
+
+    def solve(self, h, w, PoS=None, report='full'):
+        """
+        Solves the model for a substrate of size h x w
+
+        Parameters
+        ----------
+        h, w, PoS, report
+            See `NPV_SAA`
+
+        Returns
+        -------
+        dict
+            Dictionary of the results, see `NPV_SAA`. The 'Build time' is the time of updating the
+            model, plus the time of building it for the first substrate size.
+        """
+
+        assert report in REPORTS, f"report should be one of {REPORTS}"
+
+        start = time.perf_counter()
+        Products, Time, Scenarios = self.Products, self.Time, self.Scenarios
+        Probability = self.Probability
+
+        # Products Per Substrate. Note: In our data Height<Width for all products, i.e. all
+        # products are oriented to be horizontal.
+        if PoS is None:
+            PoS = scenarioPoS(self.geometries, h, w)
+
+        # Revenue per substrate of every product in every scenario and year, and the expected
+        # sales minus substrate cost per substrate, which determines which markets are profitable
+        # in option 2
+        Revenue = self.PriceYield*PoS['num_products'][:, :, np.newaxis]
+        Profit = (np.einsum('s,spt->pt', Probability, Revenue) -
+                  (w*h)*(Probability @ self.SubstrateCost))
+
+        # Expected NPV per substrate of every product in every year. The NPV of every scenario is
+        # affine in the production plan, so the expected NPV is as well.
+        Coefficients = (np.einsum('s,spt,st->pt', Probability, Revenue, self.Weights['Revenue']) -
+                        (w*h)*(Probability @ (self.SubstrateCost*self.Weights['Substrate'])))
+        constant = Probability @ self.Weights['Constant']
+
+        solution = None
+        if self.closed_form:
+            solution = solveClosedForm(Coefficients, constant, self.Capacity, option=self.option,
+                                       product_thresholds=self.product_thresholds)
+
+        if solution is None:
+            if self.option == 2:
+                profitable = _profitableMarkets(self.Data['Market'], Profit)
+                if self.profitable is None or np.any(profitable != self.profitable):
+                    self.model.setConstraints('Market threshold', *_marketMatrix(
+                        self.Data['Market'], profitable, self.Capacity, self.product_thresholds))
+                    self.profitable = profitable
+
+            if self.formulation == 'expected' and self.option == 4:
+                # Shortfall[s] - eta + NPV[s] >= 0, where NPV[s] is the NPV of scenario s in terms
+                # of the production plan
+                npv = sp.csr_matrix((Revenue*self.Weights['Revenue'][:, np.newaxis] -
+                                     (w*h)*(self.SubstrateCost*self.Weights['Substrate']
+                                            )[:, np.newaxis]).reshape(Scenarios, -1))
+                npv.eliminate_zeros()
+                self.model.setConstraints('CVaR shortfall', sp.hstack([
+                    npv, sp.csr_matrix(-np.ones((Scenarios, 1))), sp.identity(Scenarios)],
+                    format='csr'), '>', -self.Weights['Constant'])
+                self.model.setObjective(np.concatenate([(1-self.weight)*Coefficients.ravel(),
+                                                        self.weight*self.cvar]),
+                                        (1-self.weight)*constant)
+            elif self.formulation == 'expected':
+                # Only the production plan has to be optimised
+                self.model.setObjective(Coefficients.ravel(), constant)
             else:
-                # Products are placed vertically
-                PoS[s][p] = {'num_width': num_width_vert,
-                             'num_height': num_height_vert,
-                             'num_products': num_products_vert,
-                             'product_orientation': 'vert'}
-    # Profit Table
-    COS11 = {}  # Costs per substate per time (cost for alle products equal)
-    Sales11 = {}  # Sales per substrate per product per time
-    Profit1 = {}  # Is product profitable?
-
-    for t in range(Time):
-        for p in range(Products):
-            COS11[t] = (1/Scenarios)*sum(Data[s]['SubstrateCost'].iloc[0, t]*(w*h)
-                                         for s in range(Scenarios))
-            Sales11[p, t] = (1/Scenarios)*sum(Data[s]['ProductPrice'].iloc[p, t+2] *
-                                              Data[s]['Yield'].iloc[p, t+4] *
-                                              PoS[s][p]['num_products']
-                                              for s in range(Scenarios))
-            Profit1[p, t] = Sales11[p, t] - COS11[t]
-
-    # INITIALIZE MODEL
-    m = gb.Model('PBAS')
-    if not verbose:
-        m.setParam('OutputFlag', False)
-
-    # VARIABLES
-    x = m.addVars(Products, Time, vtype=gb.GRB.INTEGER, lb=0,
-                  name='Substrate per product over time')
-    GM = m.addVars(Scenarios, Time, vtype=gb.GRB.CONTINUOUS, name='GrossMargin')
-    OM = m.addVars(Scenarios, Time, vtype=gb.GRB.CONTINUOUS, name='Operating Margin')
-    Sales = m.addVars(Scenarios, Time, vtype=gb.GRB.CONTINUOUS, name='Sales')
-    CostofSales = m.addVars(Scenarios, Time, vtype=gb.GRB.CONTINUOUS, name='Cost of Sales')
-    COS2 = m.addVars(Scenarios, Time, vtype=gb.GRB.CONTINUOUS,
-                     name='Cost of Sales without depreciation')
-    NI = m.addVars(Scenarios, Time, vtype=gb.GRB.CONTINUOUS, name='Net Income')
-    NCF = m.addVars(Scenarios, Time+1, vtype=gb.GRB.CONTINUOUS, name='Net Cash Flow')
-    NPV = m.addVars(Scenarios, Time+1, vtype=gb.GRB.CONTINUOUS, name='Net Present Value')
-    CCC = m.addVars(Scenarios, vtype=gb.GRB.CONTINUOUS, name='Cash Conversion Cycle')
-    WC = m.addVars(Scenarios, Time, vtype=gb.GRB.CONTINUOUS, name='Working Capital')
-    DWC = m.addVars(Scenarios, Time+1, vtype=gb.GRB.CONTINUOUS, name='Delta Working Capital')
-    NPVperScenario = m.addVars(Scenarios, vtype=gb.GRB.CONTINUOUS, name='NPV per Scenario')
-
-    # CONSTRAINTS
-    for t in range(Time):
-        m.addConstr(quicksum(x[p, t] for p in range(Products)) <= Data[0]
-                    ['MaxCapacity']*12, name='Yearly Substrate Capacity')
+                # Sales[s, t] is the revenue per substrate times the production of every product
+                # and COS[s, t] the substrate cost times the total production, as rows over all
+                # variables
+                scenario, product, year = np.indices(Revenue.shape).reshape(3, -1)
+                identity = sp.identity(Scenarios*Time, format='csr')
+                zeros = sp.csr_matrix((Scenarios*Time, Scenarios*Time))
+                plan = sp.csr_matrix((Revenue.ravel(),
+                                      (scenario*Time + year, product*Time + year)),
+                                     shape=(Scenarios*Time, Products*Time))
+                plan.eliminate_zeros()
+                self.model.setConstraints('Sales constraint',
+                                          sp.hstack([-plan, identity, zeros], format='csr'), '=',
+                                          np.zeros(Scenarios*Time))
 
-    if option == 2:
-        # Per market, check if there is any positive profitability. If so, require that at least a
-        # certain percentage of the production is in that market. In effect, this means that the
-        # most profitable product in that market gets produced.
-        for t in range(Time):
-            for p in Notebook:
-                if Profit1[p, t] > 0:
-                    m.addConstr(quicksum(x[p, t] for p in Notebook) >=
-                                product_thresholds['notebooks']*Data[0]['MaxCapacity']*12)
-                    break  # We only need one product to be profitable to add this constraint
-            for p in Monitor:
-                if Profit1[p, t] > 0:
-                    m.addConstr(quicksum(x[p, t] for p in Monitor) >=
-                                product_thresholds['monitors']*Data[0]['MaxCapacity']*12)
-                    break  # Dito
-            for p in Television:
-                if Profit1[p, t] > 0:
-                    m.addConstr(quicksum(x[p, t] for p in Television) >=
-                                product_thresholds['televisions']*Data[0]['MaxCapacity']*12)
-                    break  # Dito
+                total = sp.kron(np.ones((Scenarios, Products)), sp.identity(Time),
+                                format='csr')
+                plan = sp.diags(self.SubstrateCost.ravel()*(w*h)) @ total
+                self.model.setConstraints('Cost of Sales without depreciation',
+                                          sp.hstack([-plan, zeros, identity], format='csr'), '=',
+                                          np.zeros(Scenarios*Time))
+
+            build_time = self.build_time + time.perf_counter() - start
+
+            # RUN OPTIMIZATION, starting from the production plan of the previous substrate size
+            values, average_npv, ModelStatistics = self.model.solve(self.production)
+            production = values[:Products*Time].reshape(Products, Time).round()
+
+            # In option 4, the objective value is not the expected NPV
+            if self.option == 4:
+                average_npv = (Coefficients*production).sum() + constant
+        else:
+            build_time = self.build_time + time.perf_counter() - start
+            production, average_npv, ModelStatistics = solution
+
+        self.build_time = 0
+        self.production = production
+        ModelStatistics['Build time'] = build_time
+
+        return self._results(h, w, PoS, Revenue, self.production, average_npv, ModelStatistics,
+                             report)
+
+    def _results(self, h, w, PoS, Revenue, production, average_npv, ModelStatistics, report):
+        """Returns the results of `NPV_SAA` for a production plan."""
+
+        Data, Probability = self.Data, self.Probability
+        NumProducts = PoS['num_products']
+        Weights = self.Weights
+
+        results = {'Average NPV': average_npv,
+                   'Width': w,
+                   'Height': h,
+                   'ModelStatistics': ModelStatistics}
+        if report == 'none' and self.option != 4:
+            return results
+
+        # NPV of every scenario
+        NPVs = (np.einsum('spt,st,pt->s', Revenue, Weights['Revenue'], production) -
+                (w*h)*np.einsum('st,st,t->s', self.SubstrateCost, Weights['Substrate'],
+                                production.sum(axis=0)) + Weights['Constant'])
+
+        if self.option == 4:
+            results['CVaR'] = conditionalValueAtRisk(NPVs, Probability,
+                                                     self.product_thresholds['alpha'])
+            if report == 'none':
+                return results
+
+        results.update({'NPVs': list(NPVs),
+                        'NPVmax': NPVs.max(),
+                        'NPVmin': NPVs.min(),
+                        '#NegativeScenarios': int((NPVs < 0).sum())})
+        if report == 'summary':
+            return results
+
+        # Production Table
+        Formats = pd.Index(Data['Format'], name='Format')
+        Years = pd.Index(Data['InvestmentYears'], dtype=object)
+        ProductProduction = pd.DataFrame(production, index=Formats, columns=Years)
+        TotalProduction = pd.DataFrame([production.sum(axis=0)], index=['Total Production'],
+                                       columns=Years)
+        Production = pd.concat([ProductProduction, TotalProduction])
+
+        # Profit and Loss Statement, the expectation of the P&L of every scenario
+        PL = plByYear({item: Probability @ values for item, values in
+                       _scenarioPL(Data, Revenue, NumProducts, production, h, w).items()})
+
+        results.update({'PL': PL,
+                        'Production': Production,
+                        'POS': PoS})
+
+        return results
+
+
+def conditionalValueAtRisk(npvs, probabilities=None, alpha=0.05):
+    """
+    Computes the CVaR of the NPVs, the expected NPV of the worst scenarios of probability alpha
+
+    Parameters
+    ----------
+    npvs : array-like
+        NPV of every scenario
+    probabilities : array-like
+        Probability of every scenario. By default, all scenarios are equally likely.
+    alpha : float
+        Probability of the worst scenarios
+
+    Returns
+    -------
+    float
+    """
+
+    npvs = np.asarray(npvs, dtype=float)
+    probabilities = checkProbabilities(probabilities, len(npvs))
+    assert 0 < alpha <= 1, "alpha should be a number in (0, 1]"
+
+    # The worst scenarios count with their full probability, until the probability alpha is reached
+    order = np.argsort(npvs)
+    cumulative = np.cumsum(probabilities[order])
+    tail = np.clip(alpha - (cumulative - probabilities[order]), 0, probabilities[order])
+
+    return tail @ npvs[order]/alpha
+
+
+def npvWeights(Data, Time):
+    """
+    Computes the weights of the revenue and the substrate cost in the NPV of every scenario
+
+    The NPV of a scenario is the discounted net cash flow, including the working capital that is
+    built up in every year and released in the year after the horizon. Per year, it is the revenue
+    times its weight minus the substrate cost times its weight plus a part that does not depend on
+    the production plan.
+
+    Parameters
+    ----------
+    Data : dict or Mapping
+        Stacked scenario arrays, see `DataFunction.asScenarioArrays`
+    Time : int
+        Number of years
+
+    Returns
+    -------
+    dict
+        'Revenue': weight of the revenue per scenario per year. 'Substrate': weight of the
+        substrate cost per scenario per year. 'Constant': NPV per scenario that does not depend on
+        the production plan.
+    """
+
+    RD = np.asarray(Data['R&D'])[:, np.newaxis]
+    SGA = np.asarray(Data['SG&A'])[:, np.newaxis]
+    TaxRate = np.asarray(Data['TaxRate'])[:, np.newaxis]
+    CCC = ((np.asarray(Data['DIO'])+np.asarray(Data['DSO'])-np.asarray(Data['DPO']))/365
+           )[:, np.newaxis]
+    Depreciation = np.asarray(Data['Depreciation'])[:, :Time]
+    InvestmentCost = np.asarray(Data['InvestmentCost'])[:, :Time]
+    discount = 1/(1+Data['WACC'])**np.arange(Time+1)
+
+    return {'Revenue': (1-TaxRate)*(1-RD-SGA)*discount[:Time] - CCC*(discount[:Time]-discount[1:]),
+            'Substrate': (1-TaxRate)*discount[:Time],
+            'Constant': ((TaxRate*Depreciation - InvestmentCost)*discount[:Time]).sum(axis=1)}
+
+
+def plWeights(Data, Time):
+    """
+    Computes the weights of the revenue and the substrate cost in the sums of the P&L
+
+    Every line item of the P&L of a scenario is a sum of the revenue and the substrate cost, each
+    times a weight that depends on the scenario, and parts that do not depend on the production
+    plan (see `plLineItems`).
+
+    Parameters
+    ----------
+    Data : dict or Mapping
+        Stacked scenario arrays, see `DataFunction.asScenarioArrays`
+    Time : int
+        Number of years
+
+    Returns
+    -------
+    dict
+        'Revenue': weights of the revenue per scenario per weight of `REVENUE_WEIGHTS` per year.
+        'Substrate': weights of the substrate cost per scenario per weight of
+        `SUBSTRATE_WEIGHTS` per year. 'Constant': NPV per scenario that does not depend on the
+        production plan, see `npvWeights`.
+    """
+
+    weights = npvWeights(Data, Time)
+    margin = (1-np.asarray(Data['R&D'])-np.asarray(Data['SG&A']))[:, np.newaxis]
+    after_tax = (1-np.asarray(Data['TaxRate']))[:, np.newaxis]
+    CCC = ((np.asarray(Data['DIO'])+np.asarray(Data['DSO'])-np.asarray(Data['DPO']))/365
+           )[:, np.newaxis]
+    ones = np.ones((len(margin), Time))
+
+    return {'Revenue': np.stack(np.broadcast_arrays(ones, margin, after_tax*margin, CCC,
+                                                    weights['Revenue']), axis=1),
+            'Substrate': np.stack(np.broadcast_arrays(ones, after_tax, weights['Substrate']),
+                                  axis=1),
+            'Constant': weights['Constant']}
+
+
+def plLineItems(revenue, substrate, GlassLoss, production, SubstrateCost, Depreciation,
+                NIDepreciation, InvestmentCost, RD, SGA, TaxRate, CCC, discount):
+    """
+    Computes the line items of the P&L and cash flow statement of a production plan
+
+    All line items are linear in the arguments, so this computes the P&L of every scenario from
+    arrays per scenario (`NPV_SAA`) as well as the expected P&L from expected arrays
+    (`StreamFunction.NPV_stream`). The arguments per year have the years as their last axis, and
+    all arguments have the same leading axes, if any.
+
+    Parameters
+    ----------
+    revenue : np.ndarray
+        Revenue of the plan times every weight of `REVENUE_WEIGHTS` (weights x years)
+    substrate : np.ndarray
+        Substrate cost of the plan times every weight of `SUBSTRATE_WEIGHTS` (weights x years)
+    GlassLoss : np.ndarray
+        Share of the substrate area that is lost per product
+    production : np.ndarray
+        Number of substrates per product (rows) per year (columns)
+    SubstrateCost : np.ndarray
+        Cost per substrate per year
+    Depreciation, NIDepreciation, InvestmentCost : np.ndarray
+        Depreciation, depreciation after tax and investment cost per year
+    RD, SGA, TaxRate, CCC : float or np.ndarray
+        Rates of R&D, SG&A and tax, and the cash conversion cycle in years
+    discount : np.ndarray
+        Discount factor of every year, including the year after the horizon
+
+    Returns
+    -------
+    dict
+        Array per line item of `PL_ITEMS` of the leading axes x years, with an extra year for
+        'DWC', 'NCF' and 'NPV'
+    """
+
+    Time = production.shape[1]
+    Sales = revenue[..., REVENUE_WEIGHTS.index('Sales'), :]
+    COS = substrate[..., SUBSTRATE_WEIGHTS.index('COS'), :]
+
+    # Share of the substrate area that is lost per product, averaged over the products weighted by
+    # their production. It is zero in years without production.
+    TotalProduction = production.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        PercentageGlassLoss = np.where(TotalProduction > 0,
+                                       (GlassLoss @ production)/TotalProduction, 0)
+
+    CostofSales = COS + Depreciation
+    GM = Sales - CostofSales
+    OM = revenue[..., REVENUE_WEIGHTS.index('OM'), :] - CostofSales
+    NI = (revenue[..., REVENUE_WEIGHTS.index('NI'), :] -
+          substrate[..., SUBSTRATE_WEIGHTS.index('NI'), :] - NIDepreciation)
+    WC = revenue[..., REVENUE_WEIGHTS.index('WC'), :]
+    padding = [(0, 0)]*(WC.ndim - 1)
+    DWC = np.pad(WC, padding + [(0, 1)]) - np.pad(WC, padding + [(1, 0)])
+    NCF = np.concatenate([NI + Depreciation - DWC[..., :Time] - InvestmentCost,
+                          -DWC[..., Time:]], axis=-1)
+
+    def perYear(rate):
+        return np.broadcast_to(np.asarray(rate, dtype=float)[..., np.newaxis], Sales.shape).copy()
+
+    return {'PercentageGlassLoss': PercentageGlassLoss,
+            'SubstrateCost': np.broadcast_to(SubstrateCost, Sales.shape).copy(),
+            'SALES': Sales, 'COS': COS, 'CostofSales': CostofSales, 'GM': GM, 'RD': perYear(RD),
+            'SG&A': perYear(SGA), 'OM': OM, 'TAX': perYear(TaxRate), 'NI': NI, 'WC': WC,
+            'Depreciation': Depreciation, 'CAPEX': InvestmentCost, 'CCC': perYear(CCC),
+            'NPV': NCF*discount, 'NCF': NCF, 'DWC': DWC}
+
+
+def plByYear(items):
+    """
+    Arranges expected line items per year, as the 'PL' of `NPV_SAA`
+
+    Parameters
+    ----------
+    items : dict
+        Expected value per year per line item, see `plLineItems`
+
+    Returns
+    -------
+    dict
+        Dictionary with per year a dictionary of the line items
+    """
 
-    if option == 3:
-        for p in range(Products):
-            for t in range(2, Time):
-                m.addConstr(x[p, t] >= product_thresholds*Data[0]['MaxCapacity']*12)
-
-    for s in range(Scenarios):
-        for t in range(Time):
-            m.addConstr(Sales[s, t] == quicksum(
-                Data[s]['ProductPrice'].iloc[p, t+2] *
-                Data[s]['Yield'].iloc[p, t+4]*PoS[s][p]['num_products']*x[p, t]
-                for p in range(Products)), name='Sales constraint')
-
-            m.addConstr(CostofSales[s, t] == quicksum(
-                Data[s]['SubstrateCost'].iloc[0, t]*(w*h)*x[p, t] for p in range(Products)) +
-                Data[s]['Depreciation'].iloc[0, t], name='Cost of Sales constraint')
-
-            # Cost of sales without depreciation (needed for P&L)
-            m.addConstr(COS2[s, t] == quicksum(
-                Data[s]['SubstrateCost'].iloc[0, t]*(w*h)*x[p, t] for p in range(Products)),
-                name='Cost of Sales without depreciation')
-
-        # Continue for loop over s for variables
-        CCC[s] = (Data[s]['DIO']+Data[s]['DSO']-Data[s]['DPO'])/365
-        DWC[s, 0] = WC[s, 0]
-
-        for t in range(Time):
-            GM[s, t] = Sales[s, t]-CostofSales[s, t]
-            OM[s, t] = GM[s, t] - Sales[s, t]*(Data[s]['R&D']+Data[s]['SG&A'])
-            NI[s, t] = (1-Data[s]['TaxRate'])*OM[s, t]
-            WC[s, t] = Sales[s, t]*CCC[s]
-
-        for t in range(1, Time):
-            DWC[s, t] = WC[s, t]-WC[s, t-1]
-
-        for t in range(Time):
-            NCF[s, t] = (NI[s, t] + Data[s]['Depreciation'].iloc[0, t] - DWC[s, t] -
-                         Data[s]['InvestmentCost'].iloc[0, t])
-
-            NPV[s, t] = NCF[s, t]/((1+Data[s]['WACC'])**t)
-
-    for s in range(Scenarios):
-        DWC[s, Time] = -WC[s, Time-1]
-        NCF[s, Time] = -DWC[s, Time]
-        NPV[s, Time] = NCF[s, Time]/((1+Data[s]['WACC'])**Time)
-        NPVperScenario[s] = quicksum(NPV[s, t] for t in range(Time+1))
-    # OBJECTIVE
-    obj = (1/Scenarios)*quicksum(quicksum(NPV[s, t]
-                                          for s in range(Scenarios)) for t in range(Time+1))
-    m.setObjective(obj, gb.GRB.MAXIMIZE)
-
-    # RUN OPTIMIZATION
-    m.optimize()
-
-    NPVs = [NPVperScenario[s].getValue() for s in range(Scenarios)]
-    NPVmax = max(NPVs)
-    NPVmin = min(NPVs)
-
-    # Count negative scenarios
-    NegativeScenario = sum(1 for npv in NPVs if npv < 0)
-
-    # Production Table
-    ProductProduction = pd.DataFrame(np.zeros((Products, Time)), index=Data[0]['Yield']['Format'],
-                                     columns=Data[0]['InvestmentCost'].columns)
-    TotalProduction = pd.DataFrame(np.zeros((1, Time)), index=['Total Production'],
-                                   columns=Data[0]['InvestmentCost'].columns)
-
-    for p in range(Products):
-        for t in range(Time):
-            ProductProduction.iloc[p, t] = int(x[p, t].x)
-
-    for t in range(Time):
-        TotalProduction.iloc[0, t] = int(quicksum(x[p, t].x for p in range(Products)).getValue())
-
-    Production = pd.concat([ProductProduction, TotalProduction])
-    
-    # Number of products Sold (average over all scenarios so this can be noninteger!)
-    NumberofProducts = pd.DataFrame(np.zeros((Products, Time)), index=Data[0]['Yield']['Format'],
-                                    columns=Data[0]['InvestmentCost'].columns)
-    PriceProducts = pd.DataFrame(np.zeros((Products, Time)), index=Data[0]['Yield']['Format'],
-                                 columns=Data[0]['InvestmentCost'].columns)
-
-    for p in range(Products):
-        for t in range(Time):
-            NumberofProducts.iloc[p, t] = (Production.iloc[p, t] * (1/Scenarios) *
-                                           sum(PoS[s][p]['num_products']
-                                               for s in range(Scenarios)) *
-                                           (1/Scenarios)*sum(Data[s]['Yield'].iloc[p, t+4]
-                                                             for s in range(Scenarios)))
-            PriceProducts.iloc[p, t] = ((1/Scenarios)*sum(Data[s]['ProductPrice'].iloc[p, t+2]
-                                                          for s in range(Scenarios)))
-
-    # Glass loss
-    AverageProductWidth = [(1/Scenarios)*sum(Data[s]['ProductSize'].loc[p, 'Width (m)']
-                                             for s in range(Scenarios)) for p in range(Products)]
-    AverageProductHeight = [(1/Scenarios)*sum(Data[s]['ProductSize'].loc[p, 'Height (m)']
-                                              for s in range(Scenarios)) for p in range(Products)]
-
-    GlassLossPr = [((w*h)-(1/Scenarios)*sum(
-        PoS[s][p]['num_products'] 
-        for s in range(Scenarios))*AverageProductWidth[p]*AverageProductHeight[p])/(w*h)
-        for p in range(Products)]
-    TotalGlassLoss = (np.zeros((Time)))
-    
-    for t in range(2, Time):
-        TotalGlassLoss[t] = sum(
-            GlassLossPr[p]*x[p, t].x for p in range(Products))/TotalProduction.iloc[0, t]
-
-    # Profit and Loss Statement
     PL = collections.defaultdict(dict)
-    for t in range(Time):
-        PL[t]['PercentageGlassLoss'] = TotalGlassLoss[t]
-        PL[t]['SubstrateCost'] = ((1/Scenarios)*sum(Data[s]['SubstrateCost'].iloc[0, t]*(w*h)
-                                                    for s in range(Scenarios)))
-        PL[t]['SALES'] = ((1/Scenarios)*quicksum(Sales[s, t].X
-                                                 for s in range(Scenarios))).getValue()
-        PL[t]['COS'] = ((1/Scenarios)*quicksum(COS2[s, t].X
-                                               for s in range(Scenarios))).getValue()
-        PL[t]['CostofSales'] = ((1/Scenarios)*quicksum(CostofSales[s, t].X
-                                                       for s in range(Scenarios))).getValue()
-        PL[t]['GM'] = ((1/Scenarios)*quicksum(GM[s, t].getValue()
-                                              for s in range(Scenarios))).getValue()
-        PL[t]['RD'] = ((1/Scenarios)*quicksum(Data[s]['R&D']
-                                              for s in range(Scenarios))).getValue()
-        PL[t]['SG&A'] = ((1/Scenarios)*quicksum(Data[s]['SG&A']
-                                                for s in range(Scenarios))).getValue()
-        PL[t]['OM'] = ((1/Scenarios)*quicksum(OM[s, t].getValue()
-                                              for s in range(Scenarios))).getValue()
-        PL[t]['TAX'] = ((1/Scenarios)*quicksum(Data[s]['TaxRate']
-                                               for s in range(Scenarios))).getValue()
-        PL[t]['NI'] = ((1/Scenarios)*quicksum(NI[s, t].getValue()
-                                              for s in range(Scenarios))).getValue()
-        PL[t]['WC'] = ((1/Scenarios)*quicksum(WC[s, t].getValue()
-                                              for s in range(Scenarios))).getValue()
-        PL[t]['Depreciation'] = ((1/Scenarios)*quicksum(Data[s]['Depreciation'].iloc[0, t]
-                                                        for s in range(Scenarios))).getValue()
-        PL[t]['CAPEX'] = ((1/Scenarios)*quicksum(Data[s]['InvestmentCost'].iloc[0, t]
-                                                 for s in range(Scenarios))).getValue()
-        PL[t]['CCC'] = (1/Scenarios)*(quicksum(CCC[s] for s in range(Scenarios))).getValue()
-
-    for t in range(Time+1):
-        PL[t]['NPV'] = ((1/Scenarios)*quicksum(NPV[s, t].getValue()
-                                               for s in range(Scenarios))).getValue()
-        PL[t]['NCF'] = ((1/Scenarios)*quicksum(NCF[s, t].getValue()
-                                               for s in range(Scenarios))).getValue()
-        PL[t]['DWC'] = (1/Scenarios)*(quicksum(DWC[s, t] for s in range(Scenarios))).getValue()
-
-    return {'Average NPV': obj.getValue(),
-            'NPVmax': NPVmax,
-            'NPVmin': NPVmin,
-            'NPVs': NPVs,
-            'Width': w,
-            'Height': h,
-            '#NegativeScenarios': NegativeScenario,
-            'PL': PL,
-            'Production': Production,
-            'POS': PoS}
+    for item, values in items.items():
+        for t, value in enumerate(values):
+            PL[t][item] = value
+
+    return PL
+
+
+def evaluatePlan(Data, production, h, w, PoS=None):
+    """
+    Computes the P&L and cash flow line items of every scenario for a fixed production plan
+
+    This uses the same accounting as `NPV_SAA` without building a model, so a plan can be
+    evaluated on many more scenarios than it was optimised on, e.g. chunk by chunk of a
+    `StreamFunction.ScenarioGenerator` (see `ValidationFunction.outOfSample`).
+
+    Parameters
+    ----------
+    Data : dict or Mapping
+        Scenarios, see `NPV_SAA`
+    production : array-like
+        Number of substrates per product (rows) per year (columns)
+    h : float
+        Height of the substrate
+    w : float
+        Width of the substrate
+    PoS : dict
+        Products per substrate of every product in every scenario, see `NPV_SAA`
+
+    Returns
+    -------
+    dict
+        Array of scenarios x years per line item of `PL_ITEMS`, with an extra year for 'DWC', 'NCF'
+        and 'NPV', and 'NPVs', the NPV of every scenario
+    """
+
+    Data = asScenarioArrays(Data)
+    production = np.asarray(production, dtype=float)
+    Time = production.shape[1]
+
+    if PoS is None:
+        PoS = scenarioPoS(productGeometries(Data['Width (m)'], Data['Height (m)']), h, w)
+
+    # Revenue per substrate of every product in every scenario and year, as in `SAAModel.solve`
+    Revenue = (np.asarray(Data['ProductPrice'])[:, :, :Time] *
+               np.asarray(Data['Yield'])[:, :, :Time]*PoS['num_products'][:, :, np.newaxis])
+
+    PL = _scenarioPL(Data, Revenue, PoS['num_products'], production, h, w)
+    PL['NPVs'] = PL['NPV'].sum(axis=1)
+
+    return PL
+
+
+def _scenarioPL(Data, Revenue, NumProducts, production, h, w):
+    """
+    Computes the P&L and cash flow line items of every scenario for a production plan
+
+    Parameters
+    ----------
+    Data : dict or Mapping
+        Stacked scenario arrays, see `DataFunction.asScenarioArrays`
+    Revenue : np.ndarray
+        Revenue per substrate per scenario per product per year
+    NumProducts : np.ndarray
+        Number of products per substrate per scenario per product
+    production : np.ndarray
+        Number of substrates per product (rows) per year (columns)
+    h : float
+        Height of the substrate
+    w : float
+        Width of the substrate
+
+    Returns
+    -------
+    dict
+        Array of scenarios x years per line item of `PL_ITEMS`, with an extra year for 'DWC', 'NCF'
+        and 'NPV'
+    """
+
+    Time = production.shape[1]
+    Depreciation = np.asarray(Data['Depreciation'])[:, :Time]
+    TaxRate = np.asarray(Data['TaxRate'])
+    SubstrateCost = np.asarray(Data['SubstrateCost'])[:, :Time]*(w*h)
+    weights = plWeights(Data, Time)
+
+    Sales = np.einsum('spt,pt->st', Revenue, production)
+    COS = SubstrateCost*production.sum(axis=0)
+    GlassLoss = 1 - NumProducts*np.asarray(Data['Width (m)'])*np.asarray(Data['Height (m)'])/(w*h)
+
+    return plLineItems(Sales[:, np.newaxis]*weights['Revenue'],
+                       COS[:, np.newaxis]*weights['Substrate'], GlassLoss, production,
+                       SubstrateCost, Depreciation, (1-TaxRate)[:, np.newaxis]*Depreciation,
+                       np.asarray(Data['InvestmentCost'])[:, :Time], np.asarray(Data['R&D']),
+                       np.asarray(Data['SG&A']), TaxRate,
+                       (np.asarray(Data['DIO'])+np.asarray(Data['DSO']) -
+                        np.asarray(Data['DPO']))/365,
+                       1/(1+Data['WACC'])**np.arange(Time+1))
+
+
+def _planBounds(Products, Time, capacity, option, product_thresholds):
+    """
+    Returns the lower bounds of the production plan, flattened product by product
+
+    In option 3, the minimum production of every product from the third year on is a lower bound
+    of the variables rather than a constraint.
+    """
+
+    lb = np.zeros((Products, Time))
+    if option == 3:
+        lb[:, 2:] = product_thresholds*capacity
+
+    return lb.ravel()
+
+
+def _capacityMatrix(Products, Time):
+    """Returns the matrix of the total production per year of a plan, flattened by product."""
+    return sp.kron(np.ones((1, Products)), sp.identity(Time), format='csr')
+
+
+def _profitableMarkets(market, profit):
+    """
+    Returns per market of `MARKET_THRESHOLDS` (rows) per year (columns) whether any product in
+    that market is profitable, given the expected sales minus substrate cost per substrate
+    """
+    return np.array([np.any(profit[market == market_name] > 0, axis=0)
+                     for market_name in MARKET_THRESHOLDS.values()])
+
+
+def _marketMatrix(market, profitable, capacity, product_thresholds):
+    """
+    Returns the market constraints of option 2 as a matrix, sense and right-hand side
+
+    Per market, if any product is profitable, require that at least a certain percentage of the
+    production is in that market. In effect, this means that the most profitable product in that
+    market gets produced.
+    """
+
+    Time = profitable.shape[1]
+    Products = len(market)
+
+    rows, cols, rhs = [], [], []
+    for (key, market_name), years in zip(MARKET_THRESHOLDS.items(), profitable):
+        products = np.flatnonzero(market == market_name)
+        for t in np.flatnonzero(years):
+            rows.extend([len(rhs)]*len(products))
+            cols.extend(products*Time + t)
+            rhs.append(product_thresholds[key]*capacity)
+
+    return (sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(rhs), Products*Time)),
+            '>', np.array(rhs))
+
+
+class _GurobiModel:
+    """
+    Maximisation model in Gurobi with the variables of `lb` and `integrality`, which is kept
+    between solves such that only changed constraints and objective coefficients are passed
+    """
+
+    def __init__(self, lb, integrality, verbose, threads=None):
+        self.m = gb.Model('PBAS')
+        if not verbose:
+            self.m.setParam('OutputFlag', False)
+        if threads is not None:
+            self.m.setParam('Threads', threads)
+
+        self.x = self.m.addMVar(len(lb), lb=lb, vtype=np.where(integrality, gb.GRB.INTEGER,
+                                                                gb.GRB.CONTINUOUS))
+        self.m.ModelSense = gb.GRB.MAXIMIZE
+        self.constraints = {}
+
+    def setObjective(self, c, constant):
+        self.x.Obj = c
+        self.m.ObjCon = constant
+
+    def setLowerBounds(self, lb):
+        self.x[:len(lb)].LB = lb
+
+    def setConstraints(self, name, A, sense, rhs):
+        """Adds the constraints A x (sense) rhs, replacing earlier constraints of that name."""
+        if self.constraints.get(name) is not None:
+            self.m.remove(self.constraints[name])
+
+        self.constraints[name] = None
+        if A.shape[0] > 0:
+            A = sp.hstack([A, sp.csr_matrix((A.shape[0], self.x.shape[0] - A.shape[1]))],
+                          format='csr')
+            self.constraints[name] = self.m.addMConstr(A, self.x, sense, rhs, name=name)
+
+    def solve(self, start=None):
+        """Solves the model, starting from the values `start` of the first variables."""
+        if start is not None:
+            self.x[:start.size].Start = start.ravel()
+
+        self.m.optimize()
+
+        return self.x.X, self.m.ObjVal, {'Method': 'gurobi', 'Rows': self.m.NumConstrs,
+                                         'Columns': self.m.NumVars, 'Nonzeros': self.m.NumNZs,
+                                         'Solve time': self.m.Runtime, 'Nodes': self.m.NodeCount}
+
+
+class _HighsModel:
+    """
+    Maximisation model that is solved with HiGHS through `scipy.optimize.milp`, with the same
+    methods as `_GurobiModel`. HiGHS is called from scratch in every solve, without a start.
+    """
+
+    def __init__(self, lb, integrality, verbose, threads=None):
+        self.lb = lb
+        self.integrality = integrality
+        self.verbose = verbose
+        self.c = np.zeros(len(lb))
+        self.constant = 0
+        self.constraints = {}
+
+    def setObjective(self, c, constant):
+        self.c = np.concatenate([c, np.zeros(len(self.lb) - len(c))])
+        self.constant = constant
+
+    def setLowerBounds(self, lb):
+        self.lb = np.concatenate([lb, self.lb[len(lb):]])
+
+    def setConstraints(self, name, A, sense, rhs):
+        A = sp.hstack([A, sp.csr_matrix((A.shape[0], len(self.lb) - A.shape[1]))], format='csr')
+        self.constraints[name] = LinearConstraint(A, np.where(sense == '<', -np.inf, rhs),
+                                                  np.where(sense == '>', np.inf, rhs))
+
+    def solve(self, start=None):
+        constraints = [constraint for constraint in self.constraints.values()
+                       if constraint.A.shape[0] > 0]
+
+        start_time = time.perf_counter()
+        result = milp(-self.c, integrality=self.integrality,
+                      bounds=Bounds(self.lb, np.inf), constraints=constraints,
+                      options={'disp': self.verbose})
+        solve_time = time.perf_counter() - start_time
+
+        if not result.success:
+            raise RuntimeError(f"HiGHS did not find an optimal solution: {result.message}")
+
+        return result.x, -result.fun + self.constant, {
+            'Method': 'highs', 'Rows': sum(constraint.A.shape[0] for constraint in constraints),
+            'Columns': len(self.lb),
+            'Nonzeros': sum(constraint.A.nnz for constraint in constraints),
+            'Solve time': solve_time, 'Nodes': getattr(result, 'mip_node_count', None)}
+
+
+# Models per solver. Both are maximisation models with the variables given by their lower bounds
+# (without upper bounds) and integrality, optionally with a number of threads, and with the
+# methods `setObjective(c, constant)`, `setLowerBounds(lb)`, which replaces the lower bounds of the
+# first variables, `setConstraints(name, A, sense, rhs)`, which replaces the constraints of that
+# name, and `solve(start)`, which returns the values of the variables, the objective value and
+# statistics.
+SOLVER_MODELS = {'gurobi': _GurobiModel, 'highs': _HighsModel}
+SOLVERS = list(SOLVER_MODELS)
+
+
+def checkSolver(solver):
+    """Checks that the solver is available."""
+    assert solver in SOLVERS, f"solver should be one of {SOLVERS}"
+    assert solver != 'gurobi' or gb is not None, "gurobipy is not installed, use solver='highs'"
+
+
+def solveClosedForm(coefficients, constant, capacity, option=1, product_thresholds=None,
+                    rtol=1e-9):
+    """
+    Maximises an expected NPV as `solveExpectedNPV` without a solver, for options 1 and 3
+
+    In options 1 and 3, the only constraint that links the products is the capacity of every year,
+    so the years are independent. In every year, the optimal plan produces the minimum of every
+    product (option 3) and spends the remaining capacity on the product with the highest expected
+    NPV per substrate, if that is positive. This also holds for the baseline, which is a single
+    scenario.
+
+    The plan is proven optimal by the bound of the dual of the LP relaxation, in which the price of
+    the capacity of a year is the highest positive expected NPV per substrate. If the plan does not
+    attain the bound, e.g. because the capacity is not integer, or if the minimum production
+    exceeds the capacity, None is returned and the MIP should be solved instead.
+
+    Parameters
+    ----------
+    coefficients, constant, capacity, option, product_thresholds
+        See `solveExpectedNPV`
+    rtol : float
+        Relative tolerance of the difference between the NPV of the plan and the bound
+
+    Returns
+    -------
+    tuple or None
+        As `solveExpectedNPV`, or None if the option is 2 or 4 or the plan cannot be proven optimal
+    """
+
+    if option not in {1, 3}:
+        return None
+
+    start = time.perf_counter()
+    Products, Time = coefficients.shape
+    lb = _planBounds(Products, Time, capacity, option, product_thresholds).reshape(Products, Time)
+
+    # The production is integer, so it is at least the lower bound rounded up (up to the
+    # integrality tolerance of the solvers)
+    production = np.ceil(lb - 1e-6)
+    remaining = np.floor(capacity - production.sum(axis=0) + 1e-6)
+    if np.any(remaining < 0):
+        return None
+
+    years = np.arange(Time)
+    best = coefficients.argmax(axis=0)
+    price = np.maximum(coefficients[best, years], 0)
+    production[best, years] += np.where(price > 0, remaining, 0)
+
+    objective = (coefficients*production).sum() + constant
+    bound = (price*capacity).sum() + ((coefficients - price)*lb).sum() + constant
+    if bound - objective > rtol*max(abs(bound), 1):
+        return None
+
+    return production, objective, {'Method': 'closed form', 'Rows': 0, 'Columns': 0,
+                                   'Nonzeros': 0, 'Solve time': time.perf_counter() - start,
+                                   'Nodes': 0}
+
+
+def solveExpectedNPV(coefficients, constant, profit, market, capacity, option=1,
+                     product_thresholds=None, solver='gurobi', closed_form=True, verbose=True):
+    """
+    Maximises an expected NPV that is given per substrate of each product in each year
+
+    As the production plan is the same in every scenario and the NPV of every scenario is affine
+    in the production plan, the expected NPV is an affine function of the plan as well. This solves
+    the model of `NPV_SAA` with only the production plan as variables.
+
+    Parameters
+    ----------
+    coefficients : np.ndarray
+        Expected NPV per substrate per product (rows) per year (columns)
+    constant : float
+        Expected NPV that does not depend on the production plan
+    profit : np.ndarray
+        Expected sales minus substrate cost per substrate per product per year, which determines
+        which markets are profitable in option 2
+    market : np.ndarray
+        Market of each product
+    capacity : float
+        Maximum number of substrates per year
+    option, product_thresholds, solver, closed_form, verbose
+        See `NPV_SAA`
+
+    Returns
+    -------
+    tuple
+        The optimal production plan (np.ndarray of substrates per product per year), the optimal
+        expected NPV and the statistics of the model (see `NPV_SAA`)
+    """
+
+    checkOption(option, product_thresholds)
+    assert option != 4, "option 4 needs the NPV of every scenario, use NPV_SAA"
+    checkSolver(solver)
+
+    if closed_form:
+        solution = solveClosedForm(coefficients, constant, capacity, option=option,
+                                   product_thresholds=product_thresholds)
+        if solution is not None:
+            solution[2]['Build time'] = 0
+            return solution
+
+    Products, Time = coefficients.shape
+    start = time.perf_counter()
+
+    model = SOLVER_MODELS[solver](_planBounds(Products, Time, capacity, option,
+                                              product_thresholds),
+                                  np.ones(Products*Time, dtype=bool), verbose)
+    model.setConstraints('Yearly Substrate Capacity', _capacityMatrix(Products, Time), '<',
+                         np.full(Time, capacity))
+    if option == 2:
+        model.setConstraints('Market threshold', *_marketMatrix(
+            market, _profitableMarkets(market, profit), capacity, product_thresholds))
+    model.setObjective(coefficients.ravel(), constant)
+    build_time = time.perf_counter() - start
+
+    values, objective, statistics = model.solve()
+    statistics['Build time'] = build_time
+
+    return values.reshape(Products, Time).round(), objective, statistics
+
+
+def solverParity(Data, heights, widths, option=1, product_thresholds=None, probabilities=None,
+                 formulation='expected', rtol=1e-4):
+    """
+    Compares the optimal expected NPV of HiGHS and of the closed form with that of Gurobi
+
+    Both solvers stop at a relative MIP gap of 1e-4 by default, so their optimal values can differ
+    by about that much. Run this e.g. on the baseline data before sweeping with HiGHS. The closed
+    form (see `solveClosedForm`) is only compared in options 1 and 3.
+
+    Parameters
+    ----------
+    Data, option, product_thresholds, probabilities, formulation
+        See `NPV_SAA`
+    heights : array-like
+        Heights of the grid
+    widths : array-like
+        Widths of the grid
+    rtol : float
+        Relative tolerance of the difference in the Average NPV
+
+    Returns
+    -------
+    pd.DataFrame
+        Per substrate size the Average NPV of every method, the largest relative difference with
+        Gurobi and whether this is within the tolerance
+    """
+
+    kwargs = dict(option=option, product_thresholds=product_thresholds,
+                  probabilities=probabilities, formulation=formulation, verbose=False)
+    models = {'Gurobi': SAAModel(Data, solver='gurobi', closed_form=False, **kwargs),
+              'HiGHS': SAAModel(Data, solver='highs', closed_form=False, **kwargs)}
+    if option in {1, 3}:
+        models['Closed form'] = SAAModel(Data, solver='gurobi', closed_form=True, **kwargs)
+
+    results = []
+    for h in heights:
+        for w in widths:
+            result = {'Height': h, 'Width': w}
+            for method, model in models.items():
+                result[method] = model.solve(h, w, report='none')['Average NPV']
+
+            result['Relative difference'] = max(
+                abs(result[method] - result['Gurobi']) for method in models
+            )/max(abs(result['Gurobi']), 1)
+            result['Match'] = result['Relative difference'] <= rtol
+            results.append(result)
+
+    return pd.DataFrame(results)
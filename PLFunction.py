@@ -0,0 +1,145 @@
+import numpy as np
+import pandas as pd
+
+from NPVFunction import PL_ITEMS, checkProbabilities
+
+# Statistics of the line items that `plStatistic` computes by name. Any number between 0 and 1 is
+# computed as that quantile.
+PL_STATISTICS = ['mean', 'std', 'min', 'max']
+
+# Line items whose probability of being negative `exportPL` reports by default
+NEGATIVE_ITEMS = ['OM', 'NI', 'NCF', 'NPV']
+
+
+def _yearIndex(PL, years):
+    """Labels of the years of the line items, with one more year than `years` for 'NPV' etc."""
+    Time = max(np.shape(PL[item])[1] for item in PL_ITEMS)
+    if years is None:
+        return pd.RangeIndex(Time, name='Year')
+
+    years = list(years)[:Time]
+    return pd.Index(years + [years[-1] + 1]*(Time - len(years)), name='Year')
+
+
+def _weightedQuantile(values, probabilities, q):
+    """Returns the q-quantile of every column of `values`, whose rows have the given weights."""
+    order = np.argsort(values, axis=0)
+    cumulative = np.cumsum(probabilities[order], axis=0)
+    index = (cumulative < q*cumulative[-1] - 1e-12).sum(axis=0)
+    return np.take_along_axis(values, order, axis=0)[np.minimum(index, len(values)-1),
+                                                     np.arange(values.shape[1])]
+
+
+def plStatistic(PL, statistic='mean', probabilities=None, years=None):
+    """
+    Computes a statistic over the scenarios of every line item of the P&L in every year
+
+    Parameters
+    ----------
+    PL : dict
+        Line items per scenario per year, see `NPVFunction.evaluatePlan`
+    statistic : str or float
+        One of `PL_STATISTICS`, or a number q between 0 and 1 for the q-quantile, i.e. the smallest
+        value with a probability of at least q of not being exceeded
+    probabilities : array-like
+        Probability of every scenario. By default, all scenarios are equally likely.
+    years : array-like
+        Labels of the years, e.g. the 'InvestmentYears' of the scenarios. By default, the years are
+        numbered from 0.
+
+    Returns
+    -------
+    pd.DataFrame
+        The statistic per line item (rows, in the order of `NPVFunction.PL_ITEMS`) per year
+        (columns). The line items without the extra year of 'NPV', 'NCF' and 'DWC' are NaN in it.
+    """
+
+    assert statistic in PL_STATISTICS or \
+        (not isinstance(statistic, str) and 0 <= statistic <= 1), \
+        f"statistic should be one of {PL_STATISTICS} or a number between 0 and 1"
+
+    Scenarios = len(PL['SALES'])
+    probabilities = checkProbabilities(probabilities, Scenarios)
+    Years = _yearIndex(PL, years)
+
+    table = pd.DataFrame(np.nan, index=pd.Index(PL_ITEMS, name='Item'), columns=Years)
+    for item in PL_ITEMS:
+        values = np.asarray(PL[item], dtype=float)
+
+        if statistic == 'mean':
+            result = probabilities @ values
+        elif statistic == 'std':
+            result = np.sqrt(probabilities @ (values - probabilities @ values)**2)
+        elif statistic == 'min':
+            result = values.min(axis=0)
+        elif statistic == 'max':
+            result = values.max(axis=0)
+        else:
+            result = _weightedQuantile(values, probabilities, statistic)
+
+        table.iloc[PL_ITEMS.index(item), :len(result)] = result
+
+    return table
+
+
+def negativeProbability(PL, items=NEGATIVE_ITEMS, probabilities=None, years=None):
+    """
+    Computes the probability that line items of the P&L are negative in every year
+
+    Parameters
+    ----------
+    items : list
+        Line items, see `NPVFunction.PL_ITEMS`
+    PL, probabilities, years
+        See `plStatistic`
+
+    Returns
+    -------
+    pd.DataFrame
+        The probability per line item (rows) per year (columns)
+    """
+
+    probabilities = checkProbabilities(probabilities, len(PL['SALES']))
+    Years = _yearIndex(PL, years)
+
+    table = pd.DataFrame(np.nan, index=pd.Index(items, name='Item'), columns=Years)
+    for i, item in enumerate(items):
+        result = probabilities @ (np.asarray(PL[item]) < 0)
+        table.iloc[i, :len(result)] = result
+
+    return table
+
+
+def exportPL(PL, path, statistics=('mean', 0.05, 0.5, 0.95), negative_items=NEGATIVE_ITEMS,
+             probabilities=None, years=None):
+    """
+    Writes statistics of the P&L and cash flow statement of a production plan to an Excel file
+
+    Every statistic is written to its own sheet in the layout of the 'Sheet1' of the
+    `PL/ProfitLoss&CashFlow OPTION *.xlsx` files, i.e. a line item per row and a year per column.
+    The probabilities that line items are negative are written to the sheet 'P(negative)'.
+
+    Parameters
+    ----------
+    PL : dict
+        Line items per scenario per year, see `NPVFunction.evaluatePlan`
+    path : str
+        Path to the Excel file
+    statistics : list
+        Statistics to write, see `plStatistic`. A quantile q is written to the sheet 'Q{100q}'.
+    negative_items : list
+        Line items of which the probability of being negative is written. Nothing is written if
+        empty.
+    probabilities, years
+        See `plStatistic`
+    """
+
+    with pd.ExcelWriter(path) as writer:
+        for statistic in statistics:
+            sheet = statistic if isinstance(statistic, str) else f"Q{100*statistic:g}"
+            plStatistic(PL, statistic, probabilities=probabilities,
+                        years=years).to_excel(writer, sheet_name=sheet)
+
+        if negative_items:
+            negativeProbability(PL, negative_items, probabilities=probabilities,
+                                years=years).to_excel(writer, sheet_name='P(negative)')
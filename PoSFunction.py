@@ -0,0 +1,192 @@
+import numpy as np
+
+# Fields of the products per substrate. 'num_width' and 'num_height' are the number of products
+# along the width and height of the substrate, 'num_products' their product and 'vertical' whether
+# the products are placed vertically, i.e. rotated such that their height is along the width.
+POS_FIELDS = ['num_width', 'num_height', 'num_products', 'vertical']
+
+
+def productsPerSubstrate(width, height, h, w):
+    """
+    Computes how many products of the given width and height fit on substrates of size h x w
+
+    A product is placed horizontally unless more products fit if it is placed vertically. All
+    arguments are broadcast as (product axes) x (axes of h) x (axes of w), so for a 1-D grid of
+    heights and widths the result has an axis per product, per height and per width, and for
+    scalar h and w it has the shape of `width`.
+
+    Parameters
+    ----------
+    width : array-like
+        Width of the products
+    height : array-like
+        Height of the products, with the same shape as `width`
+    h : float or array-like
+        Height of the substrates
+    w : float or array-like
+        Width of the substrates
+
+    Returns
+    -------
+    dict
+        Arrays of the products per substrate, see `POS_FIELDS`
+    """
+
+    h = np.asarray(h, dtype=float)
+    w = np.asarray(w, dtype=float)
+    width = np.asarray(width, dtype=float).reshape(np.shape(width) + (1,)*(h.ndim + w.ndim))
+    height = np.asarray(height, dtype=float).reshape(width.shape)
+    h = h.reshape(h.shape + (1,)*w.ndim)
+
+    # Compute how many products fit if the screen is placed horizontally and vertically
+    num_width_hor = np.floor(w/width)
+    num_height_hor = np.floor(h/height)
+    num_width_vert = np.floor(w/height)
+    num_height_vert = np.floor(h/width)
+
+    vertical = num_width_vert*num_height_vert > num_width_hor*num_height_hor
+    num_width = np.where(vertical, num_width_vert, num_width_hor)
+    num_height = np.where(vertical, num_height_vert, num_height_hor)
+
+    return {'num_width': num_width, 'num_height': num_height,
+            'num_products': num_width*num_height, 'vertical': vertical}
+
+
+def productGeometries(Width, Height):
+    """
+    Finds the distinct product geometries of a set of scenarios
+
+    The size of a product only varies with its diagonal, of which there are only a few per product,
+    so there are far fewer distinct geometries than pairs of scenario and product.
+
+    Parameters
+    ----------
+    Width : array-like
+        Width of every product in every scenario (scenarios x products)
+    Height : array-like
+        Height of every product in every scenario (scenarios x products)
+
+    Returns
+    -------
+    dict
+        'Width' and 'Height' of every distinct geometry, and 'Classes', the geometry of every
+        product in every scenario (scenarios x products)
+    """
+
+    Width = np.asarray(Width)
+    Height = np.asarray(Height)
+
+    geometry, classes = np.unique(np.stack([Width.ravel(), Height.ravel()], axis=-1), axis=0,
+                                  return_inverse=True)
+
+    return {'Width': geometry[:, 0], 'Height': geometry[:, 1],
+            'Classes': classes.reshape(Width.shape)}
+
+
+def breakpoints(geometries, low, high):
+    """
+    Finds the sizes of one side of the substrate at which the products per substrate change
+
+    Along either side, the number of products only changes at the multiples of the width and the
+    height of the products, the latter for products that are placed vertically. Between two
+    consecutive breakpoints of the height and two of the width, the products per substrate of all
+    products are therefore constant.
+
+    Parameters
+    ----------
+    geometries : dict
+        Product geometries, see `productGeometries`
+    low : float
+        Smallest size of the side
+    high : float
+        Largest size of the side
+
+    Returns
+    -------
+    np.ndarray
+        Sorted sizes: `low` and every multiple in (low, high]. A multiple is rounded up to the next
+        float if needed, such that the products per substrate have changed at it.
+    """
+
+    sizes = np.unique(np.concatenate([geometries['Width'], geometries['Height']]))
+    sizes = sizes[sizes > 0]
+
+    multiples = []
+    for size in sizes:
+        k = np.arange(np.floor(low/size), np.floor(high/size) + 2)
+        values = k*size
+        values = np.where(np.floor(values/size) < k, np.nextafter(values, np.inf), values)
+        multiples.append(values[(values > low) & (values <= high)])
+
+    return np.unique(np.concatenate([[low]] + multiples))
+
+
+def scenarioPoS(geometries, h, w):
+    """
+    Computes the products per substrate of every product in every scenario for one substrate size
+
+    Parameters
+    ----------
+    geometries : dict
+        Product geometries, see `productGeometries`
+    h : float
+        Height of the substrate
+    w : float
+        Width of the substrate
+
+    Returns
+    -------
+    dict
+        Arrays of the products per substrate (scenarios x products), see `POS_FIELDS`
+    """
+
+    PoS = productsPerSubstrate(geometries['Width'], geometries['Height'], h, w)
+    return {field: PoS[field][geometries['Classes']] for field in POS_FIELDS}
+
+
+def gridPoS(geometries, heights, widths):
+    """
+    Computes the products per substrate of every product geometry for a grid of substrate sizes
+
+    Parameters
+    ----------
+    geometries : dict
+        Product geometries, see `productGeometries`
+    heights : array-like
+        Heights of the grid
+    widths : array-like
+        Widths of the grid
+
+    Returns
+    -------
+    dict
+        The geometries, and arrays of the products per substrate (geometries x heights x widths),
+        see `POS_FIELDS`. `gridCell` selects the products per substrate of one cell.
+    """
+
+    grid = dict(geometries)
+    grid.update(productsPerSubstrate(geometries['Width'], geometries['Height'],
+                                     np.asarray(heights), np.asarray(widths)))
+    return grid
+
+
+def gridCell(grid, i, j):
+    """
+    Selects the products per substrate of every product in every scenario for one cell of a grid
+
+    Parameters
+    ----------
+    grid : dict
+        Products per substrate for a grid of substrate sizes, see `gridPoS`
+    i : int
+        Index of the height in the grid
+    j : int
+        Index of the width in the grid
+
+    Returns
+    -------
+    dict
+        Arrays of the products per substrate (scenarios x products), see `POS_FIELDS`
+    """
+
+    return {field: grid[field][grid['Classes'], i, j] for field in POS_FIELDS}
@@ -0,0 +1,320 @@
+import os
+import pickle
+import socket
+import sqlite3
+import time
+import traceback
+from multiprocessing import Process
+
+from NPVFunction import SAAModel
+from PoSFunction import gridCell, gridPoS
+
+# Statuses of the tasks in a sweep queue. A task is 'pending' until a worker claims it, 'running'
+# until the worker posts its result ('done') or its error. After an error, the task is pending
+# again until it failed `max_attempts` times ('failed').
+TASK_STATUSES = ['pending', 'running', 'done', 'failed']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL,
+    payload BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY,
+    job INTEGER NOT NULL REFERENCES jobs(id),
+    i INTEGER NOT NULL,
+    j INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    started REAL,
+    result BLOB,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, job, i, j);
+"""
+
+
+class SweepQueue:
+    """
+    Durable queue of the cells of grid sweeps in a SQLite file
+
+    A coordinator submits the grids of `MAIN.main` as jobs, of which every cell is a task. Workers
+    (see `runWorker`), in any process on any node that can open the file, claim the tasks, solve
+    them and post their results. Tasks whose worker raised an error are retried, and tasks whose
+    worker did not post a result within `lease` seconds, e.g. because it was killed, are handed
+    out again. Everything is stored in the file, so the coordinator and the workers can be
+    restarted at any time.
+
+    On several nodes, the file should be on a shared file system on which SQLite's file locks
+    work.
+
+    Parameters
+    ----------
+    path : str
+        Path to the SQLite file, which is created if it does not exist
+    max_attempts : int
+        Number of times a task is tried before it is marked as failed
+    lease : float
+        Number of seconds after which a running task is assumed to be lost and is handed out again
+    """
+
+    def __init__(self, path, max_attempts=3, lease=3600):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease = lease
+
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(_SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def submit(self, name, Data, heights, widths, report='summary', **model_kwargs):
+        """
+        Adds a grid sweep as a job with a task per cell, unless a job of that name already exists
+
+        Parameters
+        ----------
+        name : str
+            Unique name of the job, e.g. its output path
+        Data : dict or Mapping
+            Scenarios, see `NPVFunction.NPV_SAA`. They are pickled into the queue, so for many
+            scenarios pass a scenario store, which is pickled as its path and the fingerprint of
+            its contents.
+        heights, widths, report
+            See `SweepFunction.gridSweep`
+        **model_kwargs
+            Arguments of `NPVFunction.SAAModel`
+
+        Returns
+        -------
+        bool
+            Whether the job was added, False if the same job was already submitted
+
+        Raises
+        ------
+        ValueError
+            If a job of that name was submitted with other arguments, as its results would
+            otherwise be returned for these arguments
+        """
+
+        payload = pickle.dumps({'Data': Data, 'heights': list(heights), 'widths': list(widths),
+                                'report': report, 'model_kwargs': model_kwargs})
+
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            existing = self.connection.execute('SELECT payload FROM jobs WHERE name = ?',
+                                               (name,)).fetchone()
+            if existing is not None:
+                if existing[0] != payload:
+                    raise ValueError(f"A job {name!r} with other arguments is already in the "
+                                     f"queue {self.path!r}, use another name or queue")
+                return False
+
+            job = self.connection.execute('INSERT INTO jobs (name, payload) VALUES (?, ?)',
+                                          (name, payload)).lastrowid
+            self.connection.executemany(
+                'INSERT INTO tasks (job, i, j) VALUES (?, ?, ?)',
+                [(job, i, j) for i in range(len(heights)) for j in range(len(widths))])
+
+        return True
+
+    def claim(self, worker):
+        """
+        Claims the next task for a worker
+
+        Tasks are handed out in the order of their job and cell, so a worker that claims several
+        tasks of the same job solves neighbouring cells after one another.
+
+        Returns
+        -------
+        tuple or None
+            The id of the task, the id and name of its job and the cell (i, j), or None if no task
+            is available
+        """
+
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+
+            # Tasks whose lease expired too often are given up, the others are handed out again
+            expired = time.time() - self.lease
+            self.connection.execute(
+                """UPDATE tasks SET status = 'failed', error = 'The lease expired'
+                   WHERE status = 'running' AND started < ? AND attempts >= ?""",
+                (expired, self.max_attempts))
+            task = self.connection.execute(
+                """SELECT tasks.id, jobs.id, jobs.name, i, j FROM tasks
+                   JOIN jobs ON jobs.id = tasks.job
+                   WHERE status = 'pending' OR (status = 'running' AND started < ?)
+                   ORDER BY tasks.job, i, j LIMIT 1""", (expired,)).fetchone()
+            if task is None:
+                return None
+
+            self.connection.execute(
+                """UPDATE tasks SET status = 'running', attempts = attempts + 1, worker = ?,
+                   started = ? WHERE id = ?""", (worker, time.time(), task[0]))
+
+        return task
+
+    def payload(self, job):
+        """Returns the pickled arguments of a job, see `submit`."""
+        row = self.connection.execute('SELECT payload FROM jobs WHERE id = ?', (job,)).fetchone()
+        return pickle.loads(row[0])
+
+    def complete(self, task, worker, result):
+        """
+        Posts the result of a task
+
+        Only a worker that still holds the task can post its result. If its lease expired and the
+        task was handed out again, the result is dropped and False is returned.
+        """
+        return self.connection.execute(
+            """UPDATE tasks SET status = 'done', result = ?, error = NULL
+               WHERE id = ? AND worker = ? AND status = 'running'""",
+            (pickle.dumps(result), task, worker)).rowcount > 0
+
+    def fail(self, task, worker, error):
+        """
+        Posts the error of a task, which is retried unless it failed `max_attempts` times
+
+        As `complete`, only a worker that still holds the task can post its error.
+        """
+        return self.connection.execute(
+            """UPDATE tasks SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END,
+               error = ? WHERE id = ? AND worker = ? AND status = 'running'""",
+            (self.max_attempts, error, task, worker)).rowcount > 0
+
+    def progress(self, name=None):
+        """
+        Counts the tasks per status, of one job or of all jobs
+
+        Returns
+        -------
+        dict
+            Number of tasks per status of `TASK_STATUSES`
+        """
+
+        query = 'SELECT status, COUNT(*) FROM tasks JOIN jobs ON jobs.id = tasks.job'
+        arguments = ()
+        if name is not None:
+            query += ' WHERE jobs.name = ?'
+            arguments = (name,)
+
+        counts = dict(self.connection.execute(query + ' GROUP BY status', arguments).fetchall())
+        return {status: counts.get(status, 0) for status in TASK_STATUSES}
+
+    def done(self, name=None):
+        """Whether all tasks, of one job or of all jobs, are done or failed."""
+        progress = self.progress(name)
+        return progress['pending'] == 0 and progress['running'] == 0
+
+    def results(self, name):
+        """
+        Returns the results of a job whose tasks are all done
+
+        Returns
+        -------
+        dict
+            Results of `NPVFunction.NPV_SAA` per cell (i, j), as `SweepFunction.gridSweep`
+        """
+
+        rows = self.connection.execute(
+            """SELECT i, j, status, result, error FROM tasks JOIN jobs ON jobs.id = tasks.job
+               WHERE jobs.name = ?""", (name,)).fetchall()
+        assert rows, f"There is no job {name!r}"
+
+        failed = [(i, j, error) for i, j, status, _, error in rows if status == 'failed']
+        if failed:
+            raise RuntimeError(f"{len(failed)} tasks of job {name!r} failed, the first cell "
+                               f"{failed[0][:2]} with:\n{failed[0][2]}")
+        assert all(status == 'done' for _, _, status, _, _ in rows), \
+            f"Not all tasks of job {name!r} are done"
+
+        return {(i, j): pickle.loads(result) for i, j, _, result, _ in rows}
+
+
+def runWorker(path, worker=None, poll=1.0, stop_when_empty=True, **queue_kwargs):
+    """
+    Claims and solves tasks of a sweep queue until it is empty
+
+    The model of a job is built once and reused for all of its tasks that this worker claims, so
+    consecutive cells of a job start from the production plan of the previous cell.
+
+    Parameters
+    ----------
+    path : str
+        Path to the SQLite file of the queue
+    worker : str
+        Name of the worker in the queue. By default, the host name and process id.
+    poll : float
+        Number of seconds to wait before trying again if no task is available
+    stop_when_empty : bool
+        Whether to stop once all tasks are done or failed, or to keep waiting for new jobs
+    **queue_kwargs
+        See `SweepQueue`
+
+    Returns
+    -------
+    int
+        Number of tasks this worker solved
+    """
+
+    if worker is None:
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+
+    queue = SweepQueue(path, **queue_kwargs)
+    cached_job, model, PoS, arguments = None, None, None, None
+    solved = 0
+
+    try:
+        while True:
+            task = queue.claim(worker)
+            if task is None:
+                if stop_when_empty and queue.done():
+                    return solved
+                time.sleep(poll)
+                continue
+
+            task_id, job, _, i, j = task
+            try:
+                if job != cached_job:
+                    cached_job, model = None, None
+                    arguments = queue.payload(job)
+                    model = SAAModel(arguments['Data'], **arguments['model_kwargs'])
+                    PoS = gridPoS(model.geometries, arguments['heights'], arguments['widths'])
+                    cached_job = job
+
+                result = model.solve(arguments['heights'][i], arguments['widths'][j],
+                                     PoS=gridCell(PoS, i, j), report=arguments['report'])
+            except Exception:
+                queue.fail(task_id, worker, traceback.format_exc())
+            else:
+                if queue.complete(task_id, worker, result):
+                    solved += 1
+    finally:
+        queue.close()
+
+
+def runWorkers(path, workers, **worker_kwargs):
+    """
+    Runs `workers` worker processes on this machine until the queue is empty
+
+    Parameters
+    ----------
+    path : str
+        Path to the SQLite file of the queue
+    workers : int
+        Number of worker processes
+    **worker_kwargs
+        See `runWorker`
+    """
+
+    processes = [Process(target=runWorker, args=(path,), kwargs=worker_kwargs)
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
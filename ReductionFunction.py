@@ -0,0 +1,266 @@
+import numpy as np
+
+from DataFunction import asScenarioArrays, numScenarios, subsetScenarios
+from NPVFunction import checkProbabilities
+from StreamFunction import scenarioChunks, scenarioCoefficients
+
+REDUCTION_METHODS = ['forward', 'kmedoids']
+REDUCTION_METRICS = ['inputs', 'npv']
+
+# Scenario fields that describe a scenario for the 'inputs' metric
+FEATURE_FIELDS = ['ProductPrice', 'Yield', 'SubstrateCost', 'InvestmentCost', 'Width (m)',
+                  'Height (m)', 'R&D', 'SG&A', 'TaxRate', 'DPO', 'DSO', 'DIO']
+# Feature fields per year, of which only the years of the horizon are used
+YEARLY_FIELDS = ['ProductPrice', 'Yield', 'SubstrateCost', 'InvestmentCost']
+
+
+def scenarioFeatures(Data):
+    """
+    Returns the random inputs of every scenario as a standardised feature vector
+
+    Every feature is divided by its standard deviation over the scenarios, such that prices, yields
+    and costs weigh equally in the distance between two scenarios.
+
+    Parameters
+    ----------
+    Data : dict or Mapping
+        Stacked scenario arrays, see `DataFunction.asScenarioArrays`
+
+    Returns
+    -------
+    np.ndarray
+        Features per scenario (rows)
+    """
+
+    Time = Data['ProductPrice'].shape[2]
+    features = []
+    for field in FEATURE_FIELDS:
+        values = np.asarray(Data[field], dtype=float)
+        if field in YEARLY_FIELDS:
+            values = values[..., :Time]
+        features.append(values.reshape(len(values), -1))
+
+    features = np.concatenate(features, axis=1)
+    scale = features.std(axis=0)
+    scale[scale == 0] = 1
+
+    return (features - features.mean(axis=0))/scale
+
+
+def _npvDistances(coefficients1, constant1, coefficients2, constant2, capacity):
+    """
+    Bounds the difference in NPV between two (broadcast) sets of scenarios over all production plans
+
+    For any production plan with at most `capacity` substrates per year, the NPVs of scenarios i
+    and j differ by at most capacity * sum_t max_p |g_ipt - g_jpt| + |k_i - k_j|, where g are the
+    NPVs per substrate and k the NPVs that do not depend on the plan.
+    """
+
+    return (capacity*np.abs(coefficients1 - coefficients2).max(axis=-2).sum(axis=-1) +
+            np.abs(constant1 - constant2))
+
+
+def scenarioDistances(Data, metric='inputs', h=None, w=None, block_size=None):
+    """
+    Returns the distance between every pair of scenarios
+
+    Parameters
+    ----------
+    Data : dict or Mapping
+        Stacked scenario arrays, see `DataFunction.asScenarioArrays`
+    metric : str
+        'inputs' for the Euclidean distance between the standardised random inputs (see
+        `scenarioFeatures`), or 'npv' for the largest difference in NPV between two scenarios over
+        all production plans for a substrate of size h x w
+    h : float
+        Height of the substrate, only used if metric is 'npv'
+    w : float
+        Width of the substrate, only used if metric is 'npv'
+    block_size : int
+        Number of rows that are computed at once for the 'npv' metric. By default, a block holds
+        roughly 10 million differences.
+
+    Returns
+    -------
+    np.ndarray
+        Symmetric matrix of distances between the scenarios
+    """
+
+    assert metric in REDUCTION_METRICS, f"metric should be one of {REDUCTION_METRICS}"
+
+    if metric == 'inputs':
+        features = scenarioFeatures(Data)
+        squared = (features**2).sum(axis=1)
+        distances = squared[:, np.newaxis] + squared[np.newaxis] - 2*features @ features.T
+        return np.sqrt(np.maximum(distances, 0))
+
+    assert h is not None and w is not None, "h and w should be given when metric is 'npv'"
+
+    coefficients, constant = scenarioCoefficients(Data, h, w)
+    n = len(constant)
+    capacity = Data['MaxCapacity']*12
+
+    if block_size is None:
+        block_size = max(1, 10**7//(n*coefficients[0].size))
+
+    distances = np.empty((n, n))
+    for start in range(0, n, block_size):
+        rows = slice(start, start + block_size)
+        distances[rows] = _npvDistances(coefficients[rows, np.newaxis], constant[rows, np.newaxis],
+                                        coefficients[np.newaxis], constant[np.newaxis], capacity)
+
+    return distances
+
+
+def _forwardSelection(distances, probabilities, K):
+    """Selects K scenarios by fast forward selection."""
+
+    nearest = np.full(len(probabilities), np.inf)
+    selected = []
+
+    for _ in range(K):
+        # Kantorovich distance of the selection if every scenario would be added to it
+        candidates = probabilities @ np.minimum(nearest[:, np.newaxis], distances)
+        candidates[selected] = np.inf
+
+        selected.append(int(np.argmin(candidates)))
+        nearest = np.minimum(nearest, distances[:, selected[-1]])
+
+    return np.array(selected)
+
+
+def _kMedoids(distances, probabilities, selected, max_iterations=100):
+    """Improves the selection of scenarios by alternating between assignment and medoid updates."""
+
+    selected = selected.copy()
+
+    for _ in range(max_iterations):
+        assignment = np.argmin(distances[:, selected], axis=1)
+
+        changed = False
+        for k in range(len(selected)):
+            cluster = np.flatnonzero(assignment == k)
+            if len(cluster) == 0:
+                continue
+
+            costs = probabilities[cluster] @ distances[np.ix_(cluster, cluster)]
+            if costs.min() < (1 - 1e-9)*(probabilities[cluster] @ distances[cluster, selected[k]]):
+                selected[k] = cluster[np.argmin(costs)]
+                changed = True
+
+        if not changed:
+            break
+
+    return selected
+
+
+def reduceScenarioSet(Data, K, method='forward', metric='inputs', h=None, w=None,
+                      probabilities=None):
+    """
+    Reduces a scenario set to K representative scenarios with probabilities
+
+    The representatives are selected to minimise the Kantorovich distance between the reduced and
+    the original scenario set. Fast forward selection adds the scenario that reduces this distance
+    the most, one at a time. k-medoids starts from the forward selection and then alternately
+    assigns every scenario to its nearest representative and replaces every representative by the
+    medoid of its cluster. The probability of a representative is the total probability of the
+    scenarios that are assigned to it.
+
+    The reduced set is solved with `NPVFunction.NPV_SAA(reduction['Data'], h, w,
+    probabilities=reduction['Probabilities'])`. The loss in accuracy of the expected NPV at any
+    substrate size is bounded by `reductionBound`.
+
+    Parameters
+    ----------
+    Data : dict or Mapping
+        Scenarios, in any of the formats of `DataFunction.asScenarioArrays`
+    K : int
+        Number of representative scenarios
+    method : str
+        'forward' for fast forward selection or 'kmedoids'
+    metric : str
+        Distance between scenarios, see `scenarioDistances`
+    h, w : float
+        Size of the substrate for the 'npv' metric, see `scenarioDistances`
+    probabilities : array-like
+        Probability of every scenario in `Data`. By default, all scenarios are equally likely.
+
+    Returns
+    -------
+    dict
+        'Data' the stacked scenario arrays of the representatives, 'Indices' their positions in
+        `Data`, 'Probabilities' their probabilities, 'Assignment' the representative (0, ..., K-1)
+        of every scenario in `Data` and 'Distance' the Kantorovich distance between the reduced and
+        the original scenario set, in the unit of `metric`
+    """
+
+    assert method in REDUCTION_METHODS, f"method should be one of {REDUCTION_METHODS}"
+
+    Data = asScenarioArrays(Data)
+    n = numScenarios(Data)
+    assert 1 <= K <= n, "K should be between 1 and the number of scenarios"
+    probabilities = checkProbabilities(probabilities, n)
+
+    distances = scenarioDistances(Data, metric=metric, h=h, w=w)
+
+    selected = _forwardSelection(distances, probabilities, K)
+    if method == 'kmedoids':
+        selected = _kMedoids(distances, probabilities, selected)
+
+    assignment = np.argmin(distances[:, selected], axis=1)
+
+    return {'Data': subsetScenarios(Data, selected),
+            'Indices': selected,
+            'Probabilities': np.bincount(assignment, weights=probabilities, minlength=K),
+            'Assignment': assignment,
+            'Distance': probabilities @ distances[np.arange(n), selected[assignment]]}
+
+
+def reductionBound(Data, reduction, h, w, probabilities=None, chunk_size=10000):
+    """
+    Bounds the error in the expected NPV of a reduced scenario set for a substrate of size h x w
+
+    For every production plan that satisfies the capacity constraint, the expected NPV over the
+    reduced scenario set differs by at most the returned bound from the expected NPV over `Data`.
+    The optimal Average NPV of the reduced set is therefore within the bound of the optimal
+    Average NPV of `Data`, and the plan that is optimal for the reduced set loses at most twice the
+    bound on `Data`.
+
+    Parameters
+    ----------
+    Data : dict or Mapping
+        The original scenarios, in any of the formats of `DataFunction.asScenarioArrays`
+    reduction : dict
+        Reduced scenario set of `Data`, see `reduceScenarioSet`
+    h : float
+        Height of the substrate
+    w : float
+        Width of the substrate
+    probabilities : array-like
+        Probability of every scenario in `Data`. By default, all scenarios are equally likely.
+    chunk_size : int
+        Number of scenarios of `Data` that are compared at once
+
+    Returns
+    -------
+    float
+        Bound on the error in the expected NPV
+    """
+
+    Data = asScenarioArrays(Data)
+    probabilities = checkProbabilities(probabilities, numScenarios(Data))
+    capacity = Data['MaxCapacity']*12
+
+    representatives, representative_constant = scenarioCoefficients(reduction['Data'], h, w)
+
+    bound = 0
+    for start, chunk in zip(range(0, len(probabilities), chunk_size),
+                            scenarioChunks(Data, chunk_size)):
+        coefficients, constant = scenarioCoefficients(chunk, h, w)
+        assignment = reduction['Assignment'][start:start + len(constant)]
+
+        errors = _npvDistances(coefficients, constant, representatives[assignment],
+                               representative_constant[assignment], capacity)
+        bound += probabilities[start:start + len(constant)] @ errors
+
+    return bound
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+from DataFunction import SAMPLING_DESIGNS, generateScenarios
+from StreamFunction import NPV_stream
+
+
+def samplingVariance(path, n, h, w, option=1, product_thresholds=None, sampling='random',
+                     replications=20, seed=None, **kwargs):
+    """
+    Estimates the variance of the Average NPV of `n` scenarios drawn with a sampling design
+
+    The scenarios of a design depend on each other, so the variance of the Average NPV cannot be
+    estimated from a single scenario set. Instead, the model is solved for `replications`
+    independently drawn scenario sets, and the variance of the Average NPV over these is reported.
+
+    Parameters
+    ----------
+    path : str
+        Path to the data
+    n : int
+        Number of scenarios per scenario set
+    h, w, option, product_thresholds
+        See `NPVFunction.NPV_SAA`
+    sampling : str
+        Sampling design, see `DataFunction.generateScenarios`
+    replications : int
+        Number of independent scenario sets
+    seed : int
+        Root seed, every replication uses a different child of it
+    **kwargs
+        Bandwidths and probabilities, see `DataFunction.generateData`
+
+    Returns
+    -------
+    dict
+        'Averages' is the Average NPV of every replication, 'Mean' and 'Variance' their mean and
+        (unbiased) variance and 'Standard error' the standard deviation of the Average NPV
+    """
+
+    averages = []
+    for child in np.random.SeedSequence(seed).spawn(replications):
+        scenarios = generateScenarios(path, n, seed=child, sampling=sampling, **kwargs)
+        averages.append(NPV_stream(scenarios, h, w, option=option,
+                                   product_thresholds=product_thresholds,
+                                   verbose=False)['Average NPV'])
+
+    averages = np.array(averages)
+
+    return {'Sampling': sampling,
+            'Scenarios': n,
+            'Averages': averages,
+            'Mean': averages.mean(),
+            'Variance': averages.var(ddof=1),
+            'Standard error': averages.std(ddof=1)}
+
+
+def compareSampling(path, n, h, w, option=1, product_thresholds=None, samplings=SAMPLING_DESIGNS,
+                    replications=20, seed=None, **kwargs):
+    """
+    Compares the variance of the Average NPV of `n` scenarios for several sampling designs
+
+    Parameters
+    ----------
+    samplings : list
+        Sampling designs to compare, see `DataFunction.generateScenarios`. The variance reduction
+        is relative to 'random', which is therefore always included.
+    path, n, h, w, option, product_thresholds, replications, seed, **kwargs
+        See `samplingVariance`
+
+    Returns
+    -------
+    pd.DataFrame
+        Per sampling design the 'Mean', 'Variance' and 'Standard error' of the Average NPV, the
+        'Variance reduction' relative to independent sampling and the 'Equivalent scenarios', i.e.
+        the number of independently drawn scenarios that gives the same variance
+    """
+
+    samplings = ['random'] + [sampling for sampling in samplings if sampling != 'random']
+
+    results = {}
+    for sampling in samplings:
+        result = samplingVariance(path, n, h, w, option=option,
+                                  product_thresholds=product_thresholds, sampling=sampling,
+                                  replications=replications, seed=seed, **kwargs)
+        results[sampling] = {key: result[key] for key in ['Mean', 'Variance', 'Standard error']}
+
+    results = pd.DataFrame(results).T
+    results['Variance reduction'] = results.loc['random', 'Variance']/results['Variance']
+    results['Equivalent scenarios'] = n*results['Variance reduction']
+
+    return results
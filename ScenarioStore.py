@@ -0,0 +1,432 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from DataFunction import (SCENARIO_FIELDS, changedBaseFields, generateScenarios, loadBaseData,
+                          updateScenarios)
+
+# Version of the layout of a scenario store on disk
+SCENARIO_STORE_VERSION = 1
+
+
+def _fileName(field):
+    """Returns the name of the file in which a scenario field is stored."""
+    return re.sub(r'[^0-9A-Za-z]+', '_', field).strip('_') + '.npy'
+
+
+def _encodeConstant(value):
+    """Encodes a field that is constant across scenarios for the metadata of a store."""
+    if isinstance(value, np.ndarray) and value.ndim > 0:
+        return {'array': value.tolist(), 'dtype': value.dtype.str}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _decodeConstant(value):
+    """Decodes a field that is constant across scenarios from the metadata of a store."""
+    if isinstance(value, dict):
+        return np.array(value['array'], dtype=value['dtype'])
+    return value
+
+
+def _fingerprint(path, files):
+    """Returns the SHA-256 digest of the contents of the files of the scenario fields."""
+    digest = hashlib.sha256()
+    for field in sorted(files):
+        digest.update(field.encode())
+        with open(os.path.join(path, files[field]), 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+
+    return digest.hexdigest()
+
+
+def _writeMetadata(path, scenarios, num_scenarios, seed=None):
+    """
+    Writes the metadata of a store with the constant fields of `scenarios` to `path`
+
+    The files of the scenario fields should be written already, as the metadata has a
+    fingerprint of their contents.
+    """
+    files = {field: _fileName(field) for field in SCENARIO_FIELDS if field in scenarios}
+    metadata = {
+        'version': SCENARIO_STORE_VERSION,
+        'num_scenarios': int(num_scenarios),
+        'seed': seed,
+        'files': files,
+        'fingerprint': _fingerprint(path, files),
+        'constants': {field: _encodeConstant(value) for field, value in scenarios.items()
+                      if field not in SCENARIO_FIELDS},
+    }
+
+    with open(os.path.join(path, 'metadata.json'), 'w') as file:
+        json.dump(metadata, file, indent=1)
+
+
+def _writeBase(path, base):
+    """Writes the base data from which the scenarios of a store are derived to `path`."""
+    np.savez(os.path.join(path, 'base.npz'), **base)
+
+
+def _readBase(path):
+    """Reads the base data of the store at `path`, which is None for stores without it."""
+    base_path = os.path.join(path, 'base.npz')
+    if not os.path.isfile(base_path):
+        return None
+
+    with np.load(base_path, allow_pickle=False) as base:
+        return {field: base[field][()] if base[field].ndim == 0 else base[field]
+                for field in base.files}
+
+
+def _prepareDirectory(path, overwrite):
+    """Creates an empty temporary directory to write the store at `path` to."""
+    if os.path.exists(path) and not overwrite:
+        raise FileExistsError(f"The scenario store {path} already exists")
+
+    temporary_path = f"{path}.tmp"
+    shutil.rmtree(temporary_path, ignore_errors=True)
+    os.makedirs(temporary_path)
+
+    return temporary_path
+
+
+def _finishDirectory(temporary_path, path):
+    """Moves the fully written store from `temporary_path` to `path`."""
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(temporary_path, path)
+
+
+def saveScenarios(path, scenarios, overwrite=False, data_path=None):
+    """
+    Saves stacked scenario arrays as a scenario store
+
+    A scenario store is a directory with one contiguous .npy file per scenario field, and a
+    metadata.json with the fields that are constant across scenarios. See `openScenarios`. If the
+    store also has the base data from which the scenarios were derived, it can be updated
+    incrementally when the data changes, see `updateScenarioStore`.
+
+    Parameters
+    ----------
+    path : str
+        Path to the directory of the store
+    scenarios : dict
+        Stacked scenario arrays, e.g. as returned by `DataFunction.generateScenarios`
+    overwrite : bool
+        Whether to replace an existing store at `path`
+    data_path : str
+        Path to the data from which `scenarios` were generated, whose base data is saved as well
+
+    Returns
+    -------
+    ScenarioStore
+        The saved store, opened
+    """
+
+    temporary_path = _prepareDirectory(path, overwrite)
+    num_scenarios = len(scenarios['R&D'])
+    if data_path is not None:
+        _writeBase(temporary_path, loadBaseData(data_path))
+
+    for field in SCENARIO_FIELDS:
+        if field in scenarios:
+            np.save(os.path.join(temporary_path, _fileName(field)),
+                    np.ascontiguousarray(scenarios[field]))
+
+    _writeMetadata(temporary_path, scenarios, num_scenarios)
+    _finishDirectory(temporary_path, path)
+
+    return openScenarios(path)
+
+
+def _fillChunk(path, data_path, start, stop, seed, kwargs):
+    """Generates scenarios start, ..., stop-1 and writes them into the store files at `path`."""
+    scenarios = generateScenarios(data_path, np.arange(start, stop), seed=seed, **kwargs)
+
+    for field in SCENARIO_FIELDS:
+        array = np.load(os.path.join(path, _fileName(field)), mmap_mode='r+')
+        array[start:stop] = scenarios[field]
+        array.flush()
+        del array
+
+
+def generateScenarioStore(path, data_path, n, seed, chunk_size=100000, workers=None,
+                          overwrite=False, **kwargs):
+    """
+    Generates `n` scenarios directly into a scenario store
+
+    The scenarios are generated in chunks of `chunk_size` that are written into the memory-mapped
+    files of the store, so the memory use does not grow with `n`. As every scenario has its own
+    random stream (see `DataFunction.generateScenarios`), the store is identical for any chunk size
+    and number of workers.
+
+    Parameters
+    ----------
+    path : str
+        Path to the directory of the store
+    data_path : str
+        Path to the data
+    n : int
+        Number of scenarios
+    seed : int
+        Root seed of the scenario set
+    chunk_size : int
+        Number of scenarios that are generated at once
+    workers : int
+        Number of processes to generate the chunks in. By default, all chunks are generated in
+        this process.
+    overwrite : bool
+        Whether to replace an existing store at `path`
+    **kwargs
+        Bandwidths and probabilities, see `DataFunction.generateData`
+
+    Returns
+    -------
+    ScenarioStore
+        The generated store, opened
+    """
+
+    temporary_path = _prepareDirectory(path, overwrite)
+
+    # The first chunk determines the shapes and types of the fields
+    first = generateScenarios(data_path, np.arange(min(chunk_size, n)), seed=seed, **kwargs)
+
+    for field in SCENARIO_FIELDS:
+        array = np.lib.format.open_memmap(os.path.join(temporary_path, _fileName(field)),
+                                          mode='w+', dtype=first[field].dtype,
+                                          shape=(n,) + first[field].shape[1:])
+        array[:len(first[field])] = first[field]
+        array.flush()
+        del array
+
+    _writeBase(temporary_path, loadBaseData(data_path))
+
+    chunks = [(start, min(start + chunk_size, n)) for start in range(len(first['R&D']), n,
+                                                                     chunk_size)]
+
+    if workers is not None and workers > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [executor.submit(_fillChunk, temporary_path, data_path, start, stop, seed,
+                                       kwargs) for start, stop in chunks]
+            for future in futures:
+                future.result()
+    else:
+        for start, stop in chunks:
+            _fillChunk(temporary_path, data_path, start, stop, seed, kwargs)
+
+    _writeMetadata(temporary_path, first, n, seed=seed)
+    _finishDirectory(temporary_path, path)
+
+    return openScenarios(path)
+
+
+def updateScenarioStore(path, data_path, chunk_size=100000):
+    """
+    Updates a scenario store after the data from which it was generated changed
+
+    The random selections of the scenarios are kept, so every scenario has the same draws before
+    and after the update and results remain paired. Only the derived fields that depend on the
+    changed parts of the data are recomputed (see `DataFunction.DERIVED_FIELDS`), e.g. new Price
+    forecasts only rewrite 'ProductPrice' and new investment costs only 'InvestmentCost' and
+    'Depreciation'. Stores without the base data they were derived from are recomputed entirely.
+
+    The rewritten fields replace the old files at once, so stores that are already open keep
+    seeing the old scenarios until they are opened again.
+
+    Parameters
+    ----------
+    path : str
+        Path to the directory of the store
+    data_path : str
+        Path to the (changed) data
+    chunk_size : int
+        Number of scenarios that are recomputed at once
+
+    Returns
+    -------
+    list
+        The derived fields that were recomputed
+    """
+
+    store = openScenarios(path)
+    base = loadBaseData(data_path)
+    previous = _readBase(path)
+
+    if previous is not None and not changedBaseFields(previous, base):
+        # Stores written before they had a fingerprint get one
+        if store.fingerprint is None:
+            _writeMetadata(path, store, store.num_scenarios, seed=store.seed)
+        return []
+
+    files = {}
+    updated, fields = updateScenarios(store.subset(slice(0, 0)), base, previous)
+
+    for start in range(0, store.num_scenarios, chunk_size):
+        chunk, _ = updateScenarios(store.subset(slice(start, start + chunk_size)), base, previous)
+
+        for field in fields:
+            if field not in files:
+                files[field] = np.lib.format.open_memmap(
+                    os.path.join(path, f"{_fileName(field)}.tmp.npy"), mode='w+',
+                    dtype=chunk[field].dtype,
+                    shape=(store.num_scenarios,) + chunk[field].shape[1:])
+            files[field][start:start + len(chunk[field])] = chunk[field]
+
+    # Release the memory maps of the old and the new files before the files are replaced
+    for array in files.values():
+        array.flush()
+    files.clear()
+    store._arrays.clear()
+
+    for field in fields:
+        os.replace(os.path.join(path, f"{_fileName(field)}.tmp.npy"),
+                   os.path.join(path, _fileName(field)))
+
+    _writeMetadata(path, updated, store.num_scenarios, seed=store.seed)
+    _writeBase(path, base)
+
+    return fields
+
+
+def openScenarios(path):
+    """
+    Opens a scenario store
+
+    Opening a store only reads its metadata. The scenario fields are memory-mapped when they are
+    first accessed, so only the pages that are actually used are read from disk.
+
+    Parameters
+    ----------
+    path : str
+        Path to the directory of the store
+
+    Returns
+    -------
+    ScenarioStore
+    """
+
+    return ScenarioStore(path)
+
+
+class ScenarioStore(Mapping):
+    """
+    Read-only, memory-mapped view on the scenarios of a scenario store
+
+    A store behaves like the stacked scenario arrays of `DataFunction.generateScenarios`: indexing
+    it with a field name returns the array of that field, with the scenario as the first axis. It
+    can therefore be passed to `NPVFunction.NPV_SAA` directly.
+
+    A store pickles as its path and the indices of its view, with the `fingerprint` of the
+    contents of its files, so that e.g. a queued job (see `QueueFunction.SweepQueue.submit`) on a
+    store whose scenarios were rewritten by `updateScenarioStore` is a different job.
+
+    A subset of the scenarios is taken with `subset`, which returns a view on the same files
+    rather than a copy. For a range of scenarios the fields are memory-mapped slices. For arbitrary
+    indices, only the rows of the subset are read, but into a new copy on every access of a field,
+    so views that are used often should be ranges.
+    """
+
+    def __init__(self, path, indices=None):
+        self.path = path
+
+        with open(os.path.join(path, 'metadata.json')) as file:
+            metadata = json.load(file)
+
+        if metadata['version'] != SCENARIO_STORE_VERSION:
+            raise ValueError(f"The scenario store {path} has version {metadata['version']}, "
+                             f"expected version {SCENARIO_STORE_VERSION}")
+
+        self.seed = metadata['seed']
+        self.fingerprint = metadata.get('fingerprint')
+        self._files = metadata['files']
+        self._constants = {field: _decodeConstant(value)
+                           for field, value in metadata['constants'].items()}
+        self._indices = range(metadata['num_scenarios']) if indices is None else indices
+        self._arrays = {}
+
+    def __getstate__(self):
+        # Memory maps are not sent to other processes, they reopen the files instead
+        state = self.__dict__.copy()
+        state['_arrays'] = {}
+        return state
+
+    @property
+    def num_scenarios(self):
+        """Number of scenarios in this view."""
+        return len(self._indices)
+
+    @property
+    def indices(self):
+        """Indices of the scenarios of this view in the store."""
+        return np.asarray(self._indices)
+
+    def _array(self, field):
+        """Returns the memory map of all scenarios of a field."""
+        if field not in self._arrays:
+            self._arrays[field] = np.load(os.path.join(self.path, self._files[field]),
+                                          mmap_mode='r')
+        return self._arrays[field]
+
+    def __getitem__(self, field):
+        if field in self._constants:
+            return self._constants[field]
+
+        array = self._array(field)
+
+        if isinstance(self._indices, range):
+            if len(self._indices) == array.shape[0] and self._indices.step == 1:
+                return array
+
+            stop = self._indices.stop
+            if self._indices.step < 0 and stop < 0:
+                stop = None
+
+            return array[self._indices.start:stop:self._indices.step]
+
+        return array[self._indices]
+
+    def __iter__(self):
+        return iter(list(self._files) + list(self._constants))
+
+    def __len__(self):
+        return len(self._files) + len(self._constants)
+
+    def __repr__(self):
+        return f"ScenarioStore({self.path!r}, {self.num_scenarios} scenarios)"
+
+    def subset(self, indices):
+        """
+        Returns a view on a subset of the scenarios of this view
+
+        Parameters
+        ----------
+        indices : slice, range or array-like
+            Positions of the scenarios in this view. A slice, or a range of a range, gives
+            memory-mapped fields, other indices give fields that are read into a copy on every
+            access.
+
+        Returns
+        -------
+        ScenarioStore
+        """
+
+        if isinstance(indices, slice):
+            indices = self._indices[indices]
+        elif isinstance(indices, range) and isinstance(self._indices, range):
+            indices = self._indices[indices.start:indices.stop:indices.step]
+        else:
+            indices = np.asarray(self._indices)[np.asarray(indices, dtype=np.int64)]
+
+        view = ScenarioStore.__new__(ScenarioStore)
+        view.__dict__.update(self.__dict__)
+        view._indices = indices
+        view._arrays = self._arrays
+
+        return view
@@ -0,0 +1,555 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from DataFunction import SCENARIO_FIELDS, generateScenarios, isScenarioArrays, numScenarios
+from NPVFunction import (REVENUE_WEIGHTS, SUBSTRATE_WEIGHTS, plByYear, plLineItems, plWeights,
+                         solveExpectedNPV)
+from PoSFunction import productsPerSubstrate
+
+# Fields of the sufficient statistics that are summed over the scenarios. The other fields,
+# except for the geometry classes, are the same for all scenarios.
+_SUMMED_STATISTICS = ['n', 'Price', 'Yield', 'Substrate', 'Depreciation', 'NIDepreciation',
+                      'CAPEX', 'R&D', 'SG&A', 'TaxRate', 'CCC', 'NPVConstant']
+
+
+class ScenarioGenerator:
+    """
+    Source of `n` scenarios that are generated chunk by chunk when they are needed
+
+    Every scenario has its own random stream (see `DataFunction.generateScenarios`), so the
+    scenarios are the same for any chunk size, and chunks can be generated by parallel workers.
+
+    Parameters
+    ----------
+    path : str
+        Path to the data
+    n : int
+        Number of scenarios
+    seed : int or np.random.SeedSequence
+        Root seed of the scenario set
+    **kwargs
+        Bandwidths and probabilities, see `DataFunction.generateData`
+    """
+
+    def __init__(self, path, n, seed, **kwargs):
+        self.path = path
+        self.n = n
+        self.seed = seed
+        self.kwargs = kwargs
+
+    def chunks(self, chunk_size):
+        """Yields the chunks as `GeneratedChunk`, which only generate their scenarios on load."""
+        for start in range(0, self.n, chunk_size):
+            yield GeneratedChunk(self, start, min(start + chunk_size, self.n))
+
+
+class GeneratedChunk:
+    """Scenarios start, ..., stop-1 of a `ScenarioGenerator`, generated on `load`."""
+
+    def __init__(self, generator, start, stop):
+        self.generator = generator
+        self.start = start
+        self.stop = stop
+
+    def load(self):
+        return generateScenarios(self.generator.path, np.arange(self.start, self.stop),
+                                 seed=self.generator.seed, **self.generator.kwargs)
+
+
+def scenarioChunks(source, chunk_size=10000):
+    """
+    Splits a source of scenarios into chunks of at most `chunk_size` scenarios
+
+    Parameters
+    ----------
+    source : dict, Mapping, ScenarioGenerator or iterable
+        Stacked scenario arrays (e.g. from `DataFunction.generateScenarios` or a scenario store), a
+        `ScenarioGenerator`, or an iterable that already yields chunks of stacked scenario arrays
+    chunk_size : int
+        Maximum number of scenarios per chunk
+
+    Yields
+    ------
+    dict, Mapping or GeneratedChunk
+        Chunks of scenarios. Chunks of a scenario store are views on the store and chunks of a
+        `ScenarioGenerator` are generated on load, so neither is read before it is reduced.
+    """
+
+    if isinstance(source, ScenarioGenerator):
+        yield from source.chunks(chunk_size)
+    elif hasattr(source, 'subset'):
+        for start in range(0, numScenarios(source), chunk_size):
+            yield source.subset(slice(start, start + chunk_size))
+    elif isScenarioArrays(source):
+        for start in range(0, numScenarios(source), chunk_size):
+            yield {field: value[start:start + chunk_size] if field in SCENARIO_FIELDS else value
+                   for field, value in source.items()}
+    else:
+        yield from source
+
+
+def _loadChunk(chunk):
+    """Returns the stacked scenario arrays of a chunk."""
+    if isinstance(chunk, GeneratedChunk):
+        return chunk.load()
+    return chunk
+
+
+def _numProducts(width, height, h, w):
+    """Number of products of the given width and height that fit on a substrate of h x w."""
+    return productsPerSubstrate(width, height, h, w)['num_products']
+
+
+def _chunkArrays(chunk):
+    """Reads the arrays of a chunk that are needed for the coefficients of the NPV."""
+    ProductPrice = np.asarray(chunk['ProductPrice'])
+    Time = ProductPrice.shape[2]
+
+    arrays = {
+        'Revenue': ProductPrice*np.asarray(chunk['Yield'])[:, :, :Time],
+        'Width': np.asarray(chunk['Width (m)']),
+        'Height': np.asarray(chunk['Height (m)']),
+        'SubstrateCost': np.asarray(chunk['SubstrateCost'])[:, :Time],
+        'Depreciation': np.asarray(chunk['Depreciation'])[:, :Time],
+        'InvestmentCost': np.asarray(chunk['InvestmentCost'])[:, :Time],
+        'R&D': np.asarray(chunk['R&D']),
+        'SG&A': np.asarray(chunk['SG&A']),
+        'TaxRate': np.asarray(chunk['TaxRate']),
+        'CCC': (np.asarray(chunk['DIO'])+np.asarray(chunk['DSO'])-np.asarray(chunk['DPO']))/365,
+    }
+
+    # Per scenario per year, the weights of one unit of sales and of substrate cost in the P&L
+    # and the NPV, as in `NPVFunction.NPV_SAA`
+    weights = plWeights(chunk, Time)
+    arrays['RevenueWeights'] = weights['Revenue']
+    arrays['SubstrateWeights'] = weights['Substrate']
+    arrays['NPVConstant'] = weights['Constant']
+
+    return arrays
+
+
+def reduceChunk(chunk):
+    """
+    Reduces a chunk of scenarios to the sufficient statistics of the expected NPV and P&L
+
+    The NPV of every scenario is affine in the production plan. The coefficients only depend on
+    the substrate size through the number of products per substrate, which only depends on the
+    geometry of the product, and through the substrate area. The statistics are therefore sums over
+    the scenarios per geometry class (a product with a certain width and height), which do not
+    depend on the substrate size.
+
+    Parameters
+    ----------
+    chunk : dict, Mapping or GeneratedChunk
+        Chunk of scenarios, see `scenarioChunks`
+
+    Returns
+    -------
+    dict
+        Sufficient statistics, which can be combined with `combineStatistics`
+    """
+
+    chunk = _loadChunk(chunk)
+    arrays = _chunkArrays(chunk)
+    Scenarios, Products, Time = arrays['Revenue'].shape
+
+    # Geometry classes: the distinct (product, width, height) combinations in this chunk
+    geometry = np.stack([np.broadcast_to(np.arange(Products), (Scenarios, Products)),
+                         arrays['Width'], arrays['Height']], axis=-1).reshape(-1, 3)
+    geometry, classes = np.unique(geometry, axis=0, return_inverse=True)
+    classes = classes.reshape(Scenarios, Products)
+
+    count = np.zeros(len(geometry))
+    revenue = np.zeros((len(geometry), len(REVENUE_WEIGHTS), Time))
+
+    for g, (p, _, _) in enumerate(geometry):
+        scenarios = classes[:, int(p)] == g
+        count[g] = scenarios.sum()
+        revenue[g] = np.einsum('st,skt->kt', arrays['Revenue'][scenarios, int(p)],
+                               arrays['RevenueWeights'][scenarios])
+
+    statistics = {
+        'n': Scenarios,
+        'Geometry': geometry,
+        'Count': count,
+        'Revenue': revenue,
+        'Price': np.asarray(chunk['ProductPrice']).sum(axis=0),
+        'Yield': np.asarray(chunk['Yield'])[:, :, :Time].sum(axis=0),
+        'Substrate': np.einsum('st,skt->kt', arrays['SubstrateCost'],
+                               arrays['SubstrateWeights']),
+        'Depreciation': arrays['Depreciation'].sum(axis=0),
+        'NIDepreciation': ((1-arrays['TaxRate'])[:, np.newaxis] *
+                           arrays['Depreciation']).sum(axis=0),
+        'CAPEX': arrays['InvestmentCost'].sum(axis=0),
+        'R&D': arrays['R&D'].sum(),
+        'SG&A': arrays['SG&A'].sum(),
+        'TaxRate': arrays['TaxRate'].sum(),
+        'CCC': arrays['CCC'].sum(),
+        'NPVConstant': arrays['NPVConstant'].sum(),
+    }
+
+    for field in ['Format', 'Market', 'InvestmentYears', 'MaxCapacity', 'WACC', 'Max_width',
+                  'Max_height']:
+        statistics[field] = chunk[field]
+
+    return statistics
+
+
+def combineStatistics(statistics1, statistics2):
+    """
+    Combines the sufficient statistics of two disjoint sets of scenarios
+
+    Parameters
+    ----------
+    statistics1, statistics2 : dict
+        Sufficient statistics as returned by `reduceChunk` or `combineStatistics`
+
+    Returns
+    -------
+    dict
+        Sufficient statistics of the union of both sets of scenarios
+    """
+
+    combined = dict(statistics1)
+
+    for field in _SUMMED_STATISTICS:
+        combined[field] = statistics1[field] + statistics2[field]
+
+    geometry = np.concatenate([statistics1['Geometry'], statistics2['Geometry']])
+    geometry, classes = np.unique(geometry, axis=0, return_inverse=True)
+    classes = classes.ravel()
+
+    combined['Geometry'] = geometry
+    for field in ['Count', 'Revenue']:
+        values = np.concatenate([statistics1[field], statistics2[field]])
+        combined[field] = np.zeros((len(geometry),) + values.shape[1:])
+        np.add.at(combined[field], classes, values)
+
+    return combined
+
+
+def treeReduce(function, values):
+    """
+    Combines a list of values pairwise, level by level, with a binary function
+
+    The order in which values are combined only depends on the number of values, so the result is
+    the same regardless of how the values were computed.
+    """
+
+    values = list(values)
+    while len(values) > 1:
+        values = [function(values[i], values[i+1]) if i+1 < len(values) else values[i]
+                  for i in range(0, len(values), 2)]
+    return values[0]
+
+
+def _mapChunks(function, source, chunk_size, workers):
+    """Applies `function` to every chunk of `source`, in parallel if `workers` is given."""
+    chunks = scenarioChunks(source, chunk_size)
+
+    if workers is not None and workers > 1:
+        with ProcessPoolExecutor(workers) as executor:
+            return list(executor.map(function, chunks))
+
+    return [function(chunk) for chunk in chunks]
+
+
+def reduceScenarios(source, chunk_size=10000, workers=None):
+    """
+    Reduces a source of scenarios to the sufficient statistics of the expected NPV and P&L
+
+    Every chunk is reduced separately (see `reduceChunk`) and the partial statistics are combined
+    with a tree reduction, so the memory use only depends on the chunk size. The statistics do not
+    depend on the substrate size, so they can be reused for a whole grid of substrate sizes.
+
+    Parameters
+    ----------
+    source : dict, Mapping, ScenarioGenerator or iterable
+        Source of scenarios, see `scenarioChunks`
+    chunk_size : int
+        Maximum number of scenarios per chunk
+    workers : int
+        Number of processes to reduce the chunks in. By default, the chunks are reduced in this
+        process.
+
+    Returns
+    -------
+    dict
+        Sufficient statistics of all scenarios
+    """
+
+    return treeReduce(combineStatistics, _mapChunks(reduceChunk, source, chunk_size, workers))
+
+
+def expectedCoefficients(statistics, h, w):
+    """
+    Computes the expected coefficients of the NPV and P&L for a substrate of size h x w
+
+    Parameters
+    ----------
+    statistics : dict
+        Sufficient statistics, see `reduceScenarios`
+    h : float
+        Height of the substrate
+    w : float
+        Width of the substrate
+
+    Returns
+    -------
+    dict
+        'Revenue': expected weighted revenue per substrate per product per weight (see
+        `REVENUE_WEIGHTS`) per year. 'Substrate': expected weighted substrate cost per substrate
+        per weight (see `SUBSTRATE_WEIGHTS`) per year. 'NPV': expected NPV per substrate per
+        product per year. 'Profit': expected sales minus substrate cost per substrate per product
+        per year. 'Constant': expected NPV that does not depend on the production plan.
+        'NumProducts': expected number of products per substrate per product. 'GlassLoss':
+        expected share of the substrate area that is lost per product.
+    """
+
+    n = statistics['n']
+    Products = len(statistics['Market'])
+    products = statistics['Geometry'][:, 0].astype(int)
+
+    num_products = _numProducts(statistics['Geometry'][:, 1], statistics['Geometry'][:, 2], h, w)
+
+    revenue = np.zeros((Products,) + statistics['Revenue'].shape[1:])
+    np.add.at(revenue, products, num_products[:, np.newaxis, np.newaxis]*statistics['Revenue'])
+    revenue /= n
+
+    expected_num_products = np.zeros(Products)
+    np.add.at(expected_num_products, products, num_products*statistics['Count'])
+    expected_num_products /= n
+
+    # Expected share of the substrate area that is lost per product, as in `NPVFunction.NPV_SAA`.
+    # The area of the products is the same for all scenarios of a geometry class.
+    glass_loss = np.ones(Products)
+    np.subtract.at(glass_loss, products, num_products*statistics['Count'] *
+                   statistics['Geometry'][:, 1]*statistics['Geometry'][:, 2]/(n*w*h))
+
+    substrate = statistics['Substrate']*(w*h)/n
+
+    return {
+        'Revenue': revenue,
+        'Substrate': substrate,
+        'NPV': (revenue[:, REVENUE_WEIGHTS.index('NPV')] -
+                substrate[SUBSTRATE_WEIGHTS.index('NPV')]),
+        'Profit': (revenue[:, REVENUE_WEIGHTS.index('Sales')] -
+                   substrate[SUBSTRATE_WEIGHTS.index('COS')]),
+        'Constant': statistics['NPVConstant']/n,
+        'NumProducts': expected_num_products,
+        'GlassLoss': glass_loss,
+    }
+
+
+def expectedPL(statistics, production, h, w, coefficients=None):
+    """
+    Computes the expected profit and loss statement of a production plan
+
+    Parameters
+    ----------
+    statistics : dict
+        Sufficient statistics, see `reduceScenarios`
+    production : np.ndarray
+        Number of substrates per product (rows) per year (columns)
+    h : float
+        Height of the substrate
+    w : float
+        Width of the substrate
+    coefficients : dict
+        Expected coefficients for this substrate size, see `expectedCoefficients`. Computed if not
+        given.
+
+    Returns
+    -------
+    dict
+        Dictionary with per year a dictionary of the line items, as the 'PL' of `NPV_SAA`
+    """
+
+    if coefficients is None:
+        coefficients = expectedCoefficients(statistics, h, w)
+
+    n = statistics['n']
+    Time = production.shape[1]
+
+    # The expected P&L is computed from the expected arrays with the accounting of the P&L of
+    # every scenario in `NPVFunction.NPV_SAA`
+    items = plLineItems(np.einsum('pkt,pt->kt', coefficients['Revenue'], production),
+                        coefficients['Substrate']*production.sum(axis=0),
+                        coefficients['GlassLoss'], production,
+                        statistics['Substrate'][SUBSTRATE_WEIGHTS.index('COS')]*(w*h)/n,
+                        statistics['Depreciation']/n, statistics['NIDepreciation']/n,
+                        statistics['CAPEX']/n, statistics['R&D']/n, statistics['SG&A']/n,
+                        statistics['TaxRate']/n, statistics['CCC']/n,
+                        1/(1+statistics['WACC'])**np.arange(Time+1))
+
+    return plByYear(items)
+
+
+def scenarioCoefficients(chunk, h, w):
+    """
+    Returns the NPV of every scenario of a chunk as an affine function of the production plan
+
+    Parameters
+    ----------
+    chunk : dict, Mapping or GeneratedChunk
+        Chunk of scenarios, see `scenarioChunks`
+    h : float
+        Height of the substrate
+    w : float
+        Width of the substrate
+
+    Returns
+    -------
+    tuple
+        The NPV per substrate per scenario per product per year (np.ndarray of n x P x T) and the
+        NPV per scenario that does not depend on the production plan (np.ndarray of n)
+    """
+
+    arrays = _chunkArrays(_loadChunk(chunk))
+    num_products = _numProducts(arrays['Width'], arrays['Height'], h, w)
+
+    coefficients = (num_products[:, :, np.newaxis]*arrays['Revenue'] *
+                    arrays['RevenueWeights'][:, np.newaxis, REVENUE_WEIGHTS.index('NPV')] -
+                    (w*h)*(arrays['SubstrateCost'] *
+                           arrays['SubstrateWeights'][:, SUBSTRATE_WEIGHTS.index('NPV')]
+                           )[:, np.newaxis])
+
+    return coefficients, arrays['NPVConstant']
+
+
+def evaluateChunk(chunk, production, h, w, keep_npvs=False):
+    """
+    Summarises the NPVs of a chunk of scenarios for a production plan
+
+    Parameters
+    ----------
+    chunk : dict, Mapping or GeneratedChunk
+        Chunk of scenarios, see `scenarioChunks`
+    production : np.ndarray
+        Number of substrates per product (rows) per year (columns)
+    h : float
+        Height of the substrate
+    w : float
+        Width of the substrate
+    keep_npvs : bool
+        Whether to return the NPV of every scenario as well
+
+    Returns
+    -------
+    dict
+        Number of scenarios 'n', and the 'Sum', 'Max' and 'Min' of the NPVs and the number of
+        negative NPVs 'Negative'. If `keep_npvs`, also the NPVs themselves in 'NPVs'.
+    """
+
+    coefficients, constant = scenarioCoefficients(chunk, h, w)
+    npvs = np.einsum('spt,pt->s', coefficients, production) + constant
+
+    summary = {'n': len(npvs), 'Sum': npvs.sum(), 'Max': npvs.max(), 'Min': npvs.min(),
+               'Negative': int((npvs < 0).sum())}
+    if keep_npvs:
+        summary['NPVs'] = npvs
+
+    return summary
+
+
+def _combineSummaries(summary1, summary2):
+    """Combines the NPV summaries of two disjoint sets of scenarios."""
+    combined = {'n': summary1['n'] + summary2['n'], 'Sum': summary1['Sum'] + summary2['Sum'],
+                'Max': max(summary1['Max'], summary2['Max']),
+                'Min': min(summary1['Min'], summary2['Min']),
+                'Negative': summary1['Negative'] + summary2['Negative']}
+    if 'NPVs' in summary1:
+        combined['NPVs'] = np.concatenate([summary1['NPVs'], summary2['NPVs']])
+
+    return combined
+
+
+def evaluateScenarios(source, production, h, w, chunk_size=10000, workers=None,
+                      keep_npvs=False):
+    """
+    Summarises the NPVs of a source of scenarios for a production plan, chunk by chunk
+
+    Parameters
+    ----------
+    source : dict, Mapping, ScenarioGenerator or iterable
+        Source of scenarios, see `scenarioChunks`
+    production, h, w, keep_npvs
+        See `evaluateChunk`
+    chunk_size, workers
+        See `reduceScenarios`
+
+    Returns
+    -------
+    dict
+        Summary of the NPVs, see `evaluateChunk`
+    """
+
+    evaluate = partial(evaluateChunk, production=production, h=h, w=w, keep_npvs=keep_npvs)
+    return treeReduce(_combineSummaries, _mapChunks(evaluate, source, chunk_size, workers))
+
+
+def NPV_stream(source, h, w, option=1, product_thresholds=None, statistics=None,
+               chunk_size=10000, workers=None, keep_npvs=False, solver='gurobi', verbose=True):
+    """
+    Solves the sample average approximation of `NPVFunction.NPV_SAA` out of core
+
+    The scenarios are reduced chunk by chunk to sufficient statistics (see `reduceScenarios`), the
+    expected NPV is maximised over the production plan only (see
+    `NPVFunction.solveExpectedNPV`), and the NPVs of the scenarios are summarised in a second pass
+    over the chunks. The memory use therefore only depends on the chunk size, not on the number of
+    scenarios.
+
+    Parameters
+    ----------
+    source : dict, Mapping, ScenarioGenerator or iterable
+        Source of scenarios, see `scenarioChunks`. Only used for the second pass if `statistics`
+        is given.
+    h, w, option, product_thresholds, solver, verbose
+        See `NPVFunction.NPV_SAA`
+    statistics : dict
+        Sufficient statistics of `source`, see `reduceScenarios`. As these do not depend on the
+        substrate size, they can be computed once for a whole grid.
+    chunk_size, workers
+        See `reduceScenarios`
+    keep_npvs : bool
+        Whether to return the NPV of every scenario. This takes memory proportional to the number
+        of scenarios.
+
+    Returns
+    -------
+    dict
+        Dictionary of the results with the keys of `NPVFunction.NPV_SAA`, except for 'POS'.
+        'NPVs' is None unless `keep_npvs`.
+    """
+
+    if statistics is None:
+        statistics = reduceScenarios(source, chunk_size=chunk_size, workers=workers)
+
+    coefficients = expectedCoefficients(statistics, h, w)
+    production, average_npv, model_statistics = solveExpectedNPV(
+        coefficients['NPV'], coefficients['Constant'], coefficients['Profit'],
+        statistics['Market'], statistics['MaxCapacity']*12, option=option,
+        product_thresholds=product_thresholds, solver=solver, verbose=verbose)
+
+    summary = evaluateScenarios(source, production, h, w, chunk_size=chunk_size, workers=workers,
+                                keep_npvs=keep_npvs)
+
+    Years = pd.Index(statistics['InvestmentYears'], dtype=object)
+    ProductProduction = pd.DataFrame(production, index=pd.Index(statistics['Format'],
+                                                                name='Format'), columns=Years)
+    TotalProduction = pd.DataFrame([production.sum(axis=0)], index=['Total Production'],
+                                   columns=Years)
+
+    return {'Average NPV': average_npv,
+            'NPVmax': summary['Max'],
+            'NPVmin': summary['Min'],
+            'NPVs': list(summary['NPVs']) if keep_npvs else None,
+            'Width': w,
+            'Height': h,
+            '#NegativeScenarios': summary['Negative'],
+            'PL': expectedPL(statistics, production, h, w, coefficients),
+            'Production': pd.concat([ProductProduction, TotalProduction]),
+            'ModelStatistics': model_statistics}
@@ -0,0 +1,672 @@
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm, qmc
+from tqdm import tqdm
+
+from DataFunction import asScenarioArrays
+from NPVFunction import SAAModel, checkProbabilities, marketThresholds, solveExpectedNPV
+from PoSFunction import breakpoints, gridCell, gridPoS, productsPerSubstrate, scenarioPoS
+from ScenarioStore import saveScenarios
+
+# Number of blocks of neighbouring cells per worker in `gridSweep`. More blocks balance the load
+# better, fewer blocks build fewer models and warm-start more cells.
+BLOCKS_PER_WORKER = 4
+
+# Criteria that `adaptiveSearch` maximises, named as the outputs of `MAIN.main`. 'NPVpos' is the
+# probability that the NPV is not negative.
+SEARCH_CRITERIA = ['Average NPV', 'NPVmax', 'NPVmin', 'NPVpos']
+
+# Candidate length scales (as a share of the searched range) and noise variances (as a share of
+# the variance of the criterion) of the Gaussian process of `surrogateSearch`. The pair with the
+# highest marginal likelihood is used. The noise absorbs the jumps of the criterion at the
+# breakpoints of the products per substrate.
+LENGTH_SCALES = [0.05, 0.1, 0.2, 0.4, 0.8]
+NOISE_VARIANCES = [1e-6, 1e-3, 1e-2, 1e-1]
+
+
+def thresholdSweep(Data, h, w, option, thresholds, probabilities=None, formulation='expected',
+                   solver='gurobi', closed_form=True, verbose=False):
+    """
+    Solves `NPVFunction.NPV_SAA` for a sequence of product thresholds at a fixed substrate size
+
+    The model is built once and only the thresholds are replaced between the solves (see
+    `NPVFunction.SAAModel.setThresholds`), and every solve is started from the production plan of
+    the previous threshold. The thresholds should therefore be sorted, such that neighbouring
+    thresholds have similar plans. This gives the frontier of the expected NPV against the
+    diversification of the production.
+
+    Parameters
+    ----------
+    Data, h, w, probabilities, formulation, solver, closed_form, verbose
+        See `NPVFunction.NPV_SAA`
+    option : int
+        2 to sweep the minimum share of the production per market or 3 per product
+    thresholds : list
+        Product thresholds, see `NPVFunction.NPV_SAA`. In option 2, a number is the threshold of
+        the market with the smallest products, see `NPVFunction.marketThresholds`.
+
+    Returns
+    -------
+    pd.DataFrame
+        Per threshold the 'Average NPV', 'NPVmin', the 'Probability positive' NPV, the number of
+        'Products produced', i.e. the number of distinct products that are produced in any year,
+        the 'Method' and 'Solve time' of the solve, and in option 2 the threshold per market
+    """
+
+    assert option in {2, 3}, "option should be 2 or 3"
+
+    Data = asScenarioArrays(Data)
+    thresholds = [marketThresholds(Data, threshold)
+                  if option == 2 and not isinstance(threshold, dict) else threshold
+                  for threshold in thresholds]
+
+    model = SAAModel(Data, option=option, product_thresholds=thresholds[0],
+                     probabilities=probabilities, formulation=formulation, solver=solver,
+                     closed_form=closed_form, verbose=verbose)
+    probabilities = checkProbabilities(probabilities, model.Scenarios)
+
+    # The products per substrate are the same for all thresholds
+    PoS = scenarioPoS(model.geometries, h, w)
+
+    results = []
+    for threshold in thresholds:
+        model.setThresholds(threshold)
+        result = model.solve(h, w, PoS=PoS, report='summary')
+
+        row = dict(threshold) if option == 2 else {'Threshold': threshold}
+        row.update({'Average NPV': result['Average NPV'],
+                    'NPVmin': result['NPVmin'],
+                    'Probability positive': probabilities @ (np.array(result['NPVs']) > 0),
+                    'Products produced': int((model.production.sum(axis=1) > 0).sum()),
+                    'Method': result['ModelStatistics']['Method'],
+                    'Solve time': result['ModelStatistics']['Solve time']})
+        results.append(row)
+
+    return pd.DataFrame(results)
+
+
+def _solveCells(Data, heights, widths, cells, model_kwargs, report, progress=None):
+    """Solves the cells (i, j) of a grid one after another with one model."""
+
+    model = SAAModel(Data, **model_kwargs)
+    PoS = gridPoS(model.geometries, heights, widths)
+
+    results = []
+    for i, j in cells:
+        results.append(((i, j), model.solve(heights[i], widths[j], PoS=gridCell(PoS, i, j),
+                                            report=report)))
+        if progress is not None:
+            progress.update()
+
+    return results
+
+
+def gridSweep(Data, heights, widths, option=1, product_thresholds=None, probabilities=None,
+              formulation='expected', solver='gurobi', closed_form=True, report='summary',
+              workers=None, threads=None, verbose=False):
+    """
+    Solves `NPVFunction.NPV_SAA` for every cell of a grid of substrate sizes
+
+    The cells are solved row by row with one model (see `NPVFunction.SAAModel`), every cell
+    starting from the production plan of the previous cell. With `workers`, the grid is split
+    into blocks of neighbouring cells that are solved in a process pool, each block with its own
+    model. The scenarios are then shared read-only with the workers as a memory-mapped scenario
+    store: a store is passed as is, and other scenarios are saved to a temporary store first, so
+    the scenarios are not sent to the workers with every block.
+
+    Parameters
+    ----------
+    Data, option, product_thresholds, probabilities, formulation, solver, closed_form, report,
+    verbose
+        See `NPVFunction.NPV_SAA`
+    heights : list
+        Heights of the grid
+    widths : list
+        Widths of the grid
+    workers : int
+        Number of worker processes. By default, the cells are solved in this process.
+    threads : int
+        Number of threads in total, which are split evenly over the workers as the threads of
+        their solvers. By default, all cores with workers, and without workers the solver decides
+        its number of threads.
+
+    Returns
+    -------
+    dict
+        Results of `NPVFunction.NPV_SAA` per cell (i, j), with i the index of the height and j the
+        index of the width
+    """
+
+    cells = [(i, j) for i in range(len(heights)) for j in range(len(widths))]
+    if workers is not None and workers > 1:
+        # Without a budget, the solvers of all workers would each use all cores
+        threads = max(1, (os.cpu_count() if threads is None else threads)//workers)
+
+    model_kwargs = dict(option=option, product_thresholds=product_thresholds,
+                        probabilities=probabilities, formulation=formulation, solver=solver,
+                        closed_form=closed_form, verbose=verbose, threads=threads)
+
+    if workers is None or workers <= 1:
+        with tqdm(total=len(cells)) as progress:
+            return dict(_solveCells(Data, heights, widths, cells, model_kwargs, report,
+                                    progress))
+
+    blocks = np.array_split(np.arange(len(cells)), min(len(cells), BLOCKS_PER_WORKER*workers))
+
+    with tempfile.TemporaryDirectory() as directory:
+        if not hasattr(Data, 'subset'):
+            Data = saveScenarios(os.path.join(directory, 'scenarios'), asScenarioArrays(Data))
+
+        results = {}
+        with ProcessPoolExecutor(workers) as executor, tqdm(total=len(cells)) as progress:
+            futures = [executor.submit(_solveCells, Data, heights, widths,
+                                       [cells[k] for k in block], model_kwargs, report)
+                       for block in blocks]
+            for future in as_completed(futures):
+                block_results = future.result()
+                results.update(block_results)
+                progress.update(len(block_results))
+
+    return results
+
+
+def _criteria(result, probabilities):
+    """Returns the `SEARCH_CRITERIA` of a 'summary' result of `NPVFunction.NPV_SAA`."""
+    return {'Average NPV': result['Average NPV'],
+            'NPVmax': result['NPVmax'],
+            'NPVmin': result['NPVmin'],
+            'NPVpos': 1 - probabilities @ (np.array(result['NPVs']) < 0)}
+
+
+def boxBound(model, min_height, max_height, min_width, max_width, solver='gurobi'):
+    """
+    Bounds the Average NPV of all substrate sizes in a box from above, in options 1 and 3
+
+    In options 1 and 3, the feasible production plans do not depend on the substrate size, and
+    the NPV of every scenario is affine in the plan with coefficients that depend on the size only
+    through the products per substrate, which do not decrease with the height and width, and the
+    area of the substrate. Taking every coefficient at its most favourable corner of the box gives
+    coefficients that are at least those of every size in the box, so the optimal expected NPV
+    with these coefficients bounds the optimal expected NPV of every size in the box.
+
+    Parameters
+    ----------
+    model : NPVFunction.SAAModel
+        Model of option 1 or 3
+    min_height, max_height, min_width, max_width : float
+        Corners of the box
+    solver : str
+        Solver in case the bound cannot be found in closed form, see `NPVFunction.NPV_SAA`
+
+    Returns
+    -------
+    float
+        Upper bound of the Average NPV of every substrate size in the box
+    """
+
+    assert model.option in {1, 3}, "The bound only holds in options 1 and 3"
+
+    Probability = model.Probability
+    low = scenarioPoS(model.geometries, min_height, min_width)['num_products']
+    high = scenarioPoS(model.geometries, max_height, max_width)['num_products']
+
+    revenue = model.PriceYield*model.Weights['Revenue'][:, np.newaxis]
+    revenue = np.where(revenue > 0, high[:, :, np.newaxis]*revenue, low[:, :, np.newaxis]*revenue)
+    cost = model.SubstrateCost*model.Weights['Substrate']
+    cost = np.where(cost > 0, (min_height*min_width)*cost, (max_height*max_width)*cost)
+
+    coefficients = np.einsum('s,spt->pt', Probability, revenue) - Probability @ cost
+    return solveExpectedNPV(coefficients, Probability @ model.Weights['Constant'], None, None,
+                            model.Capacity, option=model.option,
+                            product_thresholds=model.product_thresholds,
+                            solver=solver, verbose=False)[1]
+
+
+def adaptiveSearch(Data, max_height=None, max_width=None, num_height=12, num_width=6,
+                   stepsize_height=0.05, stepsize_width=0.05, target_stepsize=0.01, refinement=5,
+                   keep=3, criterion='Average NPV', option=1, product_thresholds=None,
+                   probabilities=None, formulation='expected', solver='gurobi', closed_form=True,
+                   prune=True, verbose=False):
+    """
+    Searches the best substrate size for a criterion by refining a coarse grid where it matters
+
+    The search starts with the grid of `MAIN.main`. On every level, the `keep` best cells of the
+    previous level are refined: the cells around each of them, up to its neighbours on the
+    previous level, are solved with steps `refinement` times smaller, until the steps are
+    `target_stepsize`. All cells are solved with one model, each starting from the production plan
+    of the previous cell, and no cell is solved twice.
+
+    If the criterion is the 'Average NPV' in option 1 or 3, a cell is only refined if the upper
+    bound of the Average NPV around it (see `boxBound`) is above the best Average NPV found so far,
+    as no cell around it can be better otherwise. With `keep` None, every such cell is refined,
+    which finds the best cell of the grid with steps `target_stepsize` as the dense grid would.
+
+    Parameters
+    ----------
+    Data, option, product_thresholds, probabilities, formulation, solver, closed_form, verbose
+        See `NPVFunction.NPV_SAA`
+    max_height, max_width, num_height, num_width, stepsize_height, stepsize_width
+        The coarse grid, see `MAIN.main`. The search stays within its bounds.
+    target_stepsize : float
+        Step of the finest level
+    refinement : int
+        Factor by which the steps decrease from level to level
+    keep : int
+        Number of cells of every level to refine, or None to refine all that can still be better
+    criterion : str
+        Criterion to maximise, one of `SEARCH_CRITERIA`
+    prune : bool
+        Whether to skip cells that cannot be better if the criterion is the 'Average NPV' in
+        option 1 or 3
+
+    Returns
+    -------
+    dict
+        The 'Height' and 'Width' of the best cell, its value of the criterion ('Best'), the number
+        of 'Solves', and the refinement 'Tree': per solved cell its 'Level', 'Height', 'Width',
+        the 'Parent height' and 'Parent width' of the cell it was refined from (NaN on the coarse
+        grid), the `SEARCH_CRITERIA`, and whether it was 'Refined' or 'Pruned' with the 'Bound'
+        that pruned it. `searchTable` puts a criterion of the tree in the layout of the outputs of
+        `MAIN.main`.
+    """
+
+    assert criterion in SEARCH_CRITERIA, f"criterion should be one of {SEARCH_CRITERIA}"
+    assert refinement > 1, "refinement should be larger than 1"
+
+    Data = asScenarioArrays(Data)
+    if max_height is None:
+        max_height = Data['Max_height']
+    if max_width is None:
+        max_width = Data['Max_width']
+    min_height = max_height - stepsize_height*(num_height-1)
+    min_width = max_width - stepsize_width*(num_width-1)
+
+    model = SAAModel(Data, option=option, product_thresholds=product_thresholds,
+                     probabilities=probabilities, formulation=formulation, solver=solver,
+                     closed_form=closed_form, verbose=verbose)
+    probabilities = checkProbabilities(probabilities, model.Scenarios)
+    prune = prune and criterion == 'Average NPV' and option in {1, 3}
+
+    # Sizes are rounded such that a cell reached from different parents is solved only once
+    def key(h, w):
+        return round(h, 9), round(w, 9)
+
+    tree = {}
+
+    def solveCells(cells, level, parent):
+        for h, w in cells:
+            if key(h, w) in tree:
+                continue
+            row = {'Level': level, 'Height': h, 'Width': w,
+                   'Parent height': np.nan if parent is None else parent[0],
+                   'Parent width': np.nan if parent is None else parent[1]}
+            row.update(_criteria(model.solve(h, w, report='summary'), probabilities))
+            row.update({'Refined': False, 'Pruned': False, 'Bound': np.nan})
+            tree[key(h, w)] = row
+
+    def best():
+        return max(tree.values(), key=lambda row: row[criterion])
+
+    heights = [max_height - stepsize_height*i for i in range(num_height)]
+    widths = [max_width - stepsize_width*j for j in range(num_width)]
+    solveCells([(h, w) for h in heights for w in widths], 0, None)
+
+    level, steps = 0, (stepsize_height, stepsize_width)
+    while max(steps) > target_stepsize + 1e-12:
+        new_steps = [max(step/refinement, target_stepsize) for step in steps]
+        parents = sorted((row for row in tree.values() if row['Level'] == level),
+                         key=lambda row: row[criterion], reverse=True)[:keep]
+
+        for parent in parents:
+            h, w = parent['Height'], parent['Width']
+            box = (max(h - steps[0], min_height), min(h + steps[0], max_height),
+                   max(w - steps[1], min_width), min(w + steps[1], max_width))
+
+            if prune:
+                parent['Bound'] = boxBound(model, *box, solver=solver)
+                if parent['Bound'] <= best()[criterion]:
+                    parent['Pruned'] = True
+                    continue
+
+            # The cells between the parent and its neighbours on the previous level
+            offsets = []
+            for step, new_step in zip(steps, new_steps):
+                count = int(step/new_step + 1e-9)
+                offsets.append(np.arange(1 - count, count)*new_step)
+            cells = [(h + dh, w + dw) for dh in offsets[0] for dw in offsets[1]
+                     if box[0] - 1e-9 <= h + dh <= box[1] + 1e-9 and
+                     box[2] - 1e-9 <= w + dw <= box[3] + 1e-9]
+            solveCells(cells, level + 1, (h, w))
+            parent['Refined'] = True
+
+        level, steps = level + 1, new_steps
+
+    result = best()
+    return {'Height': result['Height'],
+            'Width': result['Width'],
+            'Best': result[criterion],
+            'Solves': len(tree),
+            'Tree': pd.DataFrame(list(tree.values()))}
+
+
+def _relaxationBounds(model, counts, area):
+    """
+    Bounds the objective of many substrate sizes by the LP relaxation of option 1
+
+    Parameters
+    ----------
+    model : NPVFunction.SAAModel
+    counts : np.ndarray
+        Products per substrate of every product geometry (columns) for every size (rows)
+    area : np.ndarray
+        Area of every size
+
+    Returns
+    -------
+    np.ndarray
+        Upper bound of the Average NPV of every option and of the objective of option 4, for
+        every size
+    """
+
+    Probability, geometries = model.Probability, model.geometries
+
+    # Expected NPV per substrate of every product in every year for every size, as the revenue
+    # per product of every geometry times its products per substrate minus the substrate cost
+    revenue = np.zeros((len(geometries['Width']), model.Products, model.Time))
+    np.add.at(revenue, (geometries['Classes'], np.arange(model.Products)),
+              Probability[:, np.newaxis, np.newaxis]*model.PriceYield *
+              model.Weights['Revenue'][:, np.newaxis])
+    cost = Probability @ (model.SubstrateCost*model.Weights['Substrate'])
+    coefficients = (np.einsum('gpt,cg->cpt', revenue, counts) -
+                    area[:, np.newaxis, np.newaxis]*cost)
+
+    return ((np.maximum(coefficients.max(axis=1), 0)*model.Capacity).sum(axis=1) +
+            Probability @ model.Weights['Constant'])
+
+
+def breakpointSearch(Data, max_height=None, max_width=None, num_height=12, num_width=6,
+                     stepsize_height=0.05, stepsize_width=0.05, option=1, product_thresholds=None,
+                     probabilities=None, formulation='expected', solver='gurobi', closed_form=True,
+                     verbose=False):
+    """
+    Finds the best substrate size in a range at continuous resolution
+
+    The substrate size only enters the model through the products per substrate, which are
+    constant between the breakpoints of the height and of the width (see
+    `PoSFunction.breakpoints`), and the substrate cost, which grows with the area. For every
+    production plan, the NPV of every scenario is therefore highest at the lower-left corner of
+    each cell of the lattice of breakpoints, so the best of these corners is the best size in the
+    range. Corners with the same products per substrate as a smaller corner cannot be better and
+    are skipped.
+
+    The remaining corners are solved in the order of an upper bound of their objective: the
+    optimal expected NPV without thresholds (option 1) and without integrality, which bounds the
+    Average NPV of every option and the objective of option 4. The search stops as soon as the
+    bound of the next corner is not above the best objective found, so in option 1 typically only
+    a few corners are solved.
+
+    In option 2, the markets that have to meet their threshold are those that are profitable,
+    which can change inside a cell. The result is then the best corner, which is not necessarily
+    the best size in the range.
+
+    Parameters
+    ----------
+    Data, option, product_thresholds, probabilities, formulation, solver, closed_form, verbose
+        See `NPVFunction.NPV_SAA`
+    max_height, max_width, num_height, num_width, stepsize_height, stepsize_width
+        A grid as in `MAIN.main`, whose range is searched. Only the range is used, not the grid
+        itself.
+
+    Returns
+    -------
+    dict
+        The 'Height' and 'Width' of the best size, its objective ('Best'), i.e. the Average NPV
+        or in option 4 the combination of the Average NPV and the CVaR, its 'Result' (see
+        `NPVFunction.NPV_SAA`, report 'summary'), the number of distinct 'Corners' and of
+        'Solves', and per solved corner ('Evaluated') the 'Height', 'Width', 'Bound',
+        'Objective' and `SEARCH_CRITERIA`
+    """
+
+    Data = asScenarioArrays(Data)
+    if max_height is None:
+        max_height = Data['Max_height']
+    if max_width is None:
+        max_width = Data['Max_width']
+    min_height = max_height - stepsize_height*(num_height-1)
+    min_width = max_width - stepsize_width*(num_width-1)
+
+    model = SAAModel(Data, option=option, product_thresholds=product_thresholds,
+                     probabilities=probabilities, formulation=formulation, solver=solver,
+                     closed_form=closed_form, verbose=verbose)
+    geometries = model.geometries
+
+    # Products per substrate of every geometry at every corner of the lattice
+    heights = breakpoints(geometries, min_height, max_height)
+    widths = breakpoints(geometries, min_width, max_width)
+    counts = productsPerSubstrate(geometries['Width'], geometries['Height'], heights,
+                                  widths)['num_products'].reshape(len(geometries['Width']), -1).T
+    area = np.outer(heights, widths).ravel()
+
+    # Of the corners with the same products per substrate, only the smallest can be the best
+    order = np.argsort(area, kind='stable')
+    _, first = np.unique(counts[order], axis=0, return_index=True)
+    corners = order[first]
+
+    bounds = _relaxationBounds(model, counts[corners], area[corners])
+
+    rows, best = [], None
+    for c in np.argsort(-bounds, kind='stable'):
+        if best is not None and bounds[c] <= rows[best]['Objective'] + \
+                1e-9*max(abs(rows[best]['Objective']), 1):
+            break
+
+        i, j = divmod(corners[c], len(widths))
+        result = model.solve(heights[i], widths[j], report='summary')
+        objective = result['Average NPV']
+        if option == 4:
+            weight = product_thresholds['weight']
+            objective = (1-weight)*objective + weight*result['CVaR']
+
+        row = {'Height': heights[i], 'Width': widths[j], 'Bound': bounds[c],
+               'Objective': objective}
+        row.update(_criteria(result, model.Probability))
+        rows.append(row)
+        if best is None or objective > rows[best]['Objective']:
+            best, best_result = len(rows) - 1, result
+
+    return {'Height': rows[best]['Height'],
+            'Width': rows[best]['Width'],
+            'Best': rows[best]['Objective'],
+            'Result': best_result,
+            'Corners': len(corners),
+            'Solves': len(rows),
+            'Evaluated': pd.DataFrame(rows)}
+
+
+def _matern(A, B, length_scales):
+    """Returns the Matern 5/2 covariances between the rows of A and B."""
+    r = np.sqrt((((A[:, np.newaxis, :] - B[np.newaxis, :, :])/length_scales)**2).sum(axis=2))
+    return (1 + np.sqrt(5)*r + 5/3*r**2)*np.exp(-np.sqrt(5)*r)
+
+
+def _gaussianProcess(X, y, candidates, trend, candidate_trend):
+    """
+    Predicts y at the candidates with a Gaussian process fitted to the points X
+
+    The points are on the unit square. y is the sum of a linear function of the trend and a
+    Gaussian process, whose length scales (per dimension) and noise are chosen from
+    `LENGTH_SCALES` and `NOISE_VARIANCES` by their marginal likelihood.
+
+    Returns
+    -------
+    tuple
+        The mean and standard deviation of y at every candidate
+    """
+
+    design = np.column_stack([np.ones(len(y)), trend])
+    coefficients = np.linalg.lstsq(design, y, rcond=None)[0]
+    residuals = y - design @ coefficients
+    mean = np.column_stack([np.ones(len(candidates)), candidate_trend]) @ coefficients
+
+    scale = residuals.std()
+    if scale == 0:
+        scale = max(abs(y).max(), 1)
+    z = residuals/scale
+
+    best = None
+    for length_scales in ((lh, lw) for lh in LENGTH_SCALES for lw in LENGTH_SCALES):
+        for noise in NOISE_VARIANCES:
+            L = np.linalg.cholesky(_matern(X, X, np.array(length_scales)) +
+                                   noise*np.identity(len(X)))
+            alpha = np.linalg.solve(L.T, np.linalg.solve(L, z))
+            likelihood = -z @ alpha/2 - np.log(np.diag(L)).sum()
+            if best is None or likelihood > best[0]:
+                best = (likelihood, np.array(length_scales), L, alpha)
+
+    _, length_scales, L, alpha = best
+    covariances = _matern(candidates, X, length_scales)
+    v = np.linalg.solve(L, covariances.T)
+    std = np.sqrt(np.maximum(1 - (v**2).sum(axis=0), 0))
+
+    return mean + scale*(covariances @ alpha), scale*std
+
+
+def surrogateSearch(Data, max_height=None, max_width=None, num_height=56, num_width=26,
+                    stepsize_height=0.01, stepsize_width=0.01, budget=15, initial=5,
+                    criterion='Average NPV', option=1, product_thresholds=None, probabilities=None,
+                    formulation='expected', solver='gurobi', closed_form=True, seed=None,
+                    verbose=False):
+    """
+    Searches the best cell of a grid of substrate sizes with a budget of solves
+
+    For grids whose cells take long to solve, e.g. option 2 with many scenarios. A few cells of a
+    Latin hypercube are solved first. Then a surrogate of the criterion over the height and width
+    is fitted to the cells solved so far, and the cell with the highest expected improvement over
+    the best cell is solved next, until `budget` cells are solved or no cell is expected to
+    improve. All cells are solved with one model, each starting from the production plan of the
+    previous cell.
+
+    The criterion jumps where the products per substrate change, which a smooth surrogate cannot
+    follow. The surrogate is therefore a linear function of the bound of the LP relaxation of
+    option 1 of every cell, which has the same jumps and takes no solve, plus a Gaussian process
+    (see `LENGTH_SCALES`) of the remainder.
+
+    Parameters
+    ----------
+    Data, option, product_thresholds, probabilities, formulation, solver, closed_form, verbose
+        See `NPVFunction.NPV_SAA`
+    max_height, max_width, num_height, num_width, stepsize_height, stepsize_width
+        The grid, see `MAIN.main`. By default, the range of the full grid with steps of 0.01.
+    budget : int
+        Maximum number of cells to solve
+    initial : int
+        Number of cells of the Latin hypercube
+    criterion : str
+        Criterion to maximise, one of `SEARCH_CRITERIA`
+    seed : int
+        Seed of the Latin hypercube
+
+    Returns
+    -------
+    dict
+        The 'Height' and 'Width' of the best solved cell, its value of the criterion ('Best'),
+        the number of 'Solves', and per solved cell ('Evaluated') its 'Iteration', 'Height',
+        'Width', `SEARCH_CRITERIA` and the 'Expected improvement' for which it was chosen (NaN for
+        the Latin hypercube). `searchTable` puts a criterion in the layout of the outputs of
+        `MAIN.main`.
+    """
+
+    assert criterion in SEARCH_CRITERIA, f"criterion should be one of {SEARCH_CRITERIA}"
+    assert 0 < initial <= budget, "initial should be positive and at most the budget"
+
+    Data = asScenarioArrays(Data)
+    if max_height is None:
+        max_height = Data['Max_height']
+    if max_width is None:
+        max_width = Data['Max_width']
+    heights = [max_height - stepsize_height*i for i in range(num_height)]
+    widths = [max_width - stepsize_width*j for j in range(num_width)]
+    budget = min(budget, num_height*num_width)
+
+    model = SAAModel(Data, option=option, product_thresholds=product_thresholds,
+                     probabilities=probabilities, formulation=formulation, solver=solver,
+                     closed_form=closed_form, verbose=verbose)
+    probabilities = checkProbabilities(probabilities, model.Scenarios)
+    PoS = gridPoS(model.geometries, heights, widths)
+
+    # Every cell as a point on the unit square, and its bound
+    cells = np.array([(i, j) for i in range(num_height) for j in range(num_width)])
+    points = cells/np.maximum([num_height - 1, num_width - 1], 1)
+    bounds = _relaxationBounds(model, PoS['num_products'].reshape(len(PoS['Width']), -1).T,
+                               np.outer(heights, widths).ravel())
+
+    rows, solved = [], []
+
+    def solveCell(k, improvement):
+        i, j = cells[k]
+        row = {'Iteration': len(rows), 'Height': heights[i], 'Width': widths[j]}
+        row.update(_criteria(model.solve(heights[i], widths[j], PoS=gridCell(PoS, i, j),
+                                         report='summary'), probabilities))
+        row['Expected improvement'] = improvement
+        rows.append(row)
+        solved.append(k)
+
+    design = qmc.LatinHypercube(2, seed=seed).random(initial)
+    for i, j in np.floor(design*[num_height, num_width]).astype(int):
+        k = i*num_width + j
+        if k not in solved:
+            solveCell(k, np.nan)
+
+    while len(solved) < budget:
+        values = np.array([row[criterion] for row in rows])
+        candidates = np.setdiff1d(np.arange(len(cells)), solved)
+        mean, std = _gaussianProcess(points[solved], values, points[candidates], bounds[solved],
+                                     bounds[candidates])
+
+        # Expected improvement over the best cell. The scale of the criterion is used as the
+        # tolerance of no improvement.
+        incumbent = values.max()
+        z = (mean - incumbent)/np.maximum(std, 1e-300)
+        improvement = np.where(std > 0, (mean - incumbent)*norm.cdf(z) + std*norm.pdf(z),
+                               np.maximum(mean - incumbent, 0))
+        if improvement.max() <= 1e-9*max(values.std(), abs(incumbent), 1e-300):
+            break
+
+        k = improvement.argmax()
+        solveCell(candidates[k], improvement[k])
+
+    best = max(rows, key=lambda row: row[criterion])
+    return {'Height': best['Height'],
+            'Width': best['Width'],
+            'Best': best[criterion],
+            'Solves': len(rows),
+            'Evaluated': pd.DataFrame(rows)}
+
+
+def searchTable(tree, column='Average NPV'):
+    """
+    Puts a column of the solved cells of a search in the layout of the outputs of `MAIN.main`
+
+    Parameters
+    ----------
+    tree : pd.DataFrame
+        Solved cells, e.g. the 'Tree' of `adaptiveSearch` or the 'Evaluated' cells of
+        `surrogateSearch`
+    column : str
+        Column to put in the table, e.g. one of `SEARCH_CRITERIA`
+
+    Returns
+    -------
+    pd.DataFrame
+        The column per height (rows, descending) per width (columns, descending), NaN for the
+        cells that were not solved
+    """
+
+    table = tree.assign(Height=tree['Height'].round(9), Width=tree['Width'].round(9)).pivot_table(
+        index='Height', columns='Width', values=column, aggfunc='first')
+    table = table.sort_index(ascending=False).sort_index(axis=1, ascending=False)
+    return table.rename_axis(index=None, columns=None)
@@ -0,0 +1,268 @@
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from DataFunction import SCENARIO_FIELDS, _baseData, generateScenarios
+
+# Resolution (horizontal and vertical pixels) of the formats of the real data
+FORMATS = {'FullHDTV': (1920, 1080), 'HDreadyTV': (1280, 720), 'SDTV': (640, 480),
+           'SVGA': (800, 600), 'SXGA': (1280, 1024), 'UXGA': (1600, 1200), 'VGA': (640, 480),
+           'XGA': (1024, 768), 'WXGA': (1280, 768)}
+
+# Per market, calibrated on the real data: the formats, the range of diagonals (inches), the border
+# and exclusion zone (mm), the price per squared inch of diagonal in the first year, the range of
+# the yearly price decline, and the yield in the first year of production and after the ramp-up
+MARKETS = {
+    'Notebook': {'formats': ['VGA', 'XGA', 'WXGA'], 'sizes': (10, 18), 'border': 9.2,
+                 'exclusion': 6, 'price': 1.2, 'decline': (0.18, 0.22), 'yield': (0.75, 0.95)},
+    'Monitor': {'formats': ['SXGA', 'UXGA', 'WXGA'], 'sizes': (15, 30), 'border': 8.7,
+                'exclusion': 7, 'price': 0.8, 'decline': (0.13, 0.17), 'yield': (0.70, 0.95)},
+    'Television': {'formats': ['SDTV', 'HDreadyTV', 'FullHDTV'], 'sizes': (19, 65),
+                   'border': 9.2, 'exclusion': 8, 'price': 1.2, 'decline': (0.08, 0.13),
+                   'yield': (0.30, 0.80)},
+}
+
+# Share of the products per market in the real data
+MARKET_SHARES = {'Notebook': 2/12, 'Monitor': 3/12, 'Television': 7/12}
+
+
+def _marketCounts(num_products, market_shares):
+    """Divides `num_products` over the markets in proportion to their shares (largest remainder)."""
+    markets = list(market_shares)
+    shares = np.array([market_shares[market] for market in markets], dtype=float)
+    shares = num_products*shares/shares.sum()
+
+    counts = np.floor(shares).astype(int)
+    counts[np.argsort(counts - shares)[:num_products - counts.sum()]] += 1
+
+    return dict(zip(markets, counts))
+
+
+def syntheticSheets(num_products=12, num_years=15, market_shares=MARKET_SHARES, start_year=2003,
+                    ramp_up_years=2, seed=None):
+    """
+    Generates the sheets of a synthetic workbook with the layout of data/DataPBAS.xlsx
+
+    The products of every market get a distinct combination of diagonal and format, and prices,
+    yields and costs follow the patterns of the real data: prices proportional to the squared
+    diagonal that decline geometrically, yields that ramp up after production starts, declining
+    substrate costs and investments in the first three years.
+
+    Parameters
+    ----------
+    num_products : int
+        Number of products
+    num_years : int
+        Number of years of the horizon, at least 3
+    market_shares : dict
+        Share of the products per market, with markets from `MARKETS`
+    start_year : int
+        First year of the horizon
+    ramp_up_years : int
+        Number of years before production starts, in which there are no yields or substrate costs
+    seed : None, int or np.random.Generator
+        Seed of the workbook
+
+    Returns
+    -------
+    dict
+        DataFrame per sheet, as `pd.read_excel` reads them from the written workbook
+    """
+
+    assert num_years >= 3, "num_years should be at least 3"
+    assert set(market_shares) <= set(MARKETS), f"The markets should be in {list(MARKETS)}"
+
+    rng = np.random.default_rng(seed)
+    years = list(range(start_year, start_year + num_years))
+    production_years = np.arange(num_years) >= ramp_up_years
+
+    products = []
+    for market, count in _marketCounts(num_products, market_shares).items():
+        parameters = MARKETS[market]
+        low, high = parameters['sizes']
+
+        # Distinct combinations of diagonal (with one decimal) and format
+        diagonals = np.arange(round(10*low), round(10*high) + 1)/10
+        combinations = len(diagonals)*len(parameters['formats'])
+        assert count <= combinations, f"At most {combinations} products fit in market {market}"
+
+        for combination in np.sort(rng.choice(combinations, count, replace=False)):
+            size = diagonals[combination // len(parameters['formats'])]
+            decline = rng.uniform(*parameters['decline'])
+            price = parameters['price']*size**2*rng.lognormal(0, 0.15)
+
+            products.append({
+                'Size (inches)': size,
+                'Format': parameters['formats'][combination % len(parameters['formats'])],
+                'Market': market,
+                'Border_H (in mm)': parameters['border'],
+                'Border_V (in mm)': parameters['border'],
+                'Exclusion (in mm)': parameters['exclusion'],
+                'Prices': np.maximum(np.round(price*(1 - decline)**np.arange(num_years)), 1),
+            })
+
+    ProductSize = pd.DataFrame(products).drop(columns='Prices')
+    ProductSize['Exclusion (in mm)'] = ProductSize['Exclusion (in mm)'].astype(np.int64)
+
+    ProductFormat = pd.DataFrame([['Horz. Pixels'] + [FORMATS[f][0] for f in FORMATS],
+                                  ['Vert. Pixels'] + [FORMATS[f][1] for f in FORMATS]],
+                                 columns=['Formats'] + list(FORMATS))
+
+    Price = ProductSize[['Size (inches)', 'Format', 'Market']].assign(Unit='USD')
+    Price = pd.concat([Price, pd.DataFrame(np.array([product['Prices'] for product in products],
+                                                    dtype=np.int64).reshape(-1, num_years),
+                                           columns=years)], axis=1)
+
+    # Yields ramp up linearly to their final level in 5 to 10 years after production starts
+    yields = []
+    for market in market_shares:
+        first, final = MARKETS[market]['yield']
+        ramp = np.clip((np.arange(num_years) - ramp_up_years)/rng.integers(5, 11), 0, 1)
+        yields.append(np.where(production_years, np.round(first + (final - first)*ramp, 2),
+                               np.nan))
+    Yield = pd.DataFrame({'Yieldpermarket': list(market_shares), 'Blaco': np.nan,
+                          'Blanco': np.nan})
+    Yield = pd.concat([Yield, pd.DataFrame(yields, columns=years)], axis=1)
+
+    substrate = np.where(production_years, np.round(
+        837*(1 - 0.065)**(np.arange(num_years) - ramp_up_years)), np.nan)
+    CostSubstrate = pd.concat([
+        pd.DataFrame({'Cost Type': ['Costs per substrate'], 'Blanco': np.nan, 'Unit': 'USD/m2'}),
+        pd.DataFrame([substrate], columns=years)], axis=1)
+
+    investment = np.full(num_years, np.nan)
+    investment[:3] = [400, 1250, 1200]
+    CostInvestment = pd.concat([
+        pd.DataFrame({'Cost Type': ['Investment costs'], 'Blanco': np.nan,
+                      'Unit': 'million USD'}),
+        pd.DataFrame([investment], columns=years)], axis=1)
+
+    CostParameters = pd.DataFrame(
+        [['Max capacity', '# substrates/month', 60000.], ['R&D', '%/revenues', 0.05],
+         ['SG&A', '%/revenues', 0.04], ['WACC', '%', 0.1], ['Depreciation years', 'years', 10.],
+         ['Substrate size', 'm', 1.5], ['Substrate size', 'm', 1.8], ['Tax rate', '%', 0.25],
+         ['DPO', 'days', 45.], ['DSO', 'days', 45.], ['DIO', 'days', 30.]],
+        columns=['Cost Type', 'Unit', 'Cost'])
+
+    return {'ProductSize': ProductSize, 'ProductFormat': ProductFormat, 'Price': Price,
+            'CostSubstrate': CostSubstrate, 'CostInvestment': CostInvestment, 'Yield': Yield,
+            'CostParameters': CostParameters}
+
+
+def syntheticBaseData(**kwargs):
+    """
+    Generates the base data of a synthetic workbook in memory
+
+    This is the fast path of `writeSyntheticWorkbook`: the base data is identical to that of the
+    written workbook (see `DataFunction.loadBaseData`) and can be passed instead of the path to the
+    data to `DataFunction.generateScenarios`, `DataFunction.generateData` and
+    `ScenarioStore.generateScenarioStore`.
+
+    Parameters
+    ----------
+    **kwargs
+        See `syntheticSheets`
+
+    Returns
+    -------
+    dict
+        Base data, see `DataFunction.loadBaseData`
+    """
+
+    base = _baseData(syntheticSheets(**kwargs))
+
+    for value in base.values():
+        if isinstance(value, np.ndarray):
+            value.setflags(write=False)
+
+    return base
+
+
+def writeSyntheticWorkbook(path, **kwargs):
+    """
+    Writes a synthetic workbook with the sheets that `DataFunction.generateData` reads
+
+    Parameters
+    ----------
+    path : str
+        Path of the workbook
+    **kwargs
+        See `syntheticSheets`
+    """
+
+    with pd.ExcelWriter(path) as writer:
+        for sheet, table in syntheticSheets(**kwargs).items():
+            table.to_excel(writer, sheet_name=sheet, index=False)
+
+
+def scalingCurves(configurations, h=1.55, w=1.85, model='stream', seed=None, solver='gurobi',
+                  verbose=False):
+    """
+    Measures how the scenario generation and the model scale with the size of the instance
+
+    Parameters
+    ----------
+    configurations : list
+        Tuples (number of products, number of years, number of scenarios)
+    h : float
+        Height of the substrate
+    w : float
+        Width of the substrate
+    model : str
+        'stream' to solve with `StreamFunction.NPV_stream`, 'saa' with `NPVFunction.NPV_SAA`, or
+        None to only generate the scenarios
+    seed : int
+        Seed of the workbooks and the scenarios
+    solver : str
+        Solver of the model, see `NPVFunction.NPV_SAA`
+    verbose : bool
+        Whether to print the output of the solver
+
+    Returns
+    -------
+    pd.DataFrame
+        Per configuration the time (seconds) and peak memory (MB) of generating the scenarios, the
+        size of the scenario arrays (MB), and the time of solving the model, its Average NPV and
+        the 'Method' that solved it, and the size and build time of the model (see
+        `NPVFunction.NPV_SAA`). 'saa' always solves the MIP, 'stream' uses the closed form where
+        possible (see `NPVFunction.solveClosedForm`).
+    """
+
+    assert model in {'stream', 'saa', None}, "model should be 'stream', 'saa' or None"
+
+    results = []
+    for num_products, num_years, num_scenarios in configurations:
+        base = syntheticBaseData(num_products=num_products, num_years=num_years, seed=seed)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        scenarios = generateScenarios(base, num_scenarios, seed=seed)
+        generation_time = time.perf_counter() - start
+        generation_memory = tracemalloc.get_traced_memory()[1]/2**20
+        tracemalloc.stop()
+
+        result = {'Products': num_products, 'Years': num_years, 'Scenarios': num_scenarios,
+                  'Generation time': generation_time, 'Generation memory': generation_memory,
+                  'Scenario size': sum(scenarios[field].nbytes
+                                       for field in SCENARIO_FIELDS)/2**20}
+
+        if model is not None:
+            start = time.perf_counter()
+            if model == 'stream':
+                from StreamFunction import NPV_stream
+                npv = NPV_stream(scenarios, h, w, solver=solver, verbose=verbose)
+            else:
+                from NPVFunction import NPV_SAA
+                # The closed form would skip the model whose scaling is measured
+                npv = NPV_SAA(scenarios, h, w, solver=solver, closed_form=False,
+                              verbose=verbose)
+            result['Solve time'] = time.perf_counter() - start
+            result['Average NPV'] = npv['Average NPV']
+            for statistic in ['Method', 'Rows', 'Columns', 'Nonzeros', 'Build time']:
+                result[statistic] = npv['ModelStatistics'][statistic]
+
+        results.append(result)
+
+    return pd.DataFrame(results)
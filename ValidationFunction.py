@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+from DataFunction import generateScenarios
+from NPVFunction import SAAModel
+from StreamFunction import ScenarioGenerator, evaluateScenarios
+
+
+def outOfSample(path, n, h, w, option=1, product_thresholds=None, evaluation_scenarios=100000,
+                seed=None, formulation='expected', solver='gurobi', chunk_size=10000,
+                workers=None, verbose=False, **kwargs):
+    """
+    Optimises the production plan on `n` scenarios and evaluates it on fresh scenarios
+
+    The Average NPV of the scenarios the plan is optimised on is biased upwards, as the plan is
+    fitted to exactly these scenarios. The NPV of the plan on independent scenarios is an unbiased
+    estimate of its true expected NPV, and the difference between the two is the optimisation bias.
+    The fresh scenarios are generated chunk by chunk and only their NPVs are kept, so the
+    evaluation fits in memory for any number of scenarios.
+
+    Parameters
+    ----------
+    path : str or dict
+        Path to the data, or base data that is already in memory (see `DataFunction.loadBaseData`)
+    n : int
+        Number of scenarios to optimise on
+    h, w, option, product_thresholds, formulation, solver, verbose
+        See `NPVFunction.NPV_SAA`
+    evaluation_scenarios : int
+        Number of fresh scenarios to evaluate the plan on
+    seed : int or np.random.SeedSequence
+        Root seed. The scenarios to optimise on and the fresh scenarios are drawn from different
+        children of it, so they are independent.
+    chunk_size, workers
+        See `StreamFunction.reduceScenarios`
+    **kwargs
+        Bandwidths and probabilities, see `DataFunction.generateData`
+
+    Returns
+    -------
+    dict
+        The optimised 'Production' plan, the 'In-sample NPV' (the Average NPV of the scenarios it
+        is optimised on), the 'Out-of-sample NPV' (the average over the fresh scenarios) and its
+        'Standard error', the 'Bias' (in-sample minus out-of-sample), and the 'NPVs' of the fresh
+        scenarios
+    """
+
+    optimisation_seed, evaluation_seed = np.random.SeedSequence(seed).spawn(2)
+
+    scenarios = generateScenarios(path, n, seed=optimisation_seed, **kwargs)
+    model = SAAModel(scenarios, option=option, product_thresholds=product_thresholds,
+                     formulation=formulation, solver=solver, verbose=verbose)
+    in_sample = model.solve(h, w, report='none')['Average NPV']
+
+    summary = evaluateScenarios(ScenarioGenerator(path, evaluation_scenarios, evaluation_seed,
+                                                  **kwargs),
+                                model.production, h, w, chunk_size=chunk_size, workers=workers,
+                                keep_npvs=True)
+    npvs = summary['NPVs']
+    out_of_sample = npvs.mean()
+
+    return {'Scenarios': n,
+            'Production': model.production,
+            'In-sample NPV': in_sample,
+            'Out-of-sample NPV': out_of_sample,
+            'Standard error': npvs.std(ddof=1)/np.sqrt(len(npvs)),
+            'Bias': in_sample - out_of_sample,
+            'NPVs': npvs}
+
+
+def optimisationBias(path, ns, h, w, option=1, product_thresholds=None,
+                     evaluation_scenarios=100000, replications=10, seed=None, **kwargs):
+    """
+    Estimates the optimisation bias of the Average NPV for several numbers of scenarios
+
+    The bias of a single scenario set is noisy, so it is averaged over `replications` independent
+    scenario sets per number of scenarios (see `outOfSample`).
+
+    Parameters
+    ----------
+    ns : list
+        Numbers of scenarios to optimise on
+    replications : int
+        Number of independent scenario sets per number of scenarios
+    seed : int
+        Root seed, every replication uses a different child of it
+    path, h, w, option, product_thresholds, evaluation_scenarios, **kwargs
+        See `outOfSample`
+
+    Returns
+    -------
+    pd.DataFrame
+        Per number of scenarios the mean 'In-sample NPV', 'Out-of-sample NPV' and 'Bias' over the
+        replications, and the 'Standard error' of the mean bias
+    """
+
+    results = {}
+    for n, children in zip(ns, np.random.SeedSequence(seed).spawn(len(ns))):
+        replicated = []
+        for child in children.spawn(replications):
+            result = outOfSample(path, n, h, w, option=option,
+                                 product_thresholds=product_thresholds,
+                                 evaluation_scenarios=evaluation_scenarios, seed=child, **kwargs)
+            replicated.append({key: result[key] for key in
+                               ['In-sample NPV', 'Out-of-sample NPV', 'Bias']})
+        replicated = pd.DataFrame(replicated)
+
+        results[n] = {'In-sample NPV': replicated['In-sample NPV'].mean(),
+                      'Out-of-sample NPV': replicated['Out-of-sample NPV'].mean(),
+                      'Bias': replicated['Bias'].mean(),
+                      'Standard error': replicated['Bias'].std(ddof=1)/np.sqrt(replications)}
+
+    return pd.DataFrame(results).T.rename_axis('Scenarios')
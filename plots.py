@@ -1,6 +1,4 @@
 import os
-from tqdm import tqdm
-import pickle
 
 import numpy as np
 import pandas as pd
@@ -9,24 +7,21 @@ import seaborn as sns; sns.set_style("whitegrid", rc={'grid.color': '.8'})
 
 from DataFunction import generateData
 from NPVFunction import NPV_SAA
+from ScenarioStore import generateScenarioStore, openScenarios
 
 verbose = False
 
 # Import data
 data_path = "data/DataPBAS.xlsx"
-data1000_path = "data/data1000.pkl"
+data1000_path = "data/scenarios1000"
+seed = 42
 Data_baseline = {0: generateData(data_path, probability={'all': [0, 1, 0]})}
 
-if os.path.isfile(data1000_path):
-    # Then this file already exists and can be imported
-    with open(data1000_path, "rb") as data:
-        Data1000 = pickle.load(data)
+if os.path.isdir(data1000_path):
+    # Then this store already exists and can be opened
+    Data1000 = openScenarios(data1000_path)
 else:
-    num_scenarios = 1000
-    Data1000 = {i: generateData(data_path) for i in tqdm(range(num_scenarios))}
-
-    with open(data1000_path, "wb") as data:
-        pickle.dump(Data1000, data)
+    Data1000 = generateScenarioStore(data1000_path, data_path, 1000, seed=seed)
 
 # Determined optimal width and height from previous analysis
 width = 1.84
@@ -35,7 +30,7 @@ height = 1.08
 # Set option parameters
 option = 2
 min_percentage = 0.01
-means = Data1000[0]['ProductSize'].groupby('Market')['Size (inches)'].agg(np.mean)
+means = Data_baseline[0]['ProductSize'].groupby('Market')['Size (inches)'].agg(np.mean)
 means = means/sum(means)
 means_scaled = means/(min(means)/min_percentage)
 
@@ -130,17 +125,6 @@ plt.show()
 
 # Check whether orientations are concurrent across scenarios. If not, find the percentage of times
 # that it is either orientation.
-orientations = {}
-for prod in range(12):
-    ort = [results_1000['POS'][s][prod]['product_orientation']
-           for s in range(len(results_1000['POS']))]
-    
-    if len(set(ort)) == 1:
-        orientations[prod] = set(ort)
-    else:
-        orientations[prod] = {'vert': sum(o == 'vert' for o in
-                                          [results_1000['POS'][s][prod]['product_orientation']
-                                           for s in range(len(results_1000['POS']))])/1000,
-                              'hor': sum(o == 'hor' for o in
-                                         [results_1000['POS'][s][prod]['product_orientation']
-                                          for s in range(len(results_1000['POS']))])/1000}
+vertical = results_1000['POS']['vertical'].mean(axis=0)
+orientations = pd.DataFrame({'vert': vertical, 'hor': 1-vertical},
+                            index=pd.Index(Data1000['Format'], name='Format'))